@@ -1,7 +1,7 @@
-import pandas as pd
-from dash import Dash, dcc, html, Input, Output, State, callback_context
+import os
+from dash import Dash, dcc, html, dash_table, Input, Output, State, ClientsideFunction, callback_context
 import dash
-import plotly.graph_objects as go
+from dash.exceptions import PreventUpdate
 from datetime import datetime, timedelta
 import calendar
 
@@ -16,9 +16,37 @@ from modules.charts import (
     create_trend_chart,
     create_comparison_chart
 )
-from modules.process_data import load_transactions, filter_by_category, insert_transaction, get_monthly_stats, get_daily_averages, get_percentage_changes
+from modules.process_data import load_transactions, filter_by_category, insert_transaction, get_categories, get_date_range, data_version, cash_flow, get_monthly_stats, get_daily_averages, get_percentage_changes, build_snapshot, snapshot_row
+from modules.metrics import METRICS_ENABLED, timed, timed_callback, callback_latencies, register_endpoint
+from modules.profiling import profile_slow, register_admin
+from modules.http_cache import register_caching
+from modules.categorize import UNCATEGORIZED, suggest
+from modules.budgets import recent_alerts, set_budget, status as budget_status
+from modules.recurring import detect as detect_recurring, upcoming as upcoming_charges
+from modules.accounts import DEFAULT_ACCOUNT, account_names, balances as account_balances, record_transfer
+from modules.corrections import delete_transaction, update_transaction
+from modules.forecast import HORIZON as FORECAST_HORIZON, NET as FORECAST_NET, get_forecast
+from modules.coalesce import single_flight, is_superseded
+from modules.ledger import PAGE_SIZE as LEDGER_PAGE_SIZE, fetch_page
+from modules.lazy import lazy_import
+from modules import fx, memory, rollups, shared_cache, snapshots
+
+# Clientside filtering: ship the data to the browser once and filter there
+# (assets/clientside.js). Meant for single-user deployments whose data fits in memory.
+CLIENTSIDE_FILTERING = os.environ.get('FINANCE_CLIENTSIDE') == '1'
+METRICS_OVERLAY = METRICS_ENABLED and os.environ.get('FINANCE_METRICS_OVERLAY') == '1'
+
+pd = lazy_import('pandas')
+go = lazy_import('plotly.graph_objects')
 
 app = Dash(__name__)
+# WSGI application, for servers started outside modules/serve.py (e.g. gunicorn app:server)
+server = app.server
+register_endpoint(server)
+register_admin(server)
+shared_cache.register_sync(server)
+register_caching(server)
+memory.register_budget(server)
 
 # Add custom CSS for responsive design
 app.index_string = '''
@@ -130,9 +158,6 @@ app.index_string = '''
 </html>
 '''
 
-# Initial data
-df = load_transactions()
-
 # ----- Modern Design System -----
 APP_STYLE = {
     'fontFamily': "'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif",
@@ -190,7 +215,7 @@ INPUT_STYLE = {
     'marginBottom': '12px'
 }
 
-def to_plot_columns(dframe: pd.DataFrame) -> pd.DataFrame:
+def to_plot_columns(dframe):
     """Rename to the TitleCase columns expected by chart functions."""
     return dframe.rename(columns={'date': 'Date', 'amount': 'Amount', 'category': 'Category'})
 
@@ -243,10 +268,28 @@ app.layout = html.Div([
                 html.H4("📅 Time Range", style={'marginBottom': '1rem', 'color': '#374151'}),
                 dcc.DatePickerRange(
                     id='date-range',
-                    start_date=df['date'].min() if not df.empty else datetime.now() - timedelta(days=30),
-                    end_date=df['date'].max() if not df.empty else datetime.now(),
                     display_format='YYYY-MM-DD',
                     style={'width': '100%'}
+                ),
+                html.Div("Display currency", style={'margin': '0.75rem 0 0.25rem 0', 'color': '#6b7280', 'fontSize': '0.85rem'}),
+                dcc.Dropdown(
+                    id='display-currency',
+                    # The rest are read from the rates file once the page loads
+                    options=[{'label': fx.BASE_CURRENCY, 'value': fx.BASE_CURRENCY}],
+                    value=fx.BASE_CURRENCY,
+                    clearable=False,
+                    # Clientside filtering works on the snapshot, which is in the base currency
+                    disabled=CLIENTSIDE_FILTERING,
+                    style={'width': '100%'}
+                ),
+                html.Div("As of", style={'margin': '0.75rem 0 0.25rem 0', 'color': '#6b7280', 'fontSize': '0.85rem'}),
+                # A past version of the store (modules/snapshots.py); empty means now
+                dcc.Dropdown(
+                    id='as-of',
+                    options=[],
+                    placeholder='Now',
+                    disabled=CLIENTSIDE_FILTERING,
+                    style={'width': '100%'}
                 )
             ], style={**CARD_STYLE, 'className': 'card-hover'}),
             
@@ -265,6 +308,15 @@ app.layout = html.Div([
                     value='area',
                     clearable=False,
                     style={'width': '100%'}
+                ),
+                html.Div("Forecast months (trend chart)", style={'margin': '0.75rem 0 0.25rem 0', 'color': '#6b7280', 'fontSize': '0.85rem'}),
+                dcc.Slider(
+                    id='forecast-months',
+                    min=0,
+                    max=FORECAST_HORIZON,
+                    step=1,
+                    value=3,
+                    marks={0: 'Off', 3: '3', 6: '6', FORECAST_HORIZON: str(FORECAST_HORIZON)}
                 )
             ], style={**CARD_STYLE, 'className': 'card-hover'}),
             
@@ -272,9 +324,17 @@ app.layout = html.Div([
                 html.H4("🏷️ Categories", style={'marginBottom': '1rem', 'color': '#374151'}),
                 dcc.Dropdown(
                     id='categories',
-                    options=[{'label': c, 'value': c} for c in df['category'].unique()],
-                    value=list(df['category'].unique()),
+                    options=[],
+                    multi=True,
+                    style={'width': '100%'}
+                ),
+                html.Div("Accounts (all when empty)", style={'margin': '0.75rem 0 0.25rem 0', 'color': '#6b7280', 'fontSize': '0.85rem'}),
+                dcc.Dropdown(
+                    id='accounts',
+                    options=[],
+                    value=[],
                     multi=True,
+                    placeholder='All accounts',
                     style={'width': '100%'}
                 )
             ], style={**CARD_STYLE, 'className': 'card-hover'})
@@ -303,6 +363,71 @@ app.layout = html.Div([
             ], className='stats-panel', style={'width': '32%', 'display': 'inline-block', 'verticalAlign': 'top', 'marginLeft': '3%'})
         ], style={'marginBottom': '2rem'}),
 
+        # Budgets Section: budget vs actual and burn rate for the month of the range's end date
+        html.Div([
+            html.H4("🎯 Budgets", style={'marginBottom': '1rem', 'color': '#374151'}),
+            html.Div(id='budget-panel'),
+            html.Div([
+                dcc.Dropdown(id='budget-category', options=[], placeholder='Category',
+                             style={'minWidth': '200px'}),
+                dcc.Input(id='budget-amount', type='number', min=0, placeholder='Monthly budget (0 removes)',
+                          style={**INPUT_STYLE, 'marginBottom': 0}),
+                html.Button('Set budget', id='budget-save', n_clicks=0, style=BUTTON_STYLE)
+            ], className='responsive-flex', style={'marginTop': '1rem', 'alignItems': 'center'}),
+            html.Div(id='budget-output', style={'marginTop': '0.5rem', 'color': '#64748b'})
+        ], style={**CARD_STYLE, 'className': 'card-hover', 'marginBottom': '2rem'}),
+
+        # Accounts Section: balance of every account at the end of the selected range
+        html.Div([
+            html.H4("🏦 Accounts", style={'marginBottom': '1rem', 'color': '#374151'}),
+            html.Div(id='accounts-panel')
+        ], style={**CARD_STYLE, 'className': 'card-hover', 'marginBottom': '2rem'}),
+
+        # Recurring Section: detected subscriptions, bills and income, and what is due next
+        html.Div([
+            html.H4("🔁 Recurring", style={'marginBottom': '1rem', 'color': '#374151'}),
+            html.Div(id='recurring-panel')
+        ], style={**CARD_STYLE, 'className': 'card-hover', 'marginBottom': '2rem'}),
+
+        # Ledger Section: pages, sorting and column filters are all answered server-side
+        html.Div([
+            html.H4("🔍 Transactions", style={'marginBottom': '1rem', 'color': '#374151'}),
+            dcc.Input(id='search-query', type='search', debounce=True,
+                      placeholder='Search descriptions: coffee, uber*, "whole foods"', style=INPUT_STYLE),
+            html.Div(id='ledger-summary', style={'margin': '0.5rem 0', 'color': '#64748b'}),
+            dash_table.DataTable(
+                id='ledger',
+                columns=[
+                    {'name': 'Date', 'id': 'date'},
+                    {'name': 'Category', 'id': 'category'},
+                    {'name': 'Account', 'id': 'account', 'editable': False},
+                    {'name': 'Description', 'id': 'description'},
+                    {'name': 'Amount', 'id': 'amount', 'type': 'numeric', 'format': dash_table.FormatTemplate.money(2)}
+                ],
+                data=[],
+                # Edited cells and deleted rows are stored as corrections (see edit_ledger)
+                editable=True,
+                row_deletable=True,
+                page_action='custom',
+                page_current=0,
+                page_size=LEDGER_PAGE_SIZE,
+                page_count=1,
+                sort_action='custom',
+                sort_mode='single',
+                sort_by=[],
+                filter_action='custom',
+                filter_query='',
+                virtualization=True,
+                fixed_rows={'headers': True},
+                style_table={'height': '480px', 'overflowY': 'auto'},
+                style_cell={'padding': '8px 12px', 'textAlign': 'left', 'fontFamily': 'Inter, sans-serif',
+                            'minWidth': '100px', 'maxWidth': '360px', 'overflow': 'hidden', 'textOverflow': 'ellipsis'},
+                style_cell_conditional=[{'if': {'column_id': 'amount'}, 'textAlign': 'right'}],
+                style_header={'fontWeight': '600', 'backgroundColor': '#f8fafc'}
+            ),
+            dcc.Store(id='ledger-state')
+        ], style={**CARD_STYLE, 'className': 'card-hover', 'marginBottom': '2rem'}),
+
         # Add Transaction Section
         html.Div([
             html.Div([
@@ -322,7 +447,7 @@ app.layout = html.Div([
                         html.Label("🏷️ Category", style={'fontWeight': '600', 'marginBottom': '0.5rem', 'display': 'block'}),
                         dcc.Dropdown(
                             id='input-category',
-                            options=[{'label': c, 'value': c} for c in df['category'].unique()],
+                            options=[],
                             placeholder='Select Category',
                             style={'width': '100%'}
                         )
@@ -335,50 +460,150 @@ app.layout = html.Div([
                     
                     html.Div([
                         html.Label("📝 Description", style={'fontWeight': '600', 'marginBottom': '0.5rem', 'display': 'block'}),
-                        dcc.Input(id='input-desc', type='text', placeholder='Optional', style=INPUT_STYLE)
+                        dcc.Input(id='input-desc', type='text', placeholder='Optional', debounce=True, style=INPUT_STYLE)
                     ], style={'width': '25%'})
                 ], className='responsive-flex', style={'marginBottom': '1.5rem'}),
+
+                html.Div([
+                    html.Div([
+                        html.Label("🏦 Account", style={'fontWeight': '600', 'marginBottom': '0.5rem', 'display': 'block'}),
+                        dcc.Dropdown(
+                            id='input-account',
+                            options=[],
+                            placeholder='Main',
+                            style={'width': '100%'}
+                        )
+                    ], style={'width': '50%', 'marginRight': '1rem'}),
+
+                    html.Div([
+                        html.Label("🔀 Transfer to", style={'fontWeight': '600', 'marginBottom': '0.5rem', 'display': 'block'}),
+                        dcc.Dropdown(
+                            id='input-transfer-to',
+                            options=[],
+                            placeholder='Not a transfer',
+                            style={'width': '100%'}
+                        )
+                    ], style={'width': '50%'})
+                ], className='responsive-flex', style={'marginBottom': '1.5rem'}),
                 
                 html.Button('➕ Add Transaction', id='add-btn', n_clicks=0, style={**BUTTON_STYLE, 'width': '100%', 'fontSize': '16px', 'padding': '14px'})
             ], style={**CARD_STYLE, 'maxWidth': '800px', 'margin': '0 auto'})
         ]),
 
         # Hidden div for form output
-        html.Div(id='form-output', style={'textAlign': 'center', 'marginTop': '1rem', 'fontWeight': '600'})
+        html.Div(id='form-output', style={'textAlign': 'center', 'marginTop': '1rem', 'fontWeight': '600'}),
+
+        # Debounced filter state consumed by the server-side callbacks
+        dcc.Store(id='settled-filters'),
+
+        # Columnar snapshot and rows inserted since it was sent (clientside filtering mode)
+        dcc.Store(id='txn-snapshot'),
+        dcc.Store(id='txn-appended', data=[])
     ], style={'maxWidth': '1200px', 'margin': '0 auto', 'padding': '0 2rem 2rem 2rem'})
 ], style=APP_STYLE)
 
 
 # ----- Advanced Callbacks -----
 
+def filter_callback(*args, **kwargs):
+    """Register a filter-driven callback on the server unless the browser handles it"""
+    if CLIENTSIDE_FILTERING:
+        return lambda func: func
+    return app.callback(*args, **kwargs)
+
+@timed('finance_data_seconds', count_rows=True)
+def _filter_transactions(start_date, end_date, selected_categories, selected_accounts=(), currency=None, as_of=None):
+    if memory.rollup_only():
+        return _filter_rollup(start_date, end_date, selected_categories, currency, as_of)
+    data = load_transactions() if as_of is None else snapshots.load_version(as_of)
+    
+    # Filter by date range (compared as dates: the picker sends ISO strings,
+    # while CSV rows may use other formats such as 2025/05/01)
+    if start_date and end_date:
+        dates = pd.to_datetime(data['date'], format='mixed')
+        data = data[(dates >= pd.to_datetime(start_date[:10])) & (dates <= pd.to_datetime(end_date[:10]))]
+    
+    # Filter by categories
+    if selected_categories:
+        data = filter_by_category(data, list(selected_categories))
+    if selected_accounts:
+        data = data[data['account'].isin(list(selected_accounts))]
+    # Amounts in the display currency, each at its own day's rate
+    return fx.convert_frame(data, currency)
+
+def _filter_rollup(start_date, end_date, selected_categories, currency=None, as_of=None):
+    """_filter_transactions in rollup-only mode: monthly totals, by whole months, for every account"""
+    if as_of is not None:
+        raise ValueError("past versions need every row, which the memory budget does not allow")
+    data = rollups.as_rows(currency)
+    if start_date and end_date:
+        months = data['date'].str[:7]
+        data = data[(months >= start_date[:7]) & (months <= end_date[:7])]
+    if selected_categories:
+        data = filter_by_category(data, list(selected_categories))
+    return data
+
+def load_filtered(filters):
+    """Filtered transactions for a settled filter state, computed once for concurrent callbacks"""
+    if not filters or is_superseded(filters.get('client'), filters.get('seq')):
+        raise PreventUpdate
+    
+    start_date, end_date = filters.get('start_date'), filters.get('end_date')
+    categories = tuple(filters.get('categories') or ())
+    accounts = tuple(filters.get('accounts') or ())
+    currency = filters.get('currency')
+    as_of = filters.get('as_of')
+    try:
+        # One computation per filter state across concurrent callbacks, and across workers
+        key = ('filtered', start_date, end_date, categories, accounts, currency, as_of)
+        data = single_flight(key, shared_cache.cached, key,
+                             _filter_transactions, start_date, end_date, categories, accounts, currency, as_of)
+    except ValueError as e:
+        # The version was garbage-collected since the options were listed
+        print(f"Error loading version {as_of}: {e}")
+        raise PreventUpdate
+    
+    # A newer filter state may have arrived while this one was loading
+    if is_superseded(filters.get('client'), filters.get('seq')):
+        raise PreventUpdate
+    # Callers add helper columns, so each gets its own copy of the shared result
+    return data.copy()
+
+# Debounce the filter inputs in the browser: only a settled state
+# (no change for a short while) reaches the server callbacks below
+if not CLIENTSIDE_FILTERING:
+    app.clientside_callback(
+        ClientsideFunction(namespace='finance', function_name='settle_filters'),
+        Output('settled-filters', 'data'),
+        [Input('date-range', 'start_date'),
+         Input('date-range', 'end_date'),
+         Input('categories', 'value'),
+         Input('accounts', 'value'),
+         Input('display-currency', 'value'),
+         Input('as-of', 'value')]
+    )
+
 # Update key metrics
-@app.callback(
+@filter_callback(
     [Output('total-income', 'children'),
      Output('total-expenses', 'children'),
      Output('net-balance', 'children'),
      Output('daily-average', 'children')],
-    [Input('date-range', 'start_date'),
-     Input('date-range', 'end_date'),
-     Input('categories', 'value')]
+    Input('settled-filters', 'data')
 )
-def update_metrics(start_date, end_date, selected_categories):
-    data = load_transactions()
-    
-    # Filter by date range
-    if start_date and end_date:
-        data = data[(data['date'] >= start_date) & (data['date'] <= end_date)]
-    
-    # Filter by categories
-    if selected_categories:
-        data = filter_by_category(data, selected_categories)
+@timed_callback
+@profile_slow
+def update_metrics(filters):
+    data = load_filtered(filters)
+    start_date, end_date = filters.get('start_date'), filters.get('end_date')
+    currency = filters.get('currency')
     
     if data.empty:
-        return "$0", "$0", "$0", "$0"
+        return (fx.format_money(0, currency, 0),) * 4
     
-    # Calculate metrics
-    income = data[data['category'] == 'Income']['amount'].sum() if 'Income' in data['category'].values else 0
-    expenses = data[data['category'] != 'Income']['amount'].sum()
-    net_balance = income - expenses
+    # Calculate metrics in one pass; transfers between accounts count as neither side
+    flows = cash_flow(data)
+    income, expenses, net_balance = flows['income'], flows['expenses'], flows['net']
     
     # Calculate daily average
     if start_date and end_date:
@@ -389,99 +614,99 @@ def update_metrics(start_date, end_date, selected_categories):
     else:
         daily_avg = 0
     
-    return f"${income:,.2f}", f"${expenses:,.2f}", f"${net_balance:,.2f}", f"${daily_avg:,.2f}"
+    return tuple(fx.format_money(value, currency) for value in (income, expenses, net_balance, daily_avg))
+
+def _chart_forecast(filters, months):
+    """Forecast rows for the trend chart, or None when off, viewing a past version or the range ends well before the data does"""
+    if not months or filters.get('as_of') is not None:
+        return None
+    # The first run waits briefly; later data changes show the previous forecast until the new one is ready
+    forecast = get_forecast(months, wait=2)
+    if forecast is None or forecast.empty:
+        return None
+    end_date = filters.get('end_date')
+    if end_date and pd.to_datetime(end_date) < forecast['month'].min() - pd.DateOffset(months=1):
+        return None
+    return _forecast_in(forecast, filters.get('currency'))
+
+def _forecast_in(forecast, currency):
+    """Forecast amounts (computed in the base currency) in the display currency, at today's rate"""
+    factor = fx.rate(currency)
+    if factor == 1:
+        return forecast
+    columns = ['forecast', 'lower', 'upper']
+    return forecast.assign(**{c: forecast[c] * factor for c in columns})
 
 # Update main chart
-@app.callback(
+@filter_callback(
     Output('main-chart', 'figure'),
-    [Input('date-range', 'start_date'),
-     Input('date-range', 'end_date'),
+    [Input('settled-filters', 'data'),
      Input('chart-type', 'value'),
-     Input('categories', 'value')]
+     Input('forecast-months', 'value')]
 )
-def update_main_chart(start_date, end_date, chart_type, selected_categories):
-    data = load_transactions()
-    
-    # Filter by date range
-    if start_date and end_date:
-        data = data[(data['date'] >= start_date) & (data['date'] <= end_date)]
-    
-    # Filter by categories
-    if selected_categories:
-        data = filter_by_category(data, selected_categories)
+@timed_callback
+@profile_slow
+def update_main_chart(filters, chart_type, forecast_months):
+    data = load_filtered(filters)
     
     if data.empty:
         return go.Figure().add_annotation(text="No data available", xref="paper", yref="paper", x=0.5, y=0.5, showarrow=False)
     
     plot_data = to_plot_columns(data)
+    currency = filters.get('currency')
     
     if chart_type == 'area':
         return create_advanced_area_chart(plot_data)
     elif chart_type == 'bar':
-        return create_bar_chart(plot_data)
+        return create_bar_chart(plot_data, currency=currency)
     elif chart_type == 'line':
         return create_line_chart(plot_data)
     elif chart_type == 'pie':
-        return create_advanced_pie_chart(plot_data)
+        return create_advanced_pie_chart(plot_data, currency=currency)
     elif chart_type == 'trend':
-        return create_trend_chart(plot_data)
+        return create_trend_chart(plot_data, forecast=_chart_forecast(filters, forecast_months), currency=currency)
     elif chart_type == 'comparison':
-        return create_comparison_chart(plot_data)
+        return create_comparison_chart(plot_data, currency=currency)
     else:
         return create_advanced_area_chart(plot_data)
 
 # Update monthly statistics
-@app.callback(
+@filter_callback(
     Output('monthly-stats', 'children'),
-    [Input('date-range', 'start_date'),
-     Input('date-range', 'end_date'),
-     Input('categories', 'value')]
+    Input('settled-filters', 'data')
 )
-def update_monthly_stats(start_date, end_date, selected_categories):
-    data = load_transactions()
-    
-    # Filter by date range
-    if start_date and end_date:
-        data = data[(data['date'] >= start_date) & (data['date'] <= end_date)]
-    
-    # Filter by categories
-    if selected_categories:
-        data = filter_by_category(data, selected_categories)
+@timed_callback
+@profile_slow
+def update_monthly_stats(filters):
+    data = load_filtered(filters)
     
     if data.empty:
         return html.P("No data available", style={'color': '#6b7280'})
     
     stats = get_monthly_stats(data)
+    money = lambda value: fx.format_money(value, filters.get('currency'))
     return html.Div([
         html.Div([
             html.Span(f"📅 {month}", style={'fontWeight': '600', 'color': '#374151'}),
             html.Br(),
-            html.Span(f"Income: ${income:,.2f}", style={'color': '#10b981', 'fontSize': '0.9rem'}),
+            html.Span(f"Income: {money(income)}", style={'color': '#10b981', 'fontSize': '0.9rem'}),
             html.Br(),
-            html.Span(f"Expenses: ${expenses:,.2f}", style={'color': '#ef4444', 'fontSize': '0.9rem'}),
+            html.Span(f"Expenses: {money(expenses)}", style={'color': '#ef4444', 'fontSize': '0.9rem'}),
             html.Br(),
-            html.Span(f"Net: ${net:,.2f}", style={'color': '#3b82f6' if net >= 0 else '#ef4444', 'fontSize': '0.9rem', 'fontWeight': '600'})
+            html.Span(f"Net: {money(net)}", style={'color': '#3b82f6' if net >= 0 else '#ef4444', 'fontSize': '0.9rem', 'fontWeight': '600'})
         ], style={'padding': '0.75rem', 'border': '1px solid #e5e7eb', 'borderRadius': '8px', 'marginBottom': '0.5rem'})
         for month, income, expenses, net in stats
     ])
 
 # Update trend analysis
-@app.callback(
+@filter_callback(
     Output('trend-analysis', 'children'),
-    [Input('date-range', 'start_date'),
-     Input('date-range', 'end_date'),
-     Input('categories', 'value')]
+    Input('settled-filters', 'data')
 )
-def update_trend_analysis(start_date, end_date, selected_categories):
-    data = load_transactions()
-    
-    # Filter by date range
-    if start_date and end_date:
-        data = data[(data['date'] >= start_date) & (data['date'] <= end_date)]
-    
-    # Filter by categories
-    if selected_categories:
-        data = filter_by_category(data, selected_categories)
+@timed_callback
+@profile_slow
+def update_trend_analysis(filters):
+    data = load_filtered(filters)
     
     if data.empty:
         return html.P("No data available", style={'color': '#6b7280'})
@@ -503,35 +728,461 @@ def update_trend_analysis(start_date, end_date, selected_categories):
             html.H5("📊 Daily Averages", style={'marginBottom': '0.5rem', 'color': '#374151'}),
             *[html.Div([
                 html.Span(f"{category}: ", style={'fontWeight': '600'}),
-                html.Span(f"${avg:.2f}/day", style={'color': '#3b82f6'})
+                html.Span(f"{fx.format_money(avg, filters.get('currency'))}/day", style={'color': '#3b82f6'})
             ], style={'marginBottom': '0.25rem'})
             for category, avg in daily_avg.items()]
-        ])
+        ]),
+        *(_net_forecast(currency=filters.get('currency')) if filters.get('as_of') is None else [])
     ])
 
-# Add transaction callback
+def _net_forecast(months=3, currency=None):
+    """Net cash flow forecast lines for the trend analysis panel (empty until one is computed)"""
+    forecast = get_forecast(months)
+    if forecast is None or forecast.empty:
+        return []
+    net = _forecast_in(forecast[forecast['category'] == FORECAST_NET], currency)
+    return [
+        html.Hr(style={'margin': '1rem 0'}),
+        html.Div([
+            html.H5("🔮 Net Cash Flow Forecast", style={'marginBottom': '0.5rem', 'color': '#374151'}),
+            *[html.Div([
+                html.Span(f"{month:%b %Y}: ", style={'fontWeight': '600'}),
+                html.Span(fx.format_money(value, currency), style={'color': '#10b981' if value >= 0 else '#ef4444'}),
+                html.Span(f" ({fx.format_money(low, currency, 0)} to {fx.format_money(high, currency, 0)})",
+                          style={'color': '#6b7280', 'fontSize': '0.85rem'})
+            ], style={'marginBottom': '0.25rem'})
+            for month, value, low, high in zip(net['month'], net['forecast'], net['lower'], net['upper'])]
+        ])
+    ]
+
+# Clientside filtering: send the snapshot once, then let the browser do the rest
+if CLIENTSIDE_FILTERING:
+    @app.callback(
+        Output('txn-snapshot', 'data'),
+        Input('txn-snapshot', 'id')
+    )
+    @timed_callback
+    @profile_slow
+    def load_snapshot(_):
+        return build_snapshot(load_transactions())
+
+    filter_inputs = [Input('date-range', 'start_date'),
+                     Input('date-range', 'end_date'),
+                     Input('categories', 'value'),
+                     Input('txn-snapshot', 'data'),
+                     Input('txn-appended', 'data'),
+                     Input('accounts', 'value')]
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='finance', function_name='update_metrics'),
+        [Output('total-income', 'children'),
+         Output('total-expenses', 'children'),
+         Output('net-balance', 'children'),
+         Output('daily-average', 'children')],
+        filter_inputs
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='finance', function_name='update_main_chart'),
+        Output('main-chart', 'figure'),
+        [Input('date-range', 'start_date'),
+         Input('date-range', 'end_date'),
+         Input('chart-type', 'value'),
+         Input('categories', 'value'),
+         Input('txn-snapshot', 'data'),
+         Input('txn-appended', 'data'),
+         Input('accounts', 'value')]
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='finance', function_name='update_monthly_stats'),
+        Output('monthly-stats', 'children'),
+        filter_inputs
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='finance', function_name='update_trend_analysis'),
+        Output('trend-analysis', 'children'),
+        filter_inputs
+    )
+
+# Add transaction callback; also runs on first render to fill the filters
 @app.callback(
     [Output('form-output', 'children'),
      Output('categories', 'options'),
      Output('categories', 'value'),
-     Output('input-category', 'options')],
+     Output('input-category', 'options'),
+     Output('budget-category', 'options'),
+     Output('txn-appended', 'data'),
+     Output('date-range', 'start_date'),
+     Output('date-range', 'end_date'),
+     Output('accounts', 'options'),
+     Output('input-account', 'options'),
+     Output('input-transfer-to', 'options')],
     [Input('add-btn', 'n_clicks')],
     [State('input-date', 'date'),
      State('input-category', 'value'),
      State('input-amount', 'value'),
-     State('input-desc', 'value')]
+     State('input-desc', 'value'),
+     State('input-account', 'value'),
+     State('input-transfer-to', 'value'),
+     State('txn-appended', 'data')]
 )
-def add_transaction_callback(n_clicks, date, category, amount, desc):
-    if n_clicks and n_clicks > 0 and date and category and amount is not None:
+@timed_callback
+@profile_slow
+def add_transaction_callback(n_clicks, date, category, amount, desc, account, transfer_to, appended):
+    if not n_clicks:
+        # First render: fill the filters from cheap distinct-category and date-range queries
+        cats = get_categories()
+        opts = [{'label': c, 'value': c} for c in cats]
+        account_opts = [{'label': a, 'value': a} for a in account_names()]
+        start_date, end_date = get_date_range()
+        if start_date is None:
+            start_date, end_date = datetime.now() - timedelta(days=30), datetime.now()
+        return "", opts, cats, opts, opts, dash.no_update, start_date, end_date, account_opts, account_opts, account_opts
+    if n_clicks and n_clicks > 0 and transfer_to and date and amount is not None:
+        try:
+            record_transfer(date, account or DEFAULT_ACCOUNT, transfer_to, amount, desc)
+            account_opts = [{'label': a, 'value': a} for a in account_names()]
+            new_rows = ((appended or []) + [snapshot_row(date, 'Transfer', -float(amount), account or DEFAULT_ACCOUNT),
+                                            snapshot_row(date, 'Transfer', amount, transfer_to)]
+                        if CLIENTSIDE_FILTERING else dash.no_update)
+            return ("✅ Transfer recorded!", dash.no_update, dash.no_update, dash.no_update, dash.no_update, new_rows,
+                    dash.no_update, dash.no_update, account_opts, account_opts, account_opts)
+        except Exception as e:
+            return (f"❌ Error: {e}",) + (dash.no_update,) * 10
+    if n_clicks and n_clicks > 0 and date and (category or desc) and amount is not None:
         try:
-            insert_transaction(date, category, amount, desc)
-            df_new = load_transactions()
-            cats = list(df_new['category'].unique())
+            category = category or suggest(desc, amount) or UNCATEGORIZED
+            insert_transaction(date, category, amount, desc, account)
+            cats = get_categories()
             opts = [{'label': c, 'value': c} for c in cats]
-            return "✅ Transaction added successfully!", opts, cats, opts
+            account_opts = [{'label': a, 'value': a} for a in account_names()]
+            # Clientside mode only needs the new row, not a fresh snapshot
+            new_rows = (appended or []) + [snapshot_row(date, category, amount, account)] if CLIENTSIDE_FILTERING else dash.no_update
+            return ("✅ Transaction added successfully!", opts, cats, opts, opts, new_rows, dash.no_update, dash.no_update,
+                    account_opts, account_opts, account_opts)
         except Exception as e:
-            return f"❌ Error: {e}", dash.no_update, dash.no_update, dash.no_update
-    return "", dash.no_update, dash.no_update, dash.no_update
+            return (f"❌ Error: {e}",) + (dash.no_update,) * 10
+    return ("",) + (dash.no_update,) * 10
+
+
+# As-of selector: the last version of each day, newest first (modules/snapshots.py)
+AS_OF_DAYS = 120
+
+@app.callback(
+    Output('as-of', 'options'),
+    Input('form-output', 'children')
+)
+@timed_callback
+def update_as_of_options(_added):
+    if memory.rollup_only():
+        return []
+    daily = {}
+    for entry in snapshots.versions():
+        daily[pd.Timestamp(entry['at'], unit='s').strftime('%Y-%m-%d')] = entry['version']
+    days = sorted(daily.items(), reverse=True)[:AS_OF_DAYS]
+    return [{'label': f"End of {day} (version {version})", 'value': version} for day, version in days]
+
+
+# Display currencies: every currency in the rates file, read on each render so edits to it show up
+@app.callback(
+    Output('display-currency', 'options'),
+    Input('form-output', 'children')
+)
+@timed_callback
+def update_currency_options(_added):
+    return [{'label': c, 'value': c} for c in fx.currencies()]
+
+
+# Budgets: budget vs actual for the month of the range's end date, read from
+# the month x category rollup, plus alerts raised by recent inserts
+BUDGET_COLORS = {'ok': '#10b981', 'warning': '#f59e0b', 'at risk': '#f97316', 'over': '#ef4444'}
+
+@app.callback(
+    Output('budget-panel', 'children'),
+    [Input('date-range', 'end_date'),
+     Input('form-output', 'children'),
+     Input('budget-output', 'children'),
+     Input('display-currency', 'value')]
+)
+@timed_callback
+@profile_slow
+def update_budgets(end_date, _added, _saved, currency):
+    as_of = pd.to_datetime(end_date[:10]) if end_date else pd.Timestamp.now()
+    rows = budget_status(as_of, currency)
+    money = lambda value: fx.format_money(value, currency)
+    if rows.empty:
+        return html.P("No budgets yet. Set one below.", style={'color': '#6b7280'})
+
+    days_left = as_of.days_in_month - as_of.day
+    header = html.P(f"{as_of:%B %Y}, as of day {as_of.day} ({days_left} days left)",
+                    style={'color': '#64748b', 'marginTop': 0})
+    bars = [
+        html.Div([
+            html.Div([
+                html.Span(row.category, style={'fontWeight': '600', 'color': '#374151'}),
+                html.Span(f"{money(row.spent)} of {money(row.budget)}", style={'float': 'right', 'color': '#374151'})
+            ]),
+            html.Div(html.Div(style={'width': f"{min(row.used, 1) * 100:.0f}%", 'height': '100%', 'borderRadius': '4px',
+                                     'backgroundColor': BUDGET_COLORS[row.status]}),
+                     style={'height': '8px', 'backgroundColor': '#e5e7eb', 'borderRadius': '4px', 'margin': '0.35rem 0'}),
+            html.Span(f"Burn rate {money(row.burn_rate)}/day, projected {money(row.projected)}; "
+                      + (f"{money(row.daily_allowance)}/day left to spend" if row.remaining > 0 else f"{money(-row.remaining)} over"),
+                      style={'fontSize': '0.85rem', 'color': BUDGET_COLORS[row.status] if row.status != 'ok' else '#64748b'})
+        ], style={'marginBottom': '0.75rem'})
+        for row in rows.itertuples()
+    ]
+    alerts = [
+        html.Li(f"{a['category']} reached {a['share']:.0%} of its {a['month']} budget "
+                f"({fx.format_money(a['spent'])} of {fx.format_money(a['budget'])})", style={'color': '#b45309'})
+        for a in recent_alerts(5)
+    ]
+    return html.Div([header, *bars] + ([html.H5("🔔 Alerts", style={'margin': '1rem 0 0.5rem', 'color': '#374151'}),
+                                        html.Ul(alerts, style={'margin': 0})] if alerts else []))
+
+@app.callback(
+    Output('budget-output', 'children'),
+    Input('budget-save', 'n_clicks'),
+    [State('budget-category', 'value'),
+     State('budget-amount', 'value')],
+    prevent_initial_call=True
+)
+def save_budget(n_clicks, category, amount):
+    if not category or amount is None:
+        return "Pick a category and enter an amount."
+    try:
+        set_budget(category, amount)
+    except ValueError as e:
+        return f"❌ {e}"
+    return f"✅ Removed the {category} budget" if not amount else f"✅ {category}: {fx.format_money(amount)} a month"
+
+
+# Accounts: balances at the end of the range's end date, read from the prefix-sum matrix.
+# Each balance is shown in its account's currency; the total in the display currency.
+@app.callback(
+    Output('accounts-panel', 'children'),
+    [Input('date-range', 'end_date'),
+     Input('form-output', 'children'),
+     Input('display-currency', 'value')]
+)
+@timed_callback
+@profile_slow
+def update_accounts(end_date, _added, currency):
+    as_of = end_date[:10] if end_date else None
+    table = account_balances(as_of)
+    if table.empty:
+        return html.P("No accounts yet", style={'color': '#6b7280'})
+    cell = {'padding': '6px 10px', 'borderBottom': '1px solid #e2e8f0', 'textAlign': 'left'}
+    total = sum(row.balance * fx.rate(currency, as_of, row.currency) for row in table.itertuples())
+    return html.Table([
+        html.Thead(html.Tr([html.Th(h, style=cell) for h in ('Account', 'Kind', 'Balance')])),
+        html.Tbody([
+            html.Tr([
+                html.Td(row.account, style=cell),
+                html.Td(row.kind, style=cell),
+                html.Td(fx.format_money(row.balance, row.currency), style={**cell, 'textAlign': 'right',
+                                                                          'color': '#374151' if row.balance >= 0 else '#ef4444'})
+            ]) for row in table.itertuples()
+        ] + [html.Tr([
+            html.Td("Total", style={**cell, 'fontWeight': '600'}),
+            html.Td("", style=cell),
+            html.Td(fx.format_money(total, currency), style={**cell, 'textAlign': 'right', 'fontWeight': '600'})
+        ])])
+    ], style={'width': '100%', 'borderCollapse': 'collapse'})
+
+
+# Recurring: active series as of the range's end date and the charges due in the 30 days after it
+@app.callback(
+    Output('recurring-panel', 'children'),
+    [Input('date-range', 'end_date'),
+     Input('form-output', 'children'),
+     Input('display-currency', 'value')]
+)
+@timed_callback
+@profile_slow
+def update_recurring(end_date, _added, currency):
+    as_of = pd.to_datetime(end_date[:10]) if end_date else pd.Timestamp.now().normalize()
+    # Series are detected in the base currency
+    factor = fx.rate(currency, as_of)
+    money = lambda value: fx.format_money(value * factor, currency)
+    series = detect_recurring(as_of)
+    series = series[series['active']]
+    if series.empty:
+        return html.P("No recurring transactions found", style={'color': '#6b7280'})
+
+    cell = {'padding': '6px 10px', 'borderBottom': '1px solid #e2e8f0', 'textAlign': 'left'}
+    table = html.Table([
+        html.Thead(html.Tr([html.Th(h, style=cell) for h in ('Description', 'Category', 'Every', 'Amount', 'Last', 'Next')])),
+        html.Tbody([
+            html.Tr([
+                html.Td(row.description, style=cell),
+                html.Td(row.category, style=cell),
+                html.Td(row.period, style=cell),
+                html.Td(money(row.amount), style={**cell, 'textAlign': 'right'}),
+                html.Td(f"{row.last:%Y-%m-%d}", style=cell),
+                html.Td(f"{row.next:%Y-%m-%d}", style=cell)
+            ]) for row in series.itertuples()
+        ])
+    ], style={'width': '100%', 'borderCollapse': 'collapse'})
+
+    due = upcoming_charges(as_of, 30)
+    flows = cash_flow(due)
+    expenses, income = flows['expenses'], flows['income']
+    projections = html.Div([
+        html.H5(f"📆 Next 30 days: {money(expenses)} due" + (f", {money(income)} expected in" if income else ""),
+                style={'margin': '1rem 0 0.5rem', 'color': '#374151'}),
+        html.Ul([
+            html.Li(f"{row.date:%b %d}: {row.description} {money(row.amount)}", style={'color': '#374151'})
+            for row in due.itertuples()
+        ], style={'margin': 0})
+    ]) if not due.empty else html.P("Nothing due in the next 30 days", style={'color': '#6b7280', 'marginTop': '1rem'})
+    return html.Div([table, projections])
+
+
+# Ledger edits: each changed row becomes an update and each removed row a
+# delete (modules/corrections.py). Re-sending the category selection makes the
+# filter-driven panels reload, as an insert does.
+LEDGER_EDITABLE = ('date', 'category', 'description', 'amount')
+
+@app.callback(
+    [Output('form-output', 'children', allow_duplicate=True),
+     Output('categories', 'value', allow_duplicate=True)]
+    + ([Output('txn-snapshot', 'data', allow_duplicate=True),
+        Output('txn-appended', 'data', allow_duplicate=True)] if CLIENTSIDE_FILTERING else []),
+    Input('ledger', 'data_timestamp'),
+    [State('ledger', 'data'),
+     State('ledger', 'data_previous'),
+     State('categories', 'value')],
+    prevent_initial_call=True
+)
+@timed_callback
+@profile_slow
+def edit_ledger(_timestamp, rows, previous, selected):
+    if not previous:
+        raise PreventUpdate
+    current = {row['id']: row for row in rows or []}
+    corrected, message = 0, None
+    for old in previous:
+        new = current.get(old['id'])
+        changes = {} if new is None else {c: new.get(c) for c in LEDGER_EDITABLE if new.get(c) != old.get(c)}
+        if new is not None and not changes:
+            continue
+        try:
+            if new is None:
+                delete_transaction(old['id'])
+            else:
+                update_transaction(old['id'], **changes)
+            corrected += 1
+        except ValueError as e:
+            message = f"❌ {e}"
+    if not corrected and message is None:
+        raise PreventUpdate
+    message = message or f"✅ Corrected {corrected} transaction{'s' if corrected != 1 else ''}"
+    if CLIENTSIDE_FILTERING:
+        # Corrections change rows already in the browser, so it gets a fresh snapshot
+        return message, selected, build_snapshot(load_transactions()), []
+    return message, selected
+
+
+# Ledger: fetch only the page on screen. Each fetched page's first and last
+# cursors are kept in ledger-state, so stepping to a neighbouring page is a
+# keyset query; other jumps use an offset. The total is counted again only when
+# the filters, the sort or the stored data change.
+@app.callback(
+    [Output('ledger', 'data'),
+     Output('ledger', 'page_count'),
+     Output('ledger', 'page_current'),
+     Output('ledger-summary', 'children'),
+     Output('ledger-state', 'data')],
+    [Input('search-query', 'value'),
+     Input('date-range', 'start_date'),
+     Input('date-range', 'end_date'),
+     Input('categories', 'value'),
+     Input('accounts', 'value'),
+     Input('ledger', 'page_current'),
+     Input('ledger', 'sort_by'),
+     Input('ledger', 'filter_query'),
+     Input('form-output', 'children')],
+    [State('ledger-state', 'data')]
+)
+@timed_callback
+@profile_slow
+def update_ledger(query, start_date, end_date, categories, accounts, page, sort_by, filter_query, _added, state):
+    sort_column, descending = 'date', True
+    if sort_by:
+        sort_column, descending = sort_by[0]['column_id'], sort_by[0]['direction'] == 'desc'
+    key = repr((query, start_date, end_date, sorted(categories or []), sorted(accounts or []), filter_query,
+                sort_column, descending))
+    version = data_version()
+    if not state or state['key'] != key:
+        state, page = {'key': key, 'version': version, 'total': None, 'pages': {}}, 0
+    elif state['version'] != version:
+        # New or changed rows: recount, and forget cursors whose neighbours may have moved
+        state.update(version=version, total=None, pages={})
+    page = page or 0
+
+    pages = state['pages']
+    if page == 0:
+        cursor = None
+    elif str(page - 1) in pages:
+        cursor = {'after': pages[str(page - 1)][1]}
+    elif str(page + 1) in pages:
+        cursor = {'before': pages[str(page + 1)][0]}
+    else:
+        cursor = {'offset': page * LEDGER_PAGE_SIZE}
+
+    try:
+        result = fetch_page(query, start_date, end_date, categories, accounts, filter_query, sort_column, descending,
+                            cursor, LEDGER_PAGE_SIZE, count=state['total'] is None)
+    except ValueError as e:
+        return [], 1, 0, f"❌ {e}", state
+    if result['total'] is not None:
+        state['total'] = result['total']
+    total = state['total']
+    if not result['rows'] and page > 0 and total:
+        # Past the end (the data shrank under this page): show the last page instead
+        page = (total - 1) // LEDGER_PAGE_SIZE
+        result = fetch_page(query, start_date, end_date, categories, accounts, filter_query, sort_column, descending,
+                            {'offset': page * LEDGER_PAGE_SIZE}, LEDGER_PAGE_SIZE, count=False)
+    if result['rows']:
+        pages[str(page)] = [result['first'], result['last']]
+        summary = f"{page * LEDGER_PAGE_SIZE + 1:,}–{page * LEDGER_PAGE_SIZE + len(result['rows']):,} of {total:,}"
+    else:
+        summary = "No matching transactions"
+    page_count = max(1, -(-total // LEDGER_PAGE_SIZE))
+    return result['rows'], page_count, page, summary, state
+
+
+# Suggest a category from the description using the categorization rules
+@app.callback(
+    Output('input-category', 'value'),
+    Input('input-desc', 'value'),
+    [State('input-amount', 'value'),
+     State('input-category', 'value')],
+    prevent_initial_call=True
+)
+def suggest_category(desc, amount, category):
+    suggestion = suggest(desc, amount)
+    if category or suggestion is None:
+        raise PreventUpdate
+    return suggestion
+
+
+# Debug overlay: per-panel callback latency (FINANCE_METRICS=1 FINANCE_METRICS_OVERLAY=1)
+if METRICS_OVERLAY:
+    app.layout.children.append(html.Div([
+        html.Pre(id='latency-overlay', style={'margin': 0, 'fontSize': '11px'}),
+        dcc.Interval(id='latency-interval', interval=2000)
+    ], style={'position': 'fixed', 'bottom': '12px', 'right': '12px', 'zIndex': 1000, 'padding': '8px 12px',
+              'backgroundColor': 'rgba(15, 23, 42, 0.85)', 'color': '#e2e8f0', 'borderRadius': '8px'}))
+
+    @app.callback(
+        Output('latency-overlay', 'children'),
+        Input('latency-interval', 'n_intervals')
+    )
+    def update_latency_overlay(_):
+        lines = []
+        for name, (last, p50, p95, count) in sorted(callback_latencies().items()):
+            lines.append(f"{name:<28} last {last * 1000:7.1f} ms  p50 ≤{p50 * 1000:.0f} ms  p95 ≤{p95 * 1000:.0f} ms  n={count}")
+        return '\n'.join(lines) or 'No callbacks timed yet'
 
 
 if __name__ == '__main__':
@@ -0,0 +1,456 @@
+// Clientside filtering mode (FINANCE_CLIENTSIDE=1).
+// The server ships one columnar snapshot into the 'txn-snapshot' store;
+// the finance.update_* functions filter and aggregate it in the browser.
+//
+// In the default server mode only finance.settle_filters runs here: it
+// debounces the filter inputs so a burst of changes costs one server round trip.
+
+(function () {
+    const COLOR_SEQ = [
+        '#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe', '#00f2fe',
+        '#43e97b', '#38f9d7', '#ffecd2', '#fcb69f', '#a8edea', '#fed6e3'
+    ];
+    const FONT = {family: 'Inter, sans-serif', size: 14, color: '#374151'};
+    const AXIS = {showgrid: true, gridcolor: '#e5e7eb', title: {font: {size: 14, color: '#6b7280'}}};
+    const MS_PER_DAY = 86400000;
+
+    // ----- Snapshot decoding -----
+
+    function decode(b64, ArrayType) {
+        const bin = atob(b64);
+        const bytes = new Uint8Array(bin.length);
+        for (let i = 0; i < bin.length; i++) {
+            bytes[i] = bin.charCodeAt(i);
+        }
+        return new ArrayType(bytes.buffer);
+    }
+
+    // Decoded arrays are cached against the store objects, so typed arrays
+    // are built once per snapshot/insert rather than once per interaction.
+    let cache = {snapshot: null, appended: null, data: null};
+    // Snapshot amounts are in the server's base currency (modules/fx.py)
+    let symbol = '$';
+
+    function getData(snapshot, appended) {
+        if (cache.snapshot === snapshot && cache.appended === appended) {
+            return cache.data;
+        }
+        symbol = snapshot.symbol || '$';
+        const extra = appended || [];
+        const categories = snapshot.categories.slice();
+        const codeOf = {};
+        categories.forEach((c, i) => { codeOf[c] = i; });
+        const accounts = snapshot.accounts.slice();
+        const accountOf = {};
+        accounts.forEach((a, i) => { accountOf[a] = i; });
+        const n = snapshot.count + extra.length;
+        const days = new Int32Array(n);
+        const codes = new Uint16Array(n);
+        const amounts = new Float64Array(n);
+        // +1 income, -1 expense, 0 transfer between own accounts
+        const signs = new Int8Array(n);
+        const accountCodes = new Uint16Array(n);
+        days.set(decode(snapshot.days, Int32Array));
+        codes.set(decode(snapshot.codes, Uint16Array));
+        amounts.set(decode(snapshot.amounts, Float64Array));
+        signs.set(decode(snapshot.signs, Int8Array));
+        accountCodes.set(decode(snapshot.account_codes, Uint16Array));
+        extra.forEach((row, j) => {
+            if (!(row.category in codeOf)) {
+                codeOf[row.category] = categories.length;
+                categories.push(row.category);
+            }
+            if (!(row.account in accountOf)) {
+                accountOf[row.account] = accounts.length;
+                accounts.push(row.account);
+            }
+            const i = snapshot.count + j;
+            days[i] = row.day;
+            codes[i] = codeOf[row.category];
+            amounts[i] = row.amount;
+            signs[i] = row.sign;
+            accountCodes[i] = accountOf[row.account];
+        });
+        const data = {n, days, codes, amounts, signs, accountCodes, categories, codeOf, accounts, accountOf};
+        cache = {snapshot, appended, data};
+        return data;
+    }
+
+    function toDay(value) {
+        if (!value) {
+            return null;
+        }
+        const parts = String(value).slice(0, 10).split(/[-\/]/).map(Number);
+        return Math.floor(Date.UTC(parts[0], parts[1] - 1, parts[2]) / MS_PER_DAY);
+    }
+
+    function dayToISO(day) {
+        return new Date(day * MS_PER_DAY).toISOString().slice(0, 10);
+    }
+
+    function monthOf(day) {
+        return dayToISO(day).slice(0, 7);
+    }
+
+    // Lookup table of the codes picked by a multi-select, or null when nothing is picked
+    function allowedCodes(selected, names, codeOf) {
+        if (!selected || !selected.length) {
+            return null;
+        }
+        const allowed = new Uint8Array(names.length);
+        selected.forEach((name) => {
+            if (name in codeOf) {
+                allowed[codeOf[name]] = 1;
+            }
+        });
+        return allowed;
+    }
+
+    // Row indices matching the date range, category and account selections
+    function filterRows(data, startDate, endDate, selected, accounts) {
+        const lo = toDay(startDate);
+        const hi = toDay(endDate);
+        const useDates = lo !== null && hi !== null;
+        const allowed = allowedCodes(selected, data.categories, data.codeOf);
+        const allowedAccounts = allowedCodes(accounts, data.accounts, data.accountOf);
+        const out = new Int32Array(data.n);
+        let k = 0;
+        for (let i = 0; i < data.n; i++) {
+            if (useDates && (data.days[i] < lo || data.days[i] > hi)) {
+                continue;
+            }
+            if (allowed && !allowed[data.codes[i]]) {
+                continue;
+            }
+            if (allowedAccounts && !allowedAccounts[data.accountCodes[i]]) {
+                continue;
+            }
+            out[k++] = i;
+        }
+        return out.subarray(0, k);
+    }
+
+    function money(value) {
+        return symbol + value.toLocaleString('en-US', {minimumFractionDigits: 2, maximumFractionDigits: 2});
+    }
+
+    function el(type, props) {
+        return {namespace: 'dash_html_components', type, props};
+    }
+
+    // ----- Aggregation helpers -----
+
+    // {code: [[day, amount], ...]} in date order
+    function seriesByCategory(data, rows) {
+        const series = {};
+        rows.forEach((i) => {
+            const code = data.codes[i];
+            (series[code] = series[code] || []).push([data.days[i], data.amounts[i]]);
+        });
+        Object.values(series).forEach((points) => points.sort((a, b) => a[0] - b[0]));
+        return series;
+    }
+
+    // {code: {key: total}} where key is produced by keyFn(day)
+    function totalsBy(data, rows, keyFn) {
+        const totals = {};
+        rows.forEach((i) => {
+            const code = data.codes[i];
+            const key = keyFn(data.days[i]);
+            const byKey = totals[code] = totals[code] || {};
+            byKey[key] = (byKey[key] || 0) + data.amounts[i];
+        });
+        return totals;
+    }
+
+    function emptyFigure() {
+        return {
+            data: [],
+            layout: {annotations: [{text: 'No data available', xref: 'paper', yref: 'paper', x: 0.5, y: 0.5, showarrow: false}]}
+        };
+    }
+
+    function baseLayout(title) {
+        return {
+            title: {text: title, font: {size: 20, color: '#1f2937'}, x: 0.5},
+            font: FONT,
+            plot_bgcolor: 'rgba(0,0,0,0)',
+            paper_bgcolor: 'rgba(0,0,0,0)',
+            xaxis: AXIS,
+            yaxis: AXIS,
+            legend: {title: {text: ''}, orientation: 'h', y: -0.15, x: 0.5, xanchor: 'center'},
+            margin: {l: 20, r: 20, t: 60, b: 80},
+            hovermode: 'x unified'
+        };
+    }
+
+    function xyTraces(data, rows, traceFor) {
+        const series = seriesByCategory(data, rows);
+        return Object.keys(series).map((code, i) => {
+            const points = series[code];
+            return Object.assign({
+                name: data.categories[code],
+                x: points.map((p) => dayToISO(p[0])),
+                y: points.map((p) => p[1]),
+                marker: {color: COLOR_SEQ[i % COLOR_SEQ.length]}
+            }, traceFor(i));
+        });
+    }
+
+    function areaFigure(data, rows) {
+        const traces = xyTraces(data, rows, (i) => ({
+            type: 'scatter', mode: 'lines', fill: i > 0 ? 'tonexty' : 'tozeroy', line: {width: 2}
+        }));
+        return {data: traces, layout: baseLayout('📈 Financial Trends Over Time')};
+    }
+
+    function barFigure(data, rows) {
+        const traces = xyTraces(data, rows, () => ({type: 'bar'}));
+        return {data: traces, layout: Object.assign(baseLayout('Expenses Over Time'), {barmode: 'relative'})};
+    }
+
+    function lineFigure(data, rows) {
+        const traces = xyTraces(data, rows, () => ({type: 'scatter', mode: 'lines'}));
+        return {data: traces, layout: baseLayout('Expenses Over Time')};
+    }
+
+    function pieFigure(data, rows) {
+        const totals = new Float64Array(data.categories.length);
+        rows.forEach((i) => { totals[data.codes[i]] += data.amounts[i]; });
+        const labels = [];
+        const values = [];
+        totals.forEach((total, code) => {
+            if (total) {
+                labels.push(data.categories[code]);
+                values.push(total);
+            }
+        });
+        const layout = baseLayout('🥧 Expense Distribution');
+        layout.legend = {orientation: 'v', yanchor: 'middle', y: 0.5, xanchor: 'left', x: 1.01};
+        layout.margin = {l: 20, r: 20, t: 60, b: 20};
+        return {
+            data: [{
+                type: 'pie', labels, values,
+                textposition: 'inside', textinfo: 'percent+label',
+                marker: {colors: COLOR_SEQ, line: {color: '#ffffff', width: 2}},
+                opacity: 0.9,
+                hovertemplate: '<b>%{label}</b><br>Amount: ' + symbol + '%{value:,.2f}<br>Percentage: %{percent}<extra></extra>'
+            }],
+            layout
+        };
+    }
+
+    function trendFigure(data, rows) {
+        const totals = totalsBy(data, rows, (day) => day);
+        const traces = [];
+        Object.keys(totals).forEach((code, i) => {
+            const color = COLOR_SEQ[i % COLOR_SEQ.length];
+            const name = data.categories[code];
+            const days = Object.keys(totals[code]).map(Number).sort((a, b) => a - b);
+            const amounts = days.map((d) => totals[code][d]);
+            // 7-point moving average, matching rolling(window=7, min_periods=1)
+            const ma = amounts.map((_, j) => {
+                const window = amounts.slice(Math.max(0, j - 6), j + 1);
+                return window.reduce((a, b) => a + b, 0) / window.length;
+            });
+            const x = days.map(dayToISO);
+            traces.push({type: 'scatter', mode: 'markers', name: name + ' (Actual)', x, y: amounts,
+                marker: {color, size: 6, opacity: 0.7}});
+            traces.push({type: 'scatter', mode: 'lines', name: name + ' (Trend)', x, y: ma,
+                line: {color, width: 3}});
+        });
+        const layout = baseLayout('📊 Advanced Trend Analysis');
+        layout.legend = {orientation: 'v', yanchor: 'top', y: 1, xanchor: 'left', x: 1.01};
+        return {data: traces, layout};
+    }
+
+    function comparisonFigure(data, rows) {
+        const totals = totalsBy(data, rows, monthOf);
+        const months = Array.from(new Set(Object.values(totals).flatMap(Object.keys))).sort();
+        const traces = Object.keys(totals).map((code, i) => ({
+            type: 'bar',
+            name: data.categories[code],
+            x: months,
+            y: months.map((m) => totals[code][m] || 0),
+            marker: {color: COLOR_SEQ[i % COLOR_SEQ.length]}
+        }));
+        const layout = baseLayout('📊 Month-over-Month Comparison');
+        layout.barmode = 'group';
+        return {data: traces, layout};
+    }
+
+    const FIGURES = {
+        area: areaFigure, bar: barFigure, line: lineFigure,
+        pie: pieFigure, trend: trendFigure, comparison: comparisonFigure
+    };
+
+    // ----- Filter debouncing (server mode) -----
+
+    const DEBOUNCE_MS = 300;
+    const clientId = Math.random().toString(36).slice(2);
+    let seq = 0;
+    let pending = null;
+
+    function settleFilters(startDate, endDate, selected, accounts, currency, asOf) {
+        // Nothing to compute until the first-render callback has filled the filters
+        if (selected === null || selected === undefined) {
+            return window.dash_clientside.no_update;
+        }
+        const filters = {start_date: startDate, end_date: endDate, categories: selected, accounts: accounts || [],
+            currency: currency, as_of: asOf || null, client: clientId, seq: ++seq};
+        // First render goes straight through so the dashboard fills immediately
+        if (seq === 1) {
+            return filters;
+        }
+        if (pending) {
+            clearTimeout(pending.timer);
+            pending.resolve(window.dash_clientside.no_update);
+        }
+        return new Promise((resolve) => {
+            pending = {resolve, timer: setTimeout(() => {
+                pending = null;
+                resolve(filters);
+            }, DEBOUNCE_MS)};
+        });
+    }
+
+    function noData() {
+        return el('P', {children: 'No data available', style: {color: '#6b7280'}});
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        finance: {
+            settle_filters: settleFilters,
+
+            update_metrics: function (startDate, endDate, selected, snapshot, appended, accounts) {
+                if (!snapshot) {
+                    return window.dash_clientside.no_update;
+                }
+                const data = getData(snapshot, appended);
+                const rows = filterRows(data, startDate, endDate, selected, accounts);
+                if (!rows.length) {
+                    return [money(0), money(0), money(0), money(0)];
+                }
+                let income = 0;
+                let expenses = 0;
+                rows.forEach((i) => {
+                    if (data.signs[i] > 0) {
+                        income += data.amounts[i];
+                    } else if (data.signs[i] < 0) {
+                        expenses += data.amounts[i];
+                    }
+                });
+                let dailyAvg = 0;
+                if (startDate && endDate) {
+                    const days = toDay(endDate) - toDay(startDate) + 1;
+                    dailyAvg = days > 0 ? expenses / days : 0;
+                }
+                return [money(income), money(expenses), money(income - expenses), money(dailyAvg)];
+            },
+
+            update_main_chart: function (startDate, endDate, chartType, selected, snapshot, appended, accounts) {
+                if (!snapshot) {
+                    return window.dash_clientside.no_update;
+                }
+                const data = getData(snapshot, appended);
+                const rows = filterRows(data, startDate, endDate, selected, accounts);
+                if (!rows.length) {
+                    return emptyFigure();
+                }
+                return (FIGURES[chartType] || areaFigure)(data, rows);
+            },
+
+            update_monthly_stats: function (startDate, endDate, selected, snapshot, appended, accounts) {
+                if (!snapshot) {
+                    return window.dash_clientside.no_update;
+                }
+                const data = getData(snapshot, appended);
+                const rows = filterRows(data, startDate, endDate, selected, accounts);
+                if (!rows.length) {
+                    return noData();
+                }
+                const months = {};
+                rows.forEach((i) => {
+                    const m = months[monthOf(data.days[i])] = months[monthOf(data.days[i])] || {income: 0, expenses: 0};
+                    if (data.signs[i] > 0) {
+                        m.income += data.amounts[i];
+                    } else if (data.signs[i] < 0) {
+                        m.expenses += data.amounts[i];
+                    }
+                });
+                return el('Div', {children: Object.keys(months).sort().map((month) => {
+                    const {income, expenses} = months[month];
+                    const net = income - expenses;
+                    return el('Div', {
+                        children: [
+                            el('Span', {children: '📅 ' + month, style: {fontWeight: '600', color: '#374151'}}),
+                            el('Br', {}),
+                            el('Span', {children: 'Income: ' + money(income), style: {color: '#10b981', fontSize: '0.9rem'}}),
+                            el('Br', {}),
+                            el('Span', {children: 'Expenses: ' + money(expenses), style: {color: '#ef4444', fontSize: '0.9rem'}}),
+                            el('Br', {}),
+                            el('Span', {children: 'Net: ' + money(net), style: {color: net >= 0 ? '#3b82f6' : '#ef4444', fontSize: '0.9rem', fontWeight: '600'}})
+                        ],
+                        style: {padding: '0.75rem', border: '1px solid #e5e7eb', borderRadius: '8px', marginBottom: '0.5rem'}
+                    });
+                })});
+            },
+
+            update_trend_analysis: function (startDate, endDate, selected, snapshot, appended, accounts) {
+                if (!snapshot) {
+                    return window.dash_clientside.no_update;
+                }
+                const data = getData(snapshot, appended);
+                const rows = filterRows(data, startDate, endDate, selected, accounts);
+                if (!rows.length) {
+                    return noData();
+                }
+                const monthly = totalsBy(data, rows, monthOf);
+                const allMonths = new Set(Object.values(monthly).flatMap(Object.keys));
+                const changes = [];
+                if (allMonths.size >= 2) {
+                    Object.keys(monthly).forEach((code) => {
+                        const months = Object.keys(monthly[code]).sort();
+                        if (months.length < 2) {
+                            return;
+                        }
+                        const current = monthly[code][months[months.length - 1]];
+                        const previous = monthly[code][months[months.length - 2]];
+                        const change = previous !== 0 ? (current - previous) / previous * 100 : (current === 0 ? 0 : 100);
+                        changes.push([data.categories[code], change]);
+                    });
+                }
+                let lo = Infinity;
+                let hi = -Infinity;
+                const totals = {};
+                rows.forEach((i) => {
+                    lo = Math.min(lo, data.days[i]);
+                    hi = Math.max(hi, data.days[i]);
+                    totals[data.codes[i]] = (totals[data.codes[i]] || 0) + data.amounts[i];
+                });
+                const span = hi - lo + 1;
+                return el('Div', {children: [
+                    el('Div', {children: [
+                        el('H5', {children: '📈 Month-over-Month Changes', style: {marginBottom: '0.5rem', color: '#374151'}})
+                    ].concat(changes.map(([category, change]) => el('Div', {
+                        children: [
+                            el('Span', {children: category + ': ', style: {fontWeight: '600'}}),
+                            el('Span', {children: (change >= 0 ? '+' : '') + change.toFixed(1) + '%', style: {color: change > 0 ? '#10b981' : '#ef4444'}})
+                        ],
+                        style: {marginBottom: '0.25rem'}
+                    })))}),
+                    el('Hr', {style: {margin: '1rem 0'}}),
+                    el('Div', {children: [
+                        el('H5', {children: '📊 Daily Averages', style: {marginBottom: '0.5rem', color: '#374151'}})
+                    ].concat(Object.keys(totals).map((code) => el('Div', {
+                        children: [
+                            el('Span', {children: data.categories[code] + ': ', style: {fontWeight: '600'}}),
+                            el('Span', {children: symbol + (totals[code] / span).toFixed(2) + '/day', style: {color: '#3b82f6'}})
+                        ],
+                        style: {marginBottom: '0.25rem'}
+                    })))})
+                ]});
+            }
+        }
+    });
+})();
@@ -0,0 +1,4 @@
+# Benchmark suite: synthetic data generator, timing runner and result comparison.
+#
+#   python -m benchmarks.run --rows 10000 1000000 --output bench_results.json
+#   python -m benchmarks.compare baseline.json bench_results.json
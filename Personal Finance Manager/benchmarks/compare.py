@@ -0,0 +1,49 @@
+import argparse
+import json
+import sys
+
+# Compare two benchmark result files and flag regressions on the median time.
+
+
+def compare(baseline, current, threshold=0.10, min_delta=0.001):
+    """Rows of (size, name, old, new, ratio, regressed) for benchmarks present in both runs"""
+    rows = []
+    for size, old_results in baseline['results'].items():
+        new_results = current['results'].get(size, {})
+        for name, old in old_results.items():
+            new = new_results.get(name)
+            if not new or 'median' not in old or 'median' not in new:
+                continue
+            ratio = new['median'] / old['median'] if old['median'] else float('inf')
+            # Small absolute differences are timer noise, whatever the ratio
+            regressed = ratio > 1 + threshold and new['median'] - old['median'] > min_delta
+            rows.append((size, name, old['median'], new['median'], ratio, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown that counts as a regression (default 10%%)')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'rows':>10}  {'benchmark':<45} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for size, name, old, new, ratio, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{int(size):>10,}  {name:<45} {old:>10.4f} {new:>10.4f} {ratio:>6.2f}x{flag}")
+
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"{regressions} regression(s) over {len(rows)} benchmarks")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import argparse
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from benchmarks.synthetic import generate_transactions
+
+# Local stand-in for a bank-feed API, for testing modules.api_integration offline.
+#
+#   GET /accounts                                     -> {"accounts": [{"id": ...}, ...]}
+#   GET /accounts/<id>/transactions?cursor=&limit=    -> {"transactions": [...], "next_cursor", "has_more"}
+#
+# Each account serves seeded synthetic transactions in date order, each with a
+# stable id; the cursor is the offset after the last row returned. An optional
+# token bucket answers 429 with Retry-After once the request rate is exceeded.
+
+MAX_PAGE = 5_000
+
+
+class MockBank:
+    """Per-account transaction lists plus an optional request-rate limit"""
+
+    def __init__(self, accounts=3, rows=10_000, seed=42, rate=None, burst=10):
+        self.lock = threading.Lock()
+        self.accounts = {}
+        for i in range(accounts):
+            df = generate_transactions(rows, seed=seed + i)
+            self.accounts[f'acct-{i + 1}'] = df.rename(columns=str.lower)[['date', 'category', 'amount', 'description']]
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled = time.monotonic()
+        self.requests = 0
+        self.throttled = 0
+
+    def add_transactions(self, account_id, df):
+        """Append rows to an account, as new activity for the next incremental sync"""
+        with self.lock:
+            self.accounts[account_id] = pd.concat([self.accounts[account_id], df], ignore_index=True)
+
+    def admit(self):
+        """Take a token; returns None if admitted, else seconds to wait"""
+        with self.lock:
+            self.requests += 1
+            if self.rate is None:
+                return None
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+            self.refilled = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            self.throttled += 1
+            return (1 - self.tokens) / self.rate
+
+    def page(self, account_id, cursor, limit):
+        with self.lock:
+            df = self.accounts[account_id]
+        start = int(cursor) if cursor else 0
+        rows = df.iloc[start:start + limit]
+        end = start + len(rows)
+        transactions = rows.to_dict('records')
+        for position, transaction in enumerate(transactions, start):
+            transaction['id'] = f'{account_id}:{position}'
+        return {
+            'transactions': transactions,
+            'next_cursor': str(end),
+            'has_more': end < len(df)
+        }
+
+
+def make_handler(bank):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body, headers=()):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            wait = bank.admit()
+            if wait is not None:
+                # Retry-After is whole seconds in HTTP; round up so clients never come back early
+                return self._send(429, {'error': 'rate limited'}, [('Retry-After', str(math.ceil(wait)))])
+
+            url = urlparse(self.path)
+            parts = url.path.strip('/').split('/')
+            if parts == ['accounts']:
+                return self._send(200, {'accounts': [{'id': a} for a in bank.accounts]})
+            if len(parts) == 3 and parts[0] == 'accounts' and parts[2] == 'transactions' and parts[1] in bank.accounts:
+                query = parse_qs(url.query)
+                cursor = query.get('cursor', [None])[0]
+                limit = min(int(query.get('limit', ['500'])[0]), MAX_PAGE)
+                return self._send(200, bank.page(parts[1], cursor, limit))
+            self._send(404, {'error': 'not found'})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(bank, host='127.0.0.1', port=0):
+    """Serve bank on a background thread; returns the server (server.server_address has the port)"""
+    server = ThreadingHTTPServer((host, port), make_handler(bank))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve paginated synthetic transactions like a bank-feed API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--accounts', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=10_000, help='transactions per account')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rate', type=float, default=None, help='requests per second before answering 429')
+    args = parser.parse_args(argv)
+
+    bank = MockBank(args.accounts, args.rows, args.seed, args.rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(bank))
+    print(f"Mock bank serving {args.accounts} accounts x {args.rows:,} rows on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import socketserver
+import threading
+import time
+
+# Local stand-in for a Redis server, for testing modules.shared_cache offline.
+#
+#   python -m benchmarks.mock_redis --port 6390
+#   FINANCE_CACHE_URL=redis://127.0.0.1:6390/0 python -m modules.serve --workers 4
+#
+# Speaks enough of the wire protocol (RESP) for the shared cache tier: PING,
+# GET, SET (with EX/PX expiry), INCR, DEL, SELECT, AUTH, DBSIZE and FLUSHDB.
+# Every database number shares one keyspace.
+
+
+class MockRedis:
+    """An in-memory keyspace with per-key expiry"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}          # key -> (value, expires at or None)
+        self.commands = 0
+
+    def _live(self, key):
+        item = self.data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return item
+
+    def execute(self, args):
+        """Run one command; returns the reply value, or an Exception for an error reply"""
+        name = args[0].upper().decode() if args else ''
+        with self.lock:
+            self.commands += 1
+            if name == 'PING':
+                return b'PONG'
+            if name in ('SELECT', 'AUTH'):
+                return b'OK'
+            if name == 'GET':
+                item = self._live(args[1])
+                return None if item is None else item[0]
+            if name == 'SET':
+                expires = None
+                options = [a.upper() for a in args[3::2]]
+                for option, value in zip(options, args[4::2]):
+                    if option == b'PX':
+                        expires = time.monotonic() + int(value) / 1000
+                    elif option == b'EX':
+                        expires = time.monotonic() + int(value)
+                self.data[args[1]] = (args[2], expires)
+                return b'OK'
+            if name == 'INCR':
+                item = self._live(args[1])
+                try:
+                    value = int(item[0]) + 1 if item is not None else 1
+                except ValueError:
+                    return ValueError('ERR value is not an integer or out of range')
+                self.data[args[1]] = (str(value).encode(), None if item is None else item[1])
+                return value
+            if name == 'DEL':
+                return sum(self.data.pop(key, None) is not None for key in args[1:])
+            if name == 'DBSIZE':
+                return len(self.data)
+            if name == 'FLUSHDB':
+                self.data.clear()
+                return b'OK'
+            return ValueError(f"ERR unknown command '{name}'")
+
+
+def _reply(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, Exception):
+        return b'-%s\r\n' % str(value).encode()
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if value in (b'OK', b'PONG'):
+        return b'+%s\r\n' % value
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def make_handler(redis):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                line = self.rfile.readline()
+                if not line.startswith(b'*'):
+                    return
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int(self.rfile.readline()[1:])
+                    args.append(self.rfile.read(length + 2)[:-2])
+                self.wfile.write(_reply(redis.execute(args)))
+
+    return Handler
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_server(redis, host='127.0.0.1', port=0):
+    """Serve redis on a background thread; returns the server (server.server_address has the port)"""
+    server = Server((host, port), make_handler(redis))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve an in-memory keyspace over the Redis protocol')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args(argv)
+
+    server = Server((args.host, args.port), make_handler(MockRedis()))
+    print(f"Mock Redis serving on redis://{args.host}:{args.port}/0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from benchmarks.synthetic import SIZES, generate_transactions, write_csv
+from modules import budgets, charts, dedup, http_cache, process_data
+
+# Times the data layer, analytics, chart builders and Dash callbacks against
+# synthetic CSVs of increasing size and writes the results as JSON.
+
+ANALYTICS = ['get_monthly_stats', 'get_daily_averages', 'get_percentage_changes', 'get_trend_analysis']
+CHARTS = [
+    'create_area_chart', 'create_bar_chart', 'create_line_chart', 'create_pie_chart',
+    'create_funnel_chart', 'create_advanced_area_chart', 'create_advanced_pie_chart',
+    'create_trend_chart', 'create_comparison_chart'
+]
+MAIN_CHART_TYPES = ['area', 'bar', 'line', 'pie', 'trend', 'comparison']
+
+
+def time_call(func, setup=None, repeat=3):
+    """Time func over several runs; setup() builds fresh arguments outside the timed region"""
+    samples = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.mean(samples),
+        'repeat': repeat
+    }
+
+
+def dash_request(output, inputs):
+    """Body of a Dash callback request for single-property outputs and (id, property, value) inputs"""
+    ids = [o.rsplit('.', 1) for o in output]
+    return {
+        'output': output[0] if len(output) == 1 else '..' + '...'.join(output) + '..',
+        'outputs': [{'id': i, 'property': p} for i, p in ids] if len(output) > 1 else {'id': ids[0][0], 'property': ids[0][1]},
+        'inputs': [{'id': i, 'property': p, 'value': v} for i, p, v in inputs],
+        'changedPropIds': [f'{inputs[0][0]}.{inputs[0][1]}'],
+        'state': []
+    }
+
+
+def bench_http(client, name, body, repeat):
+    """Response bytes with and without gzip, and latency of a computed, a cached and a 304 response"""
+    post = lambda headers: client.post('/_dash-update-component', json=body, headers=headers)
+    http_cache.clear()
+    plain = post({})
+    if plain.status_code != 200:
+        raise RuntimeError(f"HTTP {plain.status_code}")
+    zipped = post({'Accept-Encoding': 'gzip'})
+    etag = zipped.headers['ETag']
+    gzip_only = {'Accept-Encoding': 'gzip'}
+    return {
+        f'http:{name}:bytes': {'identity': len(plain.data), 'gzip': len(zipped.data),
+                               'saved': 1 - len(zipped.data) / len(plain.data)},
+        f'http:{name}:computed': time_call(lambda: (http_cache.clear(), post(gzip_only)), repeat=repeat),
+        f'http:{name}:cached': time_call(lambda: post(gzip_only), repeat=repeat),
+        f'http:{name}:not_modified': time_call(lambda: post({**gzip_only, 'If-None-Match': etag}), repeat=repeat)
+    }
+
+
+def guarded(name, func, *args, **kwargs):
+    """Run one benchmark, recording a failure instead of aborting the suite"""
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        message = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+        print(f"  {name} failed: {message}")
+        return {'error': message}
+
+
+def bench_size(n_rows, workdir, repeat, chart_limit, seed):
+    """Run every benchmark against one synthetic dataset"""
+    path = write_csv(generate_transactions(n_rows, seed=seed), os.path.join(workdir, f'transactions_{n_rows}.csv'))
+    process_data.CSV_FILE = path
+    process_data.USE_DB = False
+    # Alerts are checked against budgets of our own, not the ones in data/
+    budgets.BUDGETS_FILE = os.path.join(workdir, 'budgets.csv')
+    # Nothing derived from the previous size (rollup, indexes, balances, cached
+    # responses and forecasts keyed by the data version) may answer for this one
+    process_data._forget_derived()
+    process_data.bump_data_version()
+    results = {}
+
+    results['load_transactions'] = time_call(process_data.load_transactions, repeat=repeat)
+    df = process_data.load_transactions()
+    categories = sorted(df['category'].unique())
+    selected = categories[: max(1, len(categories) // 2)]
+    results['filter_by_category'] = time_call(process_data.filter_by_category, lambda: (df, selected), repeat=repeat)
+
+    # Duplicate detection: index the history, then check a re-import of 10% of it
+    # mixed with as many new rows
+    index = dedup.HashIndex(os.path.join(workdir, f'dedup_{n_rows}'))
+    results['dedup:build_index'] = time_call(index.build, lambda: (df,), repeat=repeat)
+    batch_size = max(1, n_rows // 20)
+    batch = pd.concat([
+        df.sample(batch_size, random_state=seed),
+        generate_transactions(batch_size, seed=seed + 1, start='2030-01-01', years=1).rename(columns=str.lower)
+    ], ignore_index=True)
+    results['dedup:plan'] = time_call(dedup.plan, lambda: (batch, index), repeat=repeat)
+
+    # Analytics functions add helper columns, so each run gets its own copy
+    for name in ANALYTICS:
+        results[name] = guarded(name, time_call, getattr(process_data, name), lambda: (df.copy(),), repeat=repeat)
+
+    if n_rows <= chart_limit:
+        plot_df = df.rename(columns={'date': 'Date', 'amount': 'Amount', 'category': 'Category'})
+        for name in CHARTS:
+            func = getattr(charts, name)
+            results[name] = guarded(name, time_call, func, lambda: (plot_df.copy(),), repeat=repeat)
+            fig = guarded(name, func, plot_df.copy())
+            if not isinstance(fig, dict):
+                results[name + ':serialize'] = time_call(fig.to_json, repeat=repeat)
+
+        # End-to-end callbacks as Dash would invoke them, over the full date range
+        import app
+        filters = {'start_date': df['date'].min(), 'end_date': df['date'].max(), 'categories': None}
+        results['callback:update_metrics'] = guarded('update_metrics', time_call, app.update_metrics, lambda: (filters,), repeat=repeat)
+        results['callback:update_monthly_stats'] = guarded('update_monthly_stats', time_call, app.update_monthly_stats, lambda: (filters,), repeat=repeat)
+        results['callback:update_trend_analysis'] = guarded('update_trend_analysis', time_call, app.update_trend_analysis, lambda: (filters,), repeat=repeat)
+        for chart_type in MAIN_CHART_TYPES:
+            results[f'callback:update_main_chart[{chart_type}]'] = guarded(
+                chart_type, time_call, app.update_main_chart, lambda: (filters, chart_type, 0), repeat=repeat)
+
+        # The same callbacks over HTTP: response size with gzip, and what the ETag cache saves
+        client = app.app.server.test_client()
+        settled = ('settled-filters', 'data', filters)
+        requests = {
+            'update_metrics': dash_request(['total-income.children', 'total-expenses.children',
+                                            'net-balance.children', 'daily-average.children'], [settled]),
+            'update_monthly_stats': dash_request(['monthly-stats.children'], [settled])
+        }
+        for chart_type in MAIN_CHART_TYPES:
+            requests[f'update_main_chart[{chart_type}]'] = dash_request(
+                ['main-chart.figure'], [settled, ('chart-type', 'value', chart_type), ('forecast-months', 'value', 0)])
+        for name, body in requests.items():
+            results.update(guarded(name, bench_http, client, name, body, repeat) or {})
+    else:
+        print(f"  skipping charts and callbacks above {chart_limit} rows")
+
+    os.remove(path)
+    return results
+
+
+def parse_size(value):
+    return SIZES[value] if value in SIZES else int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the finance tracker on synthetic data')
+    parser.add_argument('--rows', nargs='+', default=['small', 'medium'],
+                        help='dataset sizes: row counts or small/medium/large (10k/1M/10M)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chart-limit', type=int, default=1_000_000,
+                        help='skip chart and callback timings above this many rows')
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'repeat': args.repeat
+        },
+        'results': {}
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in map(parse_size, args.rows):
+            print(f"Benchmarking {size:,} rows")
+            report['results'][str(size)] = bench_size(size, workdir, args.repeat, args.chart_limit, args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold-start report: wall-clock time of `import app` in fresh interpreters, plus a
+# `python -X importtime` breakdown summarized by top-level package.
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_cold_import(module='app', runs=5):
+    """Wall-clock seconds for `import <module>` in a fresh interpreter, per run"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], cwd=APP_DIR, capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def importtime_breakdown(module='app'):
+    """Import time in seconds per top-level package (summed self time), from -X importtime"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         cwd=APP_DIR, capture_output=True, text=True, check=True)
+    packages = {}
+    for line in out.stderr.splitlines():
+        # "import time:      self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        top = name.strip().split('.')[0]
+        packages[top] = packages.get(top, 0) + int(self_us) / 1e6
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report cold-start import time of the dashboard')
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--output', default='startup_results.json')
+    args = parser.parse_args(argv)
+
+    samples = time_cold_import(args.module, args.runs)
+    breakdown = importtime_breakdown(args.module)
+    heavy = ('pandas', 'numpy', 'plotly', 'sqlalchemy', 'psycopg2')
+
+    print(f"import {args.module}: median {statistics.median(samples):.3f}s over {args.runs} runs")
+    print(f"{'package':<30} {'seconds':>10}")
+    for name, seconds in list(breakdown.items())[:args.top]:
+        print(f"{name:<30} {seconds:>9.3f}s")
+    eager = [name for name in heavy if name in breakdown]
+    print("Heavy dependencies imported eagerly: " + (', '.join(eager) if eager else 'none'))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'module': args.module,
+            'import_seconds': {'median': statistics.median(samples), 'min': min(samples), 'samples': samples},
+            'by_package': breakdown,
+            'eager_heavy_imports': eager
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
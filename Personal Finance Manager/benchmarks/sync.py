@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.mock_bank import MockBank, start_server
+from benchmarks.synthetic import generate_transactions
+from modules import api_integration, budgets, process_data
+
+# Sync throughput and correctness against the local mock provider: a full sync,
+# a no-op re-sync, a replay from scratch (which dedupe must absorb) and an
+# incremental sync after new activity, each checked against what the mock served.
+
+
+def _stored(path):
+    return process_data.load_transactions() if os.path.exists(path) else pd.DataFrame(columns=['amount'])
+
+
+def run(accounts, rows, workers, page_size, rate, seed):
+    bank = MockBank(accounts, rows, seed, rate)
+    server = start_server(bank)
+    provider = api_integration.HttpProvider(f'http://127.0.0.1:{server.server_address[1]}')
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'transactions.csv')
+        process_data.CSV_FILE = path
+        process_data.USE_DB = False
+        budgets.BUDGETS_FILE = os.path.join(workdir, 'budgets.csv')
+        process_data._forget_derived()
+        process_data.bump_data_version()
+        cursors = api_integration.CursorStore(os.path.join(workdir, 'cursors.json'))
+        expected = sum(len(df) for df in bank.accounts.values())
+
+        start = time.perf_counter()
+        api_integration.sync_all(provider, cursors, workers, page_size)
+        elapsed = time.perf_counter() - start
+        stored = _stored(path)
+        results['full'] = {
+            'seconds': elapsed,
+            'rows': len(stored),
+            'rows_per_second': len(stored) / elapsed,
+            'count_ok': len(stored) == expected,
+            'amount_ok': bool(round(stored['amount'].sum(), 2) == round(sum(df['amount'].sum() for df in bank.accounts.values()), 2))
+        }
+
+        start = time.perf_counter()
+        resync = api_integration.sync_all(provider, cursors, workers, page_size)
+        results['resync'] = {
+            'seconds': time.perf_counter() - start,
+            'rows': sum(r.get('rows', 0) for r in resync.values())
+        }
+
+        # Forgetting the cursors re-fetches everything; dedupe must drop it all
+        replay = api_integration.sync_all(provider, api_integration.CursorStore(os.path.join(workdir, 'reset.json')), workers, page_size)
+        results['replay'] = {
+            'rows': sum(r.get('rows', 0) for r in replay.values()),
+            'count_ok': len(_stored(path)) == expected
+        }
+
+        new = generate_transactions(100, seed=seed + 1000, start='2025-01-01', years=1).rename(columns=str.lower)
+        bank.add_transactions('acct-1', new)
+        incremental = api_integration.sync_all(provider, cursors, workers, page_size)
+        results['incremental'] = {
+            'rows': sum(r.get('rows', 0) for r in incremental.values()),
+            'count_ok': len(_stored(path)) == expected + len(new)
+        }
+    server.shutdown()
+    results['requests'] = bank.requests
+    results['throttled'] = bank.throttled
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark bank-feed sync against the local mock provider')
+    parser.add_argument('--accounts', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=25_000, help='transactions per account')
+    parser.add_argument('--workers', type=int, default=api_integration.MAX_WORKERS)
+    parser.add_argument('--page-size', type=int, default=api_integration.PAGE_SIZE)
+    parser.add_argument('--rate', type=float, default=None, help='mock request rate limit per second')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args(argv)
+
+    results = run(args.accounts, args.rows, args.workers, args.page_size, args.rate, args.seed)
+    full = results['full']
+    print(f"full sync: {full['rows']:,} rows in {full['seconds']:.2f}s ({full['rows_per_second']:,.0f} rows/s), "
+          f"count {'ok' if full['count_ok'] else 'MISMATCH'}, amounts {'ok' if full['amount_ok'] else 'MISMATCH'}")
+    print(f"re-sync: {results['resync']['rows']} new rows in {results['resync']['seconds']:.3f}s")
+    print(f"replay without cursors: {results['replay']['rows']} rows written, count {'ok' if results['replay']['count_ok'] else 'MISMATCH'}")
+    print(f"incremental: {results['incremental']['rows']} rows, count {'ok' if results['incremental']['count_ok'] else 'MISMATCH'}")
+    print(f"{results['requests']} requests, {results['throttled']} throttled")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Seeded synthetic transactions in the data/transactions.csv schema
+# (Date, Category, Description, Amount), for scaling benchmarks.
+
+# Named sizes accepted by the benchmark runner
+SIZES = {'small': 10_000, 'medium': 1_000_000, 'large': 10_000_000}
+
+# Variable spending: category -> (share of variable rows, descriptions, median amount, log spread)
+SPEND_PROFILE = {
+    'Food': (0.42, ['Lunch', 'Dinner', 'Coffee', 'Snacks', 'Groceries'], 12.5, 0.6),
+    'Transport': (0.20, ['Bus', 'Taxi', 'Subway', 'Fuel'], 7.5, 0.7),
+    'Entertainment': (0.14, ['Movie', 'Theater', 'Cinema', 'Concert', 'Streaming'], 30.0, 0.6),
+    'Utilities': (0.08, ['Electricity', 'Water', 'Internet', 'Phone'], 50.0, 0.3),
+    'Health': (0.06, ['Pharmacy', 'Doctor', 'Dentist'], 25.0, 0.8),
+    'Shopping': (0.10, ['Clothes', 'Electronics', 'Books', 'Household'], 45.0, 0.9)
+}
+
+# Fixed monthly rows: (category, description, amount, day of month)
+FIXED_MONTHLY = [
+    ('Rent', 'Monthly', 1200.0, 1),
+    ('Income', 'Salary', 2500.0, 1),
+    ('Income', 'Salary', 2500.0, 15)
+]
+
+# Relative spending activity by calendar month (Jan..Dec): holiday peak, summer bump
+SEASONALITY = np.array([0.85, 0.85, 0.95, 1.0, 1.0, 1.1, 1.15, 1.1, 0.95, 1.0, 1.1, 1.4])
+
+
+def generate_transactions(n_rows, seed=42, start='2020-01-01', years=5):
+    """Generate n_rows synthetic transactions sorted by date"""
+    rng = np.random.default_rng(seed)
+    months = pd.date_range(start, periods=years * 12, freq='MS')
+    month_days = months.days_in_month.to_numpy()
+    month_starts = months.to_numpy().astype('datetime64[D]')
+
+    # Fixed rows every month (trimmed if the requested size is tiny)
+    fixed_frames = []
+    for category, description, amount, day in FIXED_MONTHLY:
+        fixed_frames.append(pd.DataFrame({
+            'Date': month_starts + np.minimum(day, month_days) - 1,
+            'Category': category,
+            'Description': description,
+            'Amount': amount
+        }))
+    fixed = pd.concat(fixed_frames, ignore_index=True).head(n_rows)
+    n_var = n_rows - len(fixed)
+
+    # Variable rows: month drawn by seasonality x length, day uniform within the month
+    weights = SEASONALITY[months.month.to_numpy() - 1] * month_days
+    month_idx = rng.choice(len(months), size=n_var, p=weights / weights.sum())
+    day_offsets = (rng.random(n_var) * month_days[month_idx]).astype('int64')
+    dates = month_starts[month_idx] + day_offsets
+
+    names = list(SPEND_PROFILE)
+    shares = np.array([SPEND_PROFILE[c][0] for c in names])
+    cat_idx = rng.choice(len(names), size=n_var, p=shares / shares.sum())
+
+    medians = np.array([SPEND_PROFILE[c][2] for c in names])
+    spreads = np.array([SPEND_PROFILE[c][3] for c in names])
+    amounts = np.round(medians[cat_idx] * rng.lognormal(0.0, spreads[cat_idx]), 2)
+
+    # Description picked uniformly from the category's list
+    desc_lists = [SPEND_PROFILE[c][1] for c in names]
+    desc_pick = (rng.random(n_var) * np.array([len(d) for d in desc_lists])[cat_idx]).astype('int64')
+    all_descs = np.array([d for descs in desc_lists for d in descs], dtype=object)
+    desc_offsets = np.cumsum([0] + [len(d) for d in desc_lists[:-1]])
+
+    variable = pd.DataFrame({
+        'Date': dates,
+        'Category': np.array(names, dtype=object)[cat_idx],
+        'Description': all_descs[desc_offsets[cat_idx] + desc_pick],
+        'Amount': amounts
+    })
+
+    df = pd.concat([fixed, variable], ignore_index=True)
+    df = df.sort_values('Date', kind='stable', ignore_index=True)
+    df['Date'] = np.datetime_as_string(df['Date'].to_numpy().astype('datetime64[D]'), unit='D')
+    return df
+
+
+def write_csv(df, path):
+    """Write synthetic transactions in the same layout as data/transactions.csv"""
+    df.to_csv(path, index=False)
+    return path
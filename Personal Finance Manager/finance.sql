@@ -5,5 +5,50 @@ CREATE TABLE transactions (
     date DATE NOT NULL,
     category VARCHAR(50) NOT NULL,
     amount NUMERIC NOT NULL,
-    description TEXT
+    description TEXT,
+    -- Sign towards net cash flow: income +, expense -, transfer between own accounts 0 (modules/process_data.py)
+    type VARCHAR(10) NOT NULL DEFAULT 'expense' CHECK (type IN ('income', 'expense', 'transfer')),
+    account VARCHAR(50) NOT NULL DEFAULT 'Main',
+    -- Shared by the two legs of a transfer between accounts (modules/accounts.py)
+    transfer_id VARCHAR(32),
+    -- ISO code of the amount's currency; reports convert with the rates in data/fx_rates.csv (modules/fx.py)
+    currency VARCHAR(3) NOT NULL DEFAULT 'USD'
+);
+
+-- Serves the category dictionary (GROUP BY category with MIN/MAX(date)) from the index alone
+CREATE INDEX idx_transactions_category_date ON transactions (category, date);
+
+-- Full-text search over descriptions (modules/search.py queries this exact expression)
+CREATE INDEX idx_transactions_description_fts ON transactions USING GIN (to_tsvector('simple', coalesce(description, '')));
+
+-- Ledger keyset paging: WHERE (date, id) < (:date, :id) ORDER BY date DESC, id DESC (modules/ledger.py)
+CREATE INDEX idx_transactions_date_id ON transactions (date, id);
+
+-- Account filter and per-account balances
+CREATE INDEX idx_transactions_account_date ON transactions (account, date);
+
+-- Monthly spending limit per category; alert_at is the share of it that raises an alert (modules/budgets.py)
+CREATE TABLE budgets (
+    category VARCHAR(50) PRIMARY KEY,
+    amount NUMERIC NOT NULL,
+    alert_at NUMERIC NOT NULL DEFAULT 0.8
+);
+
+-- Where money is held; opening_balance is the balance before the first stored transaction (modules/accounts.py)
+CREATE TABLE accounts (
+    name VARCHAR(50) PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL DEFAULT 'checking',
+    opening_balance NUMERIC NOT NULL DEFAULT 0,
+    currency VARCHAR(3) NOT NULL DEFAULT 'USD'
+);
+
+-- Update and delete events (modules/corrections.py), each applied to its row in the same transaction.
+-- old_values and new_values are the row as JSON; a delete has no new_values.
+CREATE TABLE corrections (
+    seq BIGINT PRIMARY KEY,
+    recorded_at TIMESTAMP NOT NULL,
+    op VARCHAR(6) NOT NULL CHECK (op IN ('update', 'delete')),
+    transaction_id BIGINT NOT NULL,
+    old_values TEXT NOT NULL,
+    new_values TEXT
 );
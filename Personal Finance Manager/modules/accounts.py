@@ -0,0 +1,385 @@
+import os
+import threading
+import time
+import uuid
+
+from modules import fx, memory, process_data, shared_cache
+from modules.lazy import lazy_import
+from modules.metrics import timed
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Accounts (checking, credit card, savings, ...) and their running balances.
+#
+# Every transaction belongs to one account; rows stored before accounts existed
+# belong to DEFAULT_ACCOUNT. Accounts are listed in data/accounts.csv (Name,
+# Kind, Opening, Currency) or, with a database, the accounts table in
+# finance.sql. Rows may name an account that is not listed yet; it then shows
+# up with kind 'other'. Rows without a currency take their account's, and an
+# account's balance is kept in its own currency.
+#
+# A transfer between two accounts is a pair of rows of type transfer sharing a
+# transfer_id: the leg leaving one account has a negative amount, the leg
+# arriving in the other a positive one. Transfers count as neither income nor
+# expenses (process_data.TYPE_SIGNS), so moving money to savings is no longer
+# counted twice. record_transfer() writes both legs. Legs imported from bank
+# feeds are linked when a batch holds both sides: same day, opposite amounts,
+# different accounts.
+#
+# Balances are a prefix sum over days: an accounts x days matrix of end-of-day
+# balances, built once from history. Each insert adds the cumulative sum of
+# its own rows' deltas from their earliest day on, extending the matrix when
+# rows land past its last day, so no insert re-sums history.
+
+ACCOUNTS_FILE = os.environ.get('FINANCE_ACCOUNTS', 'data/accounts.csv')
+DEFAULT_ACCOUNT = 'Main'
+KINDS = ('checking', 'savings', 'credit', 'cash', 'investment', 'other')
+
+_accounts = None
+_accounts_lock = threading.Lock()
+_balances = None
+_lock = threading.Lock()
+
+
+class Account:
+    """A place money is held, with its balance before the first stored transaction"""
+    def __init__(self, name, kind='checking', opening_balance=0.0, currency=None):
+        self.name = name
+        self.kind = kind
+        self.opening_balance = float(opening_balance)
+        self.currency = (currency or fx.BASE_CURRENCY).upper()
+
+
+def _from_frame(df):
+    df = df.rename(columns=lambda c: c.strip().lower()).rename(columns={'opening': 'opening_balance'})
+    kinds = df['kind'] if 'kind' in df else ['checking'] * len(df)
+    opening = df['opening_balance'] if 'opening_balance' in df else [0.0] * len(df)
+    currencies = df['currency'] if 'currency' in df else [None] * len(df)
+    return {
+        str(name): Account(str(name), kind if isinstance(kind, str) else 'checking', 0.0 if pd.isna(balance) else balance,
+                           currency if isinstance(currency, str) else None)
+        for name, kind, balance, currency in zip(df['name'], kinds, opening, currencies)
+    }
+
+
+def load_accounts():
+    """Accounts by name, from the accounts table or ACCOUNTS_FILE"""
+    engine = process_data.get_engine()
+    if engine is not None:
+        try:
+            return _from_frame(pd.read_sql("SELECT name, kind, opening_balance, currency FROM accounts", engine))
+        except Exception as e:
+            print(f"Error loading accounts from DB: {e}, falling back to CSV")
+    if not os.path.exists(ACCOUNTS_FILE):
+        return {}
+    return _from_frame(pd.read_csv(ACCOUNTS_FILE))
+
+
+def get_accounts():
+    """Accounts by name, loaded on first use"""
+    global _accounts
+    with _accounts_lock:
+        if _accounts is None:
+            _accounts = load_accounts()
+        return _accounts
+
+
+def _write_csv(accounts):
+    directory = os.path.dirname(ACCOUNTS_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = ACCOUNTS_FILE + '.tmp'
+    pd.DataFrame(
+        [(a.name, a.kind, a.opening_balance, a.currency) for a in sorted(accounts.values(), key=lambda a: a.name)],
+        columns=['Name', 'Kind', 'Opening', 'Currency']
+    ).to_csv(tmp, index=False)
+    os.replace(tmp, ACCOUNTS_FILE)
+
+
+def set_account(name, kind='checking', opening_balance=0.0, currency=None):
+    """Create or change an account; currency defaults to fx.BASE_CURRENCY"""
+    global _accounts
+    name = (name or '').strip()
+    if not name:
+        raise ValueError("Account name is required")
+    if kind not in KINDS:
+        raise ValueError(f"Account kind must be one of {', '.join(KINDS)}")
+    with _accounts_lock:
+        accounts = dict(_accounts if _accounts is not None else load_accounts())
+        account = accounts[name] = Account(name, kind, opening_balance, currency)
+        engine = process_data.get_engine()
+        stored = False
+        if engine is not None:
+            from sqlalchemy import text
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(
+                        "INSERT INTO accounts (name, kind, opening_balance, currency) VALUES (:name, :kind, :opening, :currency) "
+                        "ON CONFLICT (name) DO UPDATE SET kind = excluded.kind, opening_balance = excluded.opening_balance, "
+                        "currency = excluded.currency"),
+                        {'name': name, 'kind': kind, 'opening': float(opening_balance), 'currency': account.currency})
+                stored = True
+            except Exception as e:
+                print(f"Error saving account to DB: {e}, writing to CSV instead")
+        if not stored:
+            _write_csv(accounts)
+        _accounts = accounts
+    # Other worker processes read accounts again
+    shared_cache.bump()
+
+
+# ----- Transfers -----
+
+def prepare(df):
+    """Rows ready to store: a default account and currency where none is given, and transfer pairs linked
+
+    Called by insert_transactions once rows have their type.
+    """
+    df = df.assign(account=df['account'].where(df['account'].notna() & (df['account'].astype(str).str.strip() != ''),
+                                               DEFAULT_ACCOUNT))
+    if 'currency' in df:
+        listed = get_accounts()
+        own = df['account'].map({name: account.currency for name, account in listed.items()}).fillna(fx.BASE_CURRENCY)
+        df = df.assign(currency=df['currency'].where(df['currency'].notna(), own).astype(str).str.upper())
+    legs = df[(df['type'] == 'transfer') & df['transfer_id'].isna()]
+    if len(legs) < 2:
+        return df
+    legs = pd.DataFrame({
+        'day': process_data.to_epoch_days(legs['date']),
+        'cents': np.round(pd.to_numeric(legs['amount']).to_numpy() * 100).astype('int64'),
+        'account': legs['account'].to_numpy()
+    }, index=legs.index)
+    legs['size'] = legs['cents'].abs()
+    out, into = legs[legs['cents'] < 0].copy(), legs[legs['cents'] > 0].copy()
+    # The k-th outgoing leg of a (day, size) pairs with the k-th incoming one
+    out['k'] = out.groupby(['day', 'size']).cumcount()
+    into['k'] = into.groupby(['day', 'size']).cumcount()
+    pairs = out.reset_index(names='out').merge(into.reset_index(names='in'), on=['day', 'size', 'k'])
+    pairs = pairs[pairs['account_x'] != pairs['account_y']]
+    if pairs.empty:
+        return df
+    ids = [uuid.uuid4().hex for _ in range(len(pairs))]
+    transfer_id = df['transfer_id'].astype(object)
+    transfer_id[pairs['out'].to_numpy()] = ids
+    transfer_id[pairs['in'].to_numpy()] = ids
+    return df.assign(transfer_id=transfer_id)
+
+
+def record_transfer(date, from_account, to_account, amount, description=None):
+    """Store a transfer as two linked legs; returns its transfer_id
+
+    amount is in from_account's currency. Between accounts in different
+    currencies, the arriving leg is converted at the date's rate.
+    """
+    amount = float(amount)
+    if amount <= 0:
+        raise ValueError("Transfer amount must be positive")
+    if from_account == to_account:
+        raise ValueError("A transfer needs two different accounts")
+    transfer_id = uuid.uuid4().hex
+    description = description or f"Transfer {from_account} to {to_account}"
+    listed = get_accounts()
+    source, target = (listed[name].currency if name in listed else fx.BASE_CURRENCY for name in (from_account, to_account))
+    process_data.insert_transactions(pd.DataFrame({
+        'date': [date, date],
+        'category': ['Transfer', 'Transfer'],
+        'amount': [-amount, round(amount * fx.rate(target, date, source), 2)],
+        'currency': [source, target],
+        'description': [description, description],
+        'type': ['transfer', 'transfer'],
+        'account': [from_account, to_account],
+        'transfer_id': [transfer_id, transfer_id]
+    }))
+    return transfer_id
+
+
+# ----- Balances -----
+
+def balance_deltas(df):
+    """What each row adds to its account's balance: income in, expenses out, transfer legs as signed"""
+    signs = process_data.type_signs(df)
+    amounts = pd.to_numeric(df['amount']).to_numpy(dtype=float)
+    return np.where(signs == 0, amounts, signs * amounts)
+
+
+class Balances:
+    """End-of-day balance of every account over the stored days, as a prefix-sum matrix"""
+
+    def __init__(self):
+        self.accounts = []          # account name of each matrix row
+        self.rows = {}              # account name -> matrix row
+        self.start = 0              # epoch day of the first column
+        self.matrix = np.zeros((0, 0))
+        self.unlinked = 0           # transfer legs stored without a counterpart
+
+    @property
+    def end(self):
+        return self.start + self.matrix.shape[1] - 1
+
+    def _row(self, name):
+        row = self.rows.get(name)
+        if row is None:
+            row = self.rows[name] = len(self.accounts)
+            self.accounts.append(name)
+            self.matrix = np.vstack([self.matrix, np.zeros((1, self.matrix.shape[1]))])
+        return row
+
+    def add(self, df, sign=1):
+        """Fold stored rows into the balances: sign=1 for added rows, -1 for removed ones"""
+        if df.empty:
+            return
+        days = process_data.to_epoch_days(df['date']).astype('int64')
+        codes, names = pd.factorize(df['account'].fillna(DEFAULT_ACCOUNT).astype(str))
+        rows = np.array([self._row(name) for name in names], dtype='int64')[codes]
+        first, last = int(days.min()), int(days.max())
+        width = self.matrix.shape[1]
+        if not width:
+            self.start = first
+            self.matrix = np.zeros((len(self.accounts), 1))
+        elif first < self.start:
+            # Nothing was held before the earliest day so far
+            self.matrix = np.hstack([np.zeros((len(self.accounts), self.start - first)), self.matrix])
+            self.start = first
+        if last > self.end:
+            # Balances carry forward over days without transactions
+            extra = last - self.end
+            self.matrix = np.hstack([self.matrix, np.repeat(self.matrix[:, -1:], extra, axis=1)])
+        span = self.end - first + 1
+        daily = np.bincount(rows * span + (days - first), weights=sign * balance_deltas(df),
+                            minlength=len(self.accounts) * span).reshape(len(self.accounts), span)
+        self.matrix[:, first - self.start:] += np.cumsum(daily, axis=1)
+        transfer_id = df['transfer_id'] if 'transfer_id' in df else pd.Series(np.nan, index=df.index)
+        self.unlinked += sign * int(((process_data.type_signs(df) == 0) & transfer_id.isna().to_numpy()).sum())
+
+    def at(self, day):
+        """Balance of each account at the end of an epoch day"""
+        if not self.matrix.shape[1] or day < self.start:
+            return np.zeros(len(self.accounts))
+        return self.matrix[:, min(day, self.end) - self.start].copy()
+
+
+def _built():
+    """The balances, built if needed; the caller holds process_data._write_lock"""
+    global _balances
+    with _lock:
+        if _balances is None:
+            start = time.perf_counter()
+            balances = Balances()
+            # A chunk at a time, so that building never holds every row in memory
+            for chunk in process_data.iter_transactions():
+                balances.add(chunk[['date', 'category', 'amount', 'type', 'account', 'transfer_id']])
+            _balances = balances
+            memory.track('balances', 'matrix', _balances, cost=time.perf_counter() - start, drop=_drop_balances)
+        return _balances
+
+
+def get_balances():
+    """The Balances, built from the store on first use"""
+    return process_data.derived(_lock, lambda: _balances, _built)
+
+
+def apply(df, sign=1):
+    """Fold newly stored rows into the balances, or with sign=-1 take removed ones out"""
+    with _lock:
+        if _balances is not None:
+            _balances.add(df, sign)
+            memory.track('balances', 'matrix', _balances)
+
+
+def reset():
+    """Forget the accounts and balances; they are read and rebuilt on next use"""
+    global _accounts, _balances
+    with _accounts_lock:
+        _accounts = None
+    with _lock:
+        _balances = None
+    memory.forget('balances')
+
+
+def _drop_balances(_):
+    """Evict the balances (memory budget); the accounts themselves are kept"""
+    global _balances
+    with _lock:
+        _balances = None
+
+
+def account_names():
+    """Every account: those listed plus any that stored rows name"""
+    balances = get_balances()
+    with _lock:
+        seen = list(balances.accounts)
+    return sorted(set(get_accounts()) | set(seen))
+
+
+@timed('finance_data_seconds')
+def balances(as_of=None):
+    """Balance of every account at the end of as_of (default: the latest stored day)
+
+    Columns: account, kind, currency, balance (opening balance plus every
+    stored row up to as_of, in the account's currency).
+    """
+    accounts = get_accounts()
+    state = get_balances()
+    with _lock:
+        day = state.end if as_of is None else int(process_data.to_epoch_days(pd.Series([str(as_of)[:10]]))[0])
+        stored = pd.Series(state.at(day), index=list(state.accounts), dtype=float)
+    names = sorted(set(accounts) | set(stored.index))
+    return pd.DataFrame({
+        'account': names,
+        'kind': [accounts[n].kind if n in accounts else 'other' for n in names],
+        'currency': [accounts[n].currency if n in accounts else fx.BASE_CURRENCY for n in names],
+        'balance': [stored.get(n, 0.0) + (accounts[n].opening_balance if n in accounts else 0.0) for n in names]
+    })
+
+
+def balance_history(start_date, end_date, names=None):
+    """End-of-day balances from start_date to end_date, one column per account"""
+    accounts = get_accounts()
+    state = get_balances()
+    first, last = (int(d) for d in process_data.to_epoch_days(pd.Series([str(start_date)[:10], str(end_date)[:10]])))
+    with _lock:
+        wanted = [n for n in (names or state.accounts) if n in state.rows]
+        days = np.arange(first, last + 1)
+        if state.matrix.shape[1]:
+            columns = np.clip(days, state.start, state.end) - state.start
+            values = state.matrix[[state.rows[n] for n in wanted]][:, columns]
+            values[:, days < state.start] = 0
+        else:
+            values = np.zeros((len(wanted), len(days)))
+    opening = np.array([accounts[n].opening_balance if n in accounts else 0.0 for n in wanted])
+    return pd.DataFrame((values + opening[:, None]).T, columns=wanted,
+                        index=pd.to_datetime(days, unit='D').rename('date'))
+
+
+def unlinked_transfers():
+    """Number of stored transfer legs without a counterpart"""
+    state = get_balances()
+    with _lock:
+        return state.unlinked
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='List account balances, add accounts or record transfers')
+    parser.add_argument('--add', metavar='NAME', help='create or change an account')
+    parser.add_argument('--kind', default='checking', choices=KINDS)
+    parser.add_argument('--opening', type=float, default=0.0, help='balance before the first stored transaction')
+    parser.add_argument('--currency', default=None, help=f'currency of the account, e.g. EUR (default: {fx.BASE_CURRENCY})')
+    parser.add_argument('--transfer', nargs=3, metavar=('FROM', 'TO', 'AMOUNT'), help='record a transfer')
+    parser.add_argument('--date', default=None, help='transfer date, YYYY-MM-DD (default: today)')
+    args = parser.parse_args(argv)
+
+    if args.add:
+        set_account(args.add, args.kind, args.opening, args.currency)
+    if args.transfer:
+        date = args.date or pd.Timestamp.now().strftime('%Y-%m-%d')
+        record_transfer(date, args.transfer[0], args.transfer[1], float(args.transfer[2]))
+    print(balances().to_string(index=False, float_format=lambda v: f'{v:,.2f}'))
+    unlinked = unlinked_transfers()
+    if unlinked:
+        print(f"{unlinked:,} transfer legs have no counterpart")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from collections import deque
+
+from modules import fx, process_data, rollups, shared_cache
+from modules.lazy import lazy_import
+from modules.metrics import inc
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Per-category monthly budgets, budget vs actual, and threshold alerts.
+#
+# Budgets are stored next to the transactions: data/budgets.csv (Category,
+# Amount, Alert) or, with PostgreSQL, the budgets table in finance.sql. Amount
+# is the monthly limit, in fx.BASE_CURRENCY. Alert is the share of it at which
+# to warn (default 0.8); reaching the full limit always raises an alert too.
+#
+# Actual spending comes from the month x category rollup (modules/rollups.py),
+# so budget vs actual for a month reads one row per category and never rescans
+# transactions. Each insert folds its rows into the rollup and then, in the
+# same pass, checks the thresholds of only the (month, category) pairs it
+# touched.
+#
+# The loaded budgets are read again when BUDGETS_FILE changes, so budgets set
+# with python -m modules.budgets show up in a running app. version() feeds the
+# ETags of cached panels (modules/http_cache.py).
+
+BUDGETS_FILE = os.environ.get('FINANCE_BUDGETS', 'data/budgets.csv')
+DEFAULT_ALERT = 0.8
+MAX_ALERTS = 50
+
+_budgets = None
+_loaded_mtime = None        # BUDGETS_FILE's mtime when _budgets was read
+_changes = 0                # budgets set by this process
+_budgets_lock = threading.Lock()
+_alerts = deque(maxlen=MAX_ALERTS)
+_alerts_lock = threading.Lock()
+
+
+class Budget:
+    """Monthly spending limit for one category"""
+    def __init__(self, category, amount, alert_at=DEFAULT_ALERT):
+        self.category = category
+        self.amount = float(amount)
+        self.alert_at = float(alert_at)
+
+    def thresholds(self):
+        """Spending levels that raise an alert, as (share, amount) pairs"""
+        return [(share, share * self.amount) for share in sorted({self.alert_at, 1.0})]
+
+
+def _from_frame(df):
+    df = df.rename(columns=lambda c: c.strip().lower()).rename(columns={'alert': 'alert_at'})
+    alert = df['alert_at'] if 'alert_at' in df else [DEFAULT_ALERT] * len(df)
+    return {
+        str(category): Budget(category, amount, DEFAULT_ALERT if pd.isna(share) else share)
+        for category, amount, share in zip(df['category'], df['amount'], alert)
+    }
+
+
+def load_budgets():
+    """Budgets by category, from the budgets table or BUDGETS_FILE"""
+    engine = process_data.get_engine()
+    if engine is not None:
+        try:
+            return _from_frame(pd.read_sql("SELECT category, amount, alert_at FROM budgets", engine))
+        except Exception as e:
+            print(f"Error loading budgets from DB: {e}, falling back to CSV")
+    if not os.path.exists(BUDGETS_FILE):
+        return {}
+    return _from_frame(pd.read_csv(BUDGETS_FILE))
+
+
+def file_mtime():
+    """BUDGETS_FILE's modification time, or None when there is none"""
+    return os.path.getmtime(BUDGETS_FILE) if os.path.exists(BUDGETS_FILE) else None
+
+
+def version():
+    """What the budgets depend on: changes made by this process and BUDGETS_FILE's mtime"""
+    return [_changes, file_mtime()]
+
+
+def get_budgets():
+    """Budgets by category, loaded on first use and again when BUDGETS_FILE changes"""
+    global _budgets, _loaded_mtime
+    mtime = file_mtime()
+    with _budgets_lock:
+        if _budgets is None or mtime != _loaded_mtime:
+            _budgets = load_budgets()
+            _loaded_mtime = mtime
+        return _budgets
+
+
+def reset():
+    """Forget the loaded budgets; they are read again on next use"""
+    global _budgets
+    with _budgets_lock:
+        _budgets = None
+
+
+def _write_csv(budgets):
+    directory = os.path.dirname(BUDGETS_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = BUDGETS_FILE + '.tmp'
+    pd.DataFrame(
+        [(b.category, b.amount, b.alert_at) for b in sorted(budgets.values(), key=lambda b: b.category)],
+        columns=['Category', 'Amount', 'Alert']
+    ).to_csv(tmp, index=False)
+    os.replace(tmp, BUDGETS_FILE)
+
+
+def set_budget(category, amount, alert_at=DEFAULT_ALERT):
+    """Create or change a category's budget; an amount of None or 0 removes it"""
+    global _budgets, _loaded_mtime, _changes
+    if amount is not None and float(amount) < 0:
+        raise ValueError("Budget amount cannot be negative")
+    if not 0 < float(alert_at) <= 1:
+        raise ValueError("Alert threshold must be a share between 0 and 1")
+    with _budgets_lock:
+        budgets = dict(_budgets if _budgets is not None else load_budgets())
+        if amount:
+            budgets[category] = Budget(category, amount, alert_at)
+        else:
+            budgets.pop(category, None)
+        engine = process_data.get_engine()
+        stored = False
+        if engine is not None:
+            from sqlalchemy import text
+            try:
+                with engine.begin() as conn:
+                    if amount:
+                        conn.execute(text(
+                            "INSERT INTO budgets (category, amount, alert_at) VALUES (:category, :amount, :alert_at) "
+                            "ON CONFLICT (category) DO UPDATE SET amount = excluded.amount, alert_at = excluded.alert_at"),
+                            {'category': category, 'amount': float(amount), 'alert_at': float(alert_at)})
+                    else:
+                        conn.execute(text("DELETE FROM budgets WHERE category = :category"), {'category': category})
+                stored = True
+            except Exception as e:
+                print(f"Error saving budget to DB: {e}, writing to CSV instead")
+        if not stored:
+            _write_csv(budgets)
+        _budgets = budgets
+        _loaded_mtime = file_mtime()
+        _changes += 1
+    # Other worker processes read budgets again
+    shared_cache.bump()
+
+
+def check(df):
+    """Raise alerts for thresholds that newly stored rows pushed their month's spending past
+
+    Called by insert_transactions under the store's write lock, after the rows
+    are folded into the rollup. Work is per (month, category) touched.
+    """
+    budgets = get_budgets()
+    if not budgets or df.empty:
+        return []
+    rows = df[df['category'].astype(str).isin(budgets)]
+    if rows.empty:
+        return []
+    after, delta = rollups.touched(rows)
+    raised = []
+    for (month, category), spent, added in zip(after.index, after.to_numpy(), delta.to_numpy()):
+        budget = budgets[str(category)]
+        for share, limit in budget.thresholds():
+            if spent - added < limit <= spent:
+                raised.append({'month': month, 'category': category, 'share': share, 'spent': float(spent),
+                               'budget': budget.amount, 'time': time.time()})
+    if raised:
+        with _alerts_lock:
+            _alerts.extend(raised)
+        for alert in raised:
+            inc('finance_budget_alerts_total', category=alert['category'])
+    return raised
+
+
+def recent_alerts(limit=10):
+    """Latest alerts, newest first"""
+    with _alerts_lock:
+        return list(_alerts)[::-1][:limit]
+
+
+def status(as_of, currency=None):
+    """Budget vs actual for the month of as_of, with burn rate and month-end projection, in currency
+
+    One row per budgeted category: budget, spent, used (share of budget),
+    remaining, burn_rate (spent per elapsed day), projected (month-end spending
+    at that rate), daily_allowance (what is left per remaining day) and status
+    (ok, warning, at risk or over).
+    A budget spent exactly is a warning, not at risk: fixed bills such as rent
+    land once a month and would otherwise project far past it.
+    """
+    as_of = pd.Timestamp(as_of).normalize()
+    budgets = get_budgets()
+    columns = ['category', 'budget', 'alert_at', 'spent', 'used', 'remaining', 'burn_rate', 'projected',
+               'daily_allowance', 'status']
+    if not budgets:
+        return pd.DataFrame(columns=columns)
+    totals = rollups.month_totals(as_of.strftime('%Y-%m'), currency)['amount']
+    factor = fx.rate(currency, as_of)
+    frame = pd.DataFrame({
+        'category': list(budgets),
+        'budget': [b.amount * factor for b in budgets.values()],
+        'alert_at': [b.alert_at for b in budgets.values()]
+    })
+    frame['spent'] = totals.reindex(frame['category']).fillna(0).to_numpy()
+    frame['used'] = frame['spent'] / frame['budget']
+    frame['remaining'] = frame['budget'] - frame['spent']
+    elapsed, days = as_of.day, as_of.days_in_month
+    frame['burn_rate'] = frame['spent'] / elapsed
+    frame['projected'] = frame['burn_rate'] * days
+    frame['daily_allowance'] = frame['remaining'].clip(lower=0) / max(1, days - elapsed)
+    frame['status'] = np.select(
+        [frame['spent'] > frame['budget'], (frame['projected'] > frame['budget']) & (frame['used'] < 1),
+         frame['used'] >= frame['alert_at']],
+        ['over', 'at risk', 'warning'], 'ok')
+    return frame[columns].sort_values('used', ascending=False, ignore_index=True)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Show or change monthly category budgets')
+    parser.add_argument('--month', help="month to report, YYYY-MM (default: this month)")
+    parser.add_argument('--set', nargs=2, metavar=('CATEGORY', 'AMOUNT'), help='set a monthly budget (0 removes it)')
+    parser.add_argument('--alert-at', type=float, default=DEFAULT_ALERT, help='share of the budget that raises an alert')
+    args = parser.parse_args(argv)
+
+    if args.set:
+        set_budget(args.set[0], float(args.set[1]), args.alert_at)
+    now = pd.Timestamp.now()
+    month = pd.Period(args.month or now, freq='M')
+    # Any other month is reported as of its last day
+    as_of = now if month == pd.Period(now, freq='M') else month.end_time
+    print(status(as_of).to_string(index=False, float_format=lambda v: f'{v:,.2f}'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+import json
+import os
+import re
+import threading
+
+from modules import accounts, corrections, process_data, recurring, rollups, search, snapshots
+from modules.lazy import lazy_import
+from modules.metrics import inc, timed
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Rule-based categorization of transaction descriptions.
+#
+# data/category_rules.json holds merchant aliases and an ordered rule list:
+#
+#   {"aliases": {"Amazon": ["amzn", "amazon mktp"]},
+#    "rules": [{"category": "Shopping", "merchant": "Amazon"},
+#              {"category": "Food", "contains": "lunch"},
+#              {"category": "Transport", "regex": "\\b(bus|taxi)\\b", "max_amount": 100},
+#              {"category": "Utilities", "min_amount": 40, "max_amount": 60}]}
+#
+# Each rule has at most one text condition (contains, regex or merchant, all
+# case-insensitive) and optional amount bounds. The first rule that matches
+# wins. All text conditions compile into one regex of optional lookaheads, so a
+# single match per distinct description finds every rule it satisfies. Amount
+# bounds are then applied to whole columns with numpy.
+
+RULES_FILE = os.environ.get('FINANCE_RULES', 'data/category_rules.json')
+UNCATEGORIZED = 'Uncategorized'
+CHUNK_ROWS = 100_000
+
+_active = None
+_active_lock = threading.Lock()
+_job = {'running': False, 'scanned': 0, 'changed': 0, 'error': None}
+_job_lock = threading.Lock()
+
+
+def _text_pattern(rule, aliases):
+    if 'contains' in rule:
+        return re.escape(rule['contains'])
+    if 'regex' in rule:
+        return rule['regex']
+    if 'merchant' in rule:
+        names = aliases.get(rule['merchant'], []) + [rule['merchant']]
+        return '|'.join(re.escape(name) for name in names)
+    return ''
+
+
+class RuleSet:
+    """Rules compiled into one regex over descriptions plus per-rule amount bounds"""
+
+    def __init__(self, config):
+        self.config = config
+        rules = config.get('rules', [])
+        aliases = config.get('aliases', {})
+        for i, rule in enumerate(rules):
+            if 'category' not in rule:
+                raise ValueError(f"Rule {i} has no category")
+            if sum(key in rule for key in ('contains', 'regex', 'merchant')) > 1:
+                raise ValueError(f"Rule {i} has more than one of contains/regex/merchant")
+            if 'regex' in rule:
+                try:
+                    re.compile(rule['regex'])
+                except re.error as e:
+                    raise ValueError(f"Rule {i} has an invalid regex: {e}") from e
+        self.categories = [rule['category'] for rule in rules]
+        self.low = np.array([rule.get('min_amount', -np.inf) for rule in rules], dtype=float)
+        self.high = np.array([rule.get('max_amount', np.inf) for rule in rules], dtype=float)
+        self.bounded = np.array([('min_amount' in rule or 'max_amount' in rule) for rule in rules], dtype=bool)
+        self.pattern = re.compile(
+            '^' + ''.join(f'(?:(?=.*?(?P<r{i}>{_text_pattern(rule, aliases)})))?' for i, rule in enumerate(rules)),
+            re.IGNORECASE | re.DOTALL
+        )
+        self.groups = [self.pattern.groupindex[f'r{i}'] - 1 for i in range(len(rules))]
+
+    def candidates(self, description):
+        """Rules whose text matches, in priority order, up to the first with no amount bounds"""
+        groups = self.pattern.match(description).groups()
+        matched = []
+        for i, g in enumerate(self.groups):
+            if groups[g] is not None:
+                matched.append(i)
+                if not self.bounded[i]:
+                    break
+        return matched
+
+    def apply(self, descriptions, amounts):
+        """Category for every row (UNCATEGORIZED where no rule matches)"""
+        codes, uniques = pd.factorize(pd.Series(descriptions).fillna('').astype(str))
+        result = np.full(len(codes), -1)
+        if self.categories and len(codes):
+            matched = [self.candidates(u) for u in uniques]
+            table = np.full((len(uniques), max(1, max(map(len, matched)))), -1)
+            for u, rules in enumerate(matched):
+                table[u, :len(rules)] = rules
+            amounts = pd.to_numeric(pd.Series(amounts), errors='coerce').to_numpy(dtype=float)
+            for k in range(table.shape[1]):
+                rule = table[codes, k]
+                # A missing amount only fails rules that have amount bounds
+                in_range = ~self.bounded[rule] | ((amounts >= self.low[rule]) & (amounts <= self.high[rule]))
+                ok = (result < 0) & (rule >= 0) & in_range
+                result[ok] = rule[ok]
+        labels = np.array(self.categories + [UNCATEGORIZED], dtype=object)
+        return labels[result]
+
+
+def load_rules(path=RULES_FILE):
+    """The rules config in path, or an empty one"""
+    if not os.path.exists(path):
+        return {'aliases': {}, 'rules': []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_rules():
+    """The active compiled RuleSet, loaded from RULES_FILE on first use"""
+    global _active
+    with _active_lock:
+        if _active is None:
+            _active = RuleSet(load_rules())
+        return _active
+
+
+def _write_json(path, config):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp, path)
+
+
+def save_rules(config):
+    """Validate and activate new rules, then recategorize history in the background"""
+    global _active
+    ruleset = RuleSet(config)
+    with _active_lock:
+        _write_json(RULES_FILE, config)
+        _active = ruleset
+    start_recategorize()
+
+
+@timed('finance_data_seconds', count_rows=True)
+def fill_missing(df):
+    """Categorize rows that arrive without a category (bank feeds, imports)"""
+    missing = df['category'].isna() | (df['category'].astype(str).str.strip() == '')
+    if missing.any():
+        df = df.copy()
+        df.loc[missing, 'category'] = get_rules().apply(df.loc[missing, 'description'], df.loc[missing, 'amount'])
+        inc('finance_categorized_rows_total', int(missing.sum()))
+    return df
+
+
+def suggest(description, amount=None):
+    """Category the rules give a single description, or None"""
+    if not description:
+        return None
+    category = get_rules().apply([description], [amount if amount is not None else np.nan])[0]
+    return None if category == UNCATEGORIZED else category
+
+
+# ----- Recategorization -----
+
+def _applied_path():
+    return os.path.splitext(RULES_FILE)[0] + '.applied.json'
+
+
+def _changes(chunk, previous, current):
+    """Rows of a chunk to move, and their new categories
+
+    A row is only rewritten if it is uncategorized or still carries what the
+    previously applied rules gave it, so categories chosen by hand survive.
+    """
+    proposed = current.apply(chunk['description'], chunk['amount'])
+    category = chunk['category'].fillna('').astype(str).to_numpy()
+    automatic = (category == UNCATEGORIZED) | (category == '')
+    if previous is not None:
+        automatic |= category == previous.apply(chunk['description'], chunk['amount'])
+    changed = automatic & (category != proposed)
+    return changed, proposed
+
+
+def _moved(rows, categories):
+    """rows with their new categories, and new types where the stored type was derived from the old category
+
+    A type that differs from what the old category gives was chosen by hand
+    (or by the source) and is kept, as corrections do.
+    """
+    moved = rows.assign(category=categories)
+    if 'type' in rows:
+        stored = rows['type'].astype(object).where(rows['type'].notna(), None)
+        derived = pd.isna(stored.to_numpy()) | (stored.str.lower().to_numpy() == process_data.infer_types(rows[['category']]))
+        moved['type'] = np.where(derived, process_data.infer_types(moved[['category']]), stored.to_numpy())
+    return moved
+
+
+def _recategorize_csv(previous, current, chunk_rows):
+    path = process_data.CSV_FILE
+    if not os.path.exists(path):
+        return 0
+    tmp = path + '.recategorize.tmp'
+    scanned = changed_total = 0
+    # Holding the write lock keeps inserts from appending to the file being rewritten
+    with process_data._write_lock:
+        # Rows are compared as stored, so pending corrections go into the file first
+        corrections.fold_csv(chunk_rows)
+        deleted = corrections.deleted_ids()
+        for i, raw in enumerate(pd.read_csv(path, chunksize=chunk_rows)):
+            chunk = raw.rename(columns=lambda c: c.strip().lower())
+            changed, proposed = _changes(chunk, previous, current)
+            # Deleted rows stay in the file, but out of the rollup
+            changed &= ~chunk.index.isin(deleted)
+            if changed.any():
+                moved = _moved(chunk[changed], proposed[changed])
+                rollups.apply(chunk[changed], -1)
+                for column in ('category', 'type'):
+                    if column in chunk:
+                        raw.loc[changed, raw.columns[list(chunk.columns).index(column)]] = moved[column].to_numpy()
+                rollups.apply(moved)
+            raw.to_csv(tmp, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            scanned += len(chunk)
+            changed_total += int(changed.sum())
+            _progress(scanned, changed_total)
+        if changed_total:
+            os.replace(tmp, path)
+        elif os.path.exists(tmp):
+            os.remove(tmp)
+    return changed_total
+
+
+def _recategorize_db(engine, previous, current, chunk_rows):
+    from sqlalchemy import bindparam, text
+    update = text("UPDATE transactions SET category = :category, type = :type WHERE id IN :ids").bindparams(
+        bindparam('ids', expanding=True))
+    last_id, scanned, changed_total = -1, 0, 0
+    # Keyset pagination on id: each chunk is one indexed range scan, and rows
+    # inserted while the job runs are picked up by the later chunks
+    while True:
+        # Each chunk is read, rewritten and folded into the rollup under the write
+        # lock, so no rollup build or correction lands in between; writers wait
+        # for one chunk at most
+        with process_data._write_lock:
+            chunk = pd.read_sql(
+                text("SELECT id, date, category, amount, description, type, currency FROM transactions "
+                     "WHERE id > :last ORDER BY id LIMIT :n"),
+                engine, params={'last': last_id, 'n': chunk_rows})
+            if chunk.empty:
+                break
+            changed, proposed = _changes(chunk, previous, current)
+            if changed.any():
+                moved = _moved(chunk[changed], proposed[changed])
+                with engine.begin() as conn:
+                    for (category, kind), rows in moved.groupby(['category', 'type']):
+                        conn.execute(update, {'category': category, 'type': kind, 'ids': rows['id'].tolist()})
+                rollups.apply(chunk[changed], -1)
+                rollups.apply(moved)
+        last_id = int(chunk['id'].iloc[-1])
+        scanned += len(chunk)
+        changed_total += int(changed.sum())
+        _progress(scanned, changed_total)
+    return changed_total
+
+
+def _progress(scanned, changed):
+    with _job_lock:
+        _job['scanned'], _job['changed'] = scanned, changed
+
+
+@timed('finance_data_seconds')
+def recategorize(chunk_rows=CHUNK_ROWS):
+    """Re-apply the active rules to stored rows in chunks; returns the number of rows changed"""
+    current = get_rules()
+    applied = _applied_path()
+    previous = RuleSet(load_rules(applied)) if os.path.exists(applied) else None
+    engine = process_data.get_engine()
+    if engine is not None:
+        changed = _recategorize_db(engine, previous, current, chunk_rows)
+    else:
+        changed = _recategorize_csv(previous, current, chunk_rows)
+    _write_json(applied, current.config)
+    if changed:
+        process_data.reset_category_index()
+        search.reset()
+        recurring.reset()
+        # Balances follow each row's type, which may have changed with its category
+        accounts.reset()
+        with process_data._write_lock:
+            snapshots.rebase('recategorize')
+        process_data.bump_data_version()
+    inc('finance_recategorized_rows_total', changed)
+    return changed
+
+
+def _run_job(chunk_rows):
+    try:
+        recategorize(chunk_rows)
+    except Exception as e:
+        print(f"Recategorization failed: {e}")
+        with _job_lock:
+            _job['error'] = str(e)
+    finally:
+        with _job_lock:
+            _job['running'] = False
+
+
+def start_recategorize(chunk_rows=CHUNK_ROWS):
+    """Run recategorize() on a background thread unless a run is already going"""
+    with _job_lock:
+        if _job['running']:
+            return False
+        _job.update(running=True, scanned=0, changed=0, error=None)
+    threading.Thread(target=_run_job, args=(chunk_rows,), daemon=True, name='recategorize').start()
+    return True
+
+
+def job_status():
+    """Progress of the latest recategorization run"""
+    with _job_lock:
+        return dict(_job)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Categorize descriptions or recategorize stored transactions')
+    parser.add_argument('description', nargs='?', help='print the category the rules give this description')
+    parser.add_argument('--amount', type=float, default=None)
+    parser.add_argument('--recategorize', action='store_true', help='re-apply the rules file to stored transactions')
+    args = parser.parse_args(argv)
+
+    if args.description is not None:
+        print(suggest(args.description, args.amount) or UNCATEGORIZED)
+    if args.recategorize:
+        print(f"Recategorized {recategorize():,} rows")
+
+
+if __name__ == '__main__':
+    main()
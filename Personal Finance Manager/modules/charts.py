@@ -23,12 +23,16 @@
 #     fig = px.funnel(df, x = 'Category', y = 'Amount', title='Expense Distribution')
 #     return fig
 
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import pandas as pd
 from datetime import datetime
 
+from modules import fx
+from modules.lazy import lazy_import
+from modules.metrics import timed
+
+px = lazy_import('plotly.express')
+go = lazy_import('plotly.graph_objects')
+pd = lazy_import('pandas')
+
 # Modern sophisticated color palette
 COLOR_SEQ = [
     '#667eea', '#764ba2', '#f093fb', '#f5576c', '#4facfe', '#00f2fe',
@@ -43,6 +47,7 @@ GRADIENT_COLORS = [
     'linear-gradient(135deg, #43e97b 0%, #38f9d7 100%)'
 ]
 
+@timed('finance_chart_seconds', label='chart')
 def create_area_chart(df):
     fig = px.area(
         df, 
@@ -64,7 +69,8 @@ def create_area_chart(df):
     )
     return fig
 
-def create_bar_chart(df):
+@timed('finance_chart_seconds', label='chart')
+def create_bar_chart(df, currency=None):
     fig = px.bar(
         df,
         x='Date',
@@ -76,7 +82,7 @@ def create_bar_chart(df):
     )
     fig.update_layout(
         xaxis_title='Date',
-        yaxis_title='Amount ($)',
+        yaxis_title=f'Amount ({fx.symbol(currency).strip()})',
         font=dict(family='Inter, sans-serif', size=14, color='#0a1f44'),
         plot_bgcolor='#f8f9fa',
         paper_bgcolor='#f8f9fa',
@@ -91,6 +97,7 @@ def create_bar_chart(df):
 
 
 
+@timed('finance_chart_seconds', label='chart')
 def create_line_chart(df):
     fig = px.line(
         df,
@@ -112,6 +119,7 @@ def create_line_chart(df):
     )
     return fig
 
+@timed('finance_chart_seconds', label='chart')
 def create_pie_chart(df):
     fig = px.pie(
         df,
@@ -130,6 +138,7 @@ def create_pie_chart(df):
     )
     return fig
 
+@timed('finance_chart_seconds', label='chart')
 def create_funnel_chart(df):
     fig = px.funnel(
         df,
@@ -148,6 +157,7 @@ def create_funnel_chart(df):
     return fig
 
 # Advanced Chart Functions
+@timed('finance_chart_seconds', label='chart')
 def create_advanced_area_chart(df):
     """Modern area chart with gradients and enhanced styling"""
     fig = px.area(
@@ -200,7 +210,8 @@ def create_advanced_area_chart(df):
     
     return fig
 
-def create_advanced_pie_chart(df):
+@timed('finance_chart_seconds', label='chart')
+def create_advanced_pie_chart(df, currency=None):
     """Modern pie chart with enhanced styling and animations"""
     fig = px.pie(
         df,
@@ -217,7 +228,7 @@ def create_advanced_pie_chart(df):
             line=dict(color='#ffffff', width=2),
             opacity=0.9
         ),
-        hovertemplate='<b>%{label}</b><br>Amount: $%{value:,.2f}<br>Percentage: %{percent}<extra></extra>'
+        hovertemplate=f'<b>%{{label}}</b><br>Amount: {fx.symbol(currency)}%{{value:,.2f}}<br>Percentage: %{{percent}}<extra></extra>'
     )
     
     fig.update_layout(
@@ -243,13 +254,25 @@ def create_advanced_pie_chart(df):
     
     return fig
 
-def create_trend_chart(df):
-    """Advanced trend analysis with moving averages"""
+def _rgba(color, alpha):
+    """'#rrggbb' as an rgba() string with the given opacity"""
+    r, g, b = (int(color[i:i + 2], 16) for i in (1, 3, 5))
+    return f'rgba({r},{g},{b},{alpha})'
+
+@timed('finance_chart_seconds', label='chart')
+def create_trend_chart(df, forecast=None, currency=None):
+    """Advanced trend analysis with moving averages, and forecast bands when a forecast is given
+
+    forecast is a frame from modules.forecast (month, category, forecast,
+    lower, upper); its monthly amounts are drawn as daily averages to share the
+    axis with the daily totals.
+    """
     if df.empty:
         return go.Figure()
+    money = fx.symbol(currency)
     
     # Convert to datetime and sort
-    df['Date'] = pd.to_datetime(df['Date'])
+    df['Date'] = pd.to_datetime(df['Date'], format='mixed')
     df = df.sort_values('Date')
     
     # Calculate daily totals
@@ -275,7 +298,7 @@ def create_trend_chart(df):
                 size=6,
                 opacity=0.7
             ),
-            hovertemplate=f'<b>{category}</b><br>Date: %{{x}}<br>Amount: $%{{y:,.2f}}<extra></extra>'
+            hovertemplate=f'<b>{category}</b><br>Date: %{{x}}<br>Amount: {money}%{{y:,.2f}}<extra></extra>'
         ))
         
         fig.add_trace(go.Scatter(
@@ -288,8 +311,39 @@ def create_trend_chart(df):
                 width=3,
                 dash='solid'
             ),
-            hovertemplate=f'<b>{category} Trend</b><br>Date: %{{x}}<br>7-Day Avg: $%{{y:,.2f}}<extra></extra>'
+            hovertemplate=f'<b>{category} Trend</b><br>Date: %{{x}}<br>7-Day Avg: {money}%{{y:,.2f}}<extra></extra>'
         ))
+        
+        if forecast is not None:
+            projected = forecast[forecast['category'] == category]
+            if not projected.empty:
+                color = COLOR_SEQ[i % len(COLOR_SEQ)]
+                months = pd.to_datetime(projected['month'])
+                days = months.dt.days_in_month.to_numpy()
+                mid = list(months + pd.Timedelta(days=14))
+                fig.add_trace(go.Scatter(
+                    x=mid + mid[::-1],
+                    y=list(projected['upper'] / days) + list(projected['lower'] / days)[::-1],
+                    fill='toself',
+                    fillcolor=_rgba(color, 0.15),
+                    line=dict(width=0),
+                    legendgroup=f'{category} forecast',
+                    showlegend=False,
+                    hoverinfo='skip'
+                ))
+                fig.add_trace(go.Scatter(
+                    x=mid,
+                    y=projected['forecast'] / days,
+                    mode='lines+markers',
+                    name=f'{category} (Forecast)',
+                    legendgroup=f'{category} forecast',
+                    line=dict(color=color, width=2, dash='dash'),
+                    marker=dict(color=color, size=5),
+                    customdata=projected[['forecast', 'lower', 'upper']].to_numpy(),
+                    hovertemplate=f'<b>{category} Forecast</b><br>Month: %{{x|%b %Y}}<br>'
+                                  f'Daily: {money}%{{y:,.2f}}<br>Total: {money}%{{customdata[0]:,.2f}} '
+                                  f'({money}%{{customdata[1]:,.0f}}–{money}%{{customdata[2]:,.0f}})<extra></extra>'
+                ))
     
     fig.update_layout(
         title=dict(
@@ -309,7 +363,7 @@ def create_trend_chart(df):
         yaxis=dict(
             showgrid=True,
             gridcolor='#e5e7eb',
-            title='Amount ($)',
+            title=f'Amount ({money.strip()})',
             title_font=dict(size=14, color='#6b7280')
         ),
         legend=dict(
@@ -326,13 +380,15 @@ def create_trend_chart(df):
     
     return fig
 
-def create_comparison_chart(df):
+@timed('finance_chart_seconds', label='chart')
+def create_comparison_chart(df, currency=None):
     """Month-over-month comparison chart"""
     if df.empty:
         return go.Figure()
+    money = fx.symbol(currency)
     
     # Convert to datetime and extract month-year
-    df['Date'] = pd.to_datetime(df['Date'])
+    df['Date'] = pd.to_datetime(df['Date'], format='mixed')
     df['MonthYear'] = df['Date'].dt.to_period('M')
     
     # Calculate monthly totals by category
@@ -349,7 +405,7 @@ def create_comparison_chart(df):
             x=pivot_data.index.astype(str),
             y=pivot_data[category],
             marker_color=COLOR_SEQ[i % len(COLOR_SEQ)],
-            hovertemplate=f'<b>{category}</b><br>Month: %{{x}}<br>Amount: $%{{y:,.2f}}<extra></extra>'
+            hovertemplate=f'<b>{category}</b><br>Month: %{{x}}<br>Amount: {money}%{{y:,.2f}}<extra></extra>'
         ))
     
     fig.update_layout(
@@ -370,7 +426,7 @@ def create_comparison_chart(df):
         yaxis=dict(
             showgrid=True,
             gridcolor='#e5e7eb',
-            title='Amount ($)',
+            title=f'Amount ({money.strip()})',
             title_font=dict(size=14, color='#6b7280')
         ),
         legend=dict(
@@ -0,0 +1,65 @@
+import threading
+from collections import OrderedDict
+
+from modules.metrics import inc
+
+# Request coalescing for bursts of filter changes.
+#
+# single_flight: identical concurrent requests share one computation.
+# is_superseded: a request is dropped once the same browser tab has sent a newer one.
+
+MAX_CLIENTS = 1024
+
+_lock = threading.Lock()
+_in_flight = {}
+_latest_seq = OrderedDict()
+
+
+class _Call:
+    """One in-flight computation that concurrent callers wait on"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def single_flight(key, func, *args, **kwargs):
+    """Run func once for all concurrent callers with the same key and share the result"""
+    with _lock:
+        call = _in_flight.get(key)
+        leader = call is None
+        if leader:
+            call = _in_flight[key] = _Call()
+
+    inc('finance_cache_requests_total', cache='single_flight', result='miss' if leader else 'hit')
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = func(*args, **kwargs)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            del _in_flight[key]
+        call.done.set()
+
+
+def is_superseded(client_id, seq):
+    """Record a request sequence number and tell whether a newer one has been seen"""
+    if client_id is None or seq is None:
+        return False
+    with _lock:
+        latest = _latest_seq.get(client_id)
+        if latest is not None and seq < latest:
+            return True
+        _latest_seq[client_id] = seq
+        _latest_seq.move_to_end(client_id)
+        while len(_latest_seq) > MAX_CLIENTS:
+            _latest_seq.popitem(last=False)
+        return False
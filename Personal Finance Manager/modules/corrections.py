@@ -0,0 +1,342 @@
+import json
+import os
+import threading
+import time
+
+from modules import accounts, budgets, dedup, process_data, recurring, rollups, search, snapshots
+from modules.lazy import lazy_import
+from modules.metrics import inc, timed
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Corrections: updates and deletes of stored transactions, recorded as events.
+#
+# Each event names the transaction by id and holds its values before and after
+# (no after for a delete). Everything derived from the store folds the event in
+# as a delta, the old row out and the new one in: the rollup, account balances,
+# the category dictionary, the search index, duplicate detection and budget
+# alerts. Nothing is rebuilt, except recurring-series detection, whose running
+# gap statistics cannot give a row back and so rebuild on next use.
+#
+# On a database the event is stored in the corrections table and applied to
+# its row in the same transaction, so the table is always the current state.
+# The CSV store is append-only instead: a row's id is its position in the file,
+# events go to a log beside it, and loading replays the latest event per id
+# over the file. Once the log holds COMPACT_EVENTS events it is compacted:
+# folded into a rewritten CSV and started afresh, which keeps replay bounded.
+# Deleted rows stay in the file as tombstones, and their delete events are
+# carried into the new log, so no row ever changes id: ids the browser holds
+# (ledger rows and cursors, the clientside snapshot) stay valid.
+#
+# Duplicate detection forgets a corrected row's old content and learns its new
+# content, so a deleted row can be imported again, and an updated one is not
+# stored twice when re-imported. Rows a sync keyed by the bank's own ids stay
+# known, so syncing a deleted bank transaction again does not bring it back.
+
+LOG_FILE = os.environ.get('FINANCE_CORRECTIONS', '')   # default: beside the CSV store
+COMPACT_EVENTS = 10_000
+CHUNK_ROWS = 100_000
+OPS = ('update', 'delete')
+# Columns a correction may change
+EDITABLE = ('date', 'category', 'amount', 'description', 'type', 'account', 'currency')
+
+_log = None                 # (path, mtime, size, events) of the last log read
+_lock = threading.Lock()
+
+
+def log_path():
+    """Where the CSV store's correction log lives"""
+    return LOG_FILE or os.path.splitext(process_data.CSV_FILE)[0] + '.corrections.jsonl'
+
+
+def _events():
+    """Every event in the CSV store's log, oldest first"""
+    global _log
+    path = log_path()
+    if not os.path.exists(path):
+        return []
+    stat = os.stat(path)
+    with _lock:
+        if _log is None or _log[:3] != (path, stat.st_mtime, stat.st_size):
+            with open(path) as f:
+                _log = (path, stat.st_mtime, stat.st_size, [json.loads(line) for line in f if line.strip()])
+        return _log[3]
+
+
+def _latest(events):
+    """The latest event per id"""
+    return list({e['id']: e for e in events}.values())
+
+
+def _pending(events):
+    """Events not yet folded into the file (carried deletes are)"""
+    return sum(not e.get('carried') for e in events)
+
+
+def deleted_ids():
+    """Ids of the CSV store's deleted rows"""
+    return np.array(sorted(e['id'] for e in _latest(_events()) if e['op'] == 'delete'), dtype='int64')
+
+
+def replay(df, drop_deleted=True):
+    """Rows of the CSV store with the log applied; df is indexed by position in the file
+
+    Works on whole files, chunks read with chunksize (whose index carries on
+    across chunks) and column subsets, whatever the header's case. With
+    drop_deleted=False deleted rows are kept, as they were last stored.
+    """
+    events = _events()
+    if not events:
+        return df
+    latest = pd.DataFrame([{'id': e['id'], 'op': e['op'], **(e.get('after') or {})} for e in events])
+    latest = latest.drop_duplicates('id', keep='last').set_index('id')
+    at = df.index.get_indexer(latest.index)
+    latest, at = latest[at >= 0], at[at >= 0]
+    if not len(at):
+        return df
+    updated = (latest['op'] == 'update').to_numpy()
+    df = df.copy()
+    for name, column in zip(df.columns, process_data.column_names(df.columns)):
+        if column not in latest or not updated.any():
+            continue
+        values = latest[column].to_numpy()[updated]
+        if column == 'amount':
+            values = values.astype(float)
+        elif df[name].dtype != object:
+            df[name] = df[name].astype(object)
+        df.iloc[at[updated], df.columns.get_loc(name)] = values
+    return df.drop(index=df.index[at[~updated]]) if drop_deleted else df
+
+
+def _stored_row(engine, transaction_id):
+    """Current values of one transaction as a dict (id included); ValueError when there is none"""
+    if engine is not None:
+        from sqlalchemy import text
+        columns = ', '.join(['id'] + process_data.TRANSACTION_COLUMNS)
+        with engine.connect() as conn:
+            row = conn.execute(text(f"SELECT {columns} FROM transactions WHERE id = :id"),
+                               {'id': transaction_id}).mappings().first()
+        if row is None:
+            raise ValueError(f"No transaction with id {transaction_id}")
+        row = dict(row)
+        row['date'] = str(row['date'])[:10]
+        row['amount'] = float(row['amount'])
+        return row
+    previous = [e for e in _events() if e['id'] == transaction_id]
+    if previous:
+        if previous[-1]['op'] == 'delete':
+            raise ValueError(f"Transaction {transaction_id} was deleted")
+        return {'id': transaction_id, **previous[-1]['after']}
+    if transaction_id < 0 or not os.path.exists(process_data.CSV_FILE):
+        raise ValueError(f"No transaction with id {transaction_id}")
+    # Skip straight to the row's line; earlier lines are not parsed
+    header = pd.read_csv(process_data.CSV_FILE, nrows=0).columns
+    row = pd.read_csv(process_data.CSV_FILE, header=None, names=header, skiprows=transaction_id + 1, nrows=1)
+    if row.empty:
+        raise ValueError(f"No transaction with id {transaction_id}")
+    row.columns = process_data.column_names(row.columns)
+    row = row[[c for c in row.columns if c in process_data.TRANSACTION_COLUMNS]].iloc[0]
+    values = {column: (None if pd.isna(value) else value) for column, value in row.items()}
+    values['amount'] = float(values['amount'])
+    # Rows stored before a column existed get what loading would give them
+    frame = process_data.fill_columns(pd.DataFrame([values])).reindex(columns=process_data.TRANSACTION_COLUMNS)
+    values = {column: (None if pd.isna(value) else value) for column, value in frame.iloc[0].items()}
+    return {'id': transaction_id, **values}
+
+
+def _corrected(before, changes):
+    """The row after applying changes; a new category without a new type brings its own type"""
+    unknown = set(changes) - set(EDITABLE)
+    if unknown:
+        raise ValueError(f"Cannot change {', '.join(sorted(unknown))}")
+    after = dict(before, **changes)
+    try:
+        if changes.get('date') is not None:
+            after['date'] = pd.Timestamp(changes['date']).strftime('%Y-%m-%d')
+        if changes.get('amount') is not None:
+            after['amount'] = float(changes['amount'])
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Not a valid date or amount: {e}") from e
+    if 'category' in changes and 'type' not in changes:
+        after['type'] = None
+    if not after.get('category'):
+        raise ValueError("A transaction needs a category")
+    frame = pd.DataFrame([after])
+    after['type'] = process_data.infer_types(frame)[0]
+    if after.get('currency'):
+        after['currency'] = str(after['currency']).upper()
+    return after
+
+
+def _store(engine, event):
+    """Record an event and apply it to the store"""
+    if engine is not None:
+        from sqlalchemy import text
+        with engine.begin() as conn:
+            seq = conn.execute(text("SELECT COALESCE(MAX(seq), 0) + 1 FROM corrections")).scalar()
+            conn.execute(text("INSERT INTO corrections (seq, recorded_at, op, transaction_id, old_values, new_values) "
+                              "VALUES (:seq, :recorded_at, :op, :id, :old, :new)"),
+                         {'seq': seq, 'recorded_at': pd.Timestamp(event['at'], unit='s').floor('us').to_pydatetime(),
+                          'op': event['op'], 'id': event['id'], 'old': json.dumps(event['before']),
+                          'new': json.dumps(event['after']) if event['after'] else None})
+            if event['op'] == 'delete':
+                conn.execute(text("DELETE FROM transactions WHERE id = :id"), {'id': event['id']})
+            else:
+                values = {c: event['after'].get(c) for c in process_data.TRANSACTION_COLUMNS}
+                values['date'] = pd.Timestamp(values['date']).date()
+                assignments = ', '.join(f"{c} = :{c}" for c in process_data.TRANSACTION_COLUMNS)
+                conn.execute(text(f"UPDATE transactions SET {assignments} WHERE id = :id"), {**values, 'id': event['id']})
+        return
+    path = log_path()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(event) + '\n')
+
+
+def _fold(removed, added):
+    """Take removed rows out of everything derived from the store and put added ones in"""
+    rollups.apply(removed, -1)
+    rollups.apply(added)
+    # Alerts see the net change: the old amounts count negative
+    budgets.check(pd.concat([removed.assign(amount=-removed['amount'].astype(float)), added], ignore_index=True))
+    accounts.apply(removed, -1)
+    accounts.apply(added)
+    recurring.apply(removed, -1)
+    search.correct(removed['id'], added)
+    dedup.correct(process_data._dedup_prefix(), removed, added)
+    process_data._record_categories(removed, -1)
+    process_data._record_categories(added)
+    snapshots.commit(added, np.setdiff1d(removed['id'], added['id']), note='delete' if added.empty else 'update')
+    process_data.bump_data_version()
+
+
+@timed('finance_data_seconds')
+def correct(transaction_id, op, changes=None):
+    """Record an update or delete of one stored transaction; returns the event"""
+    if op not in OPS:
+        raise ValueError(f"Unknown correction {op!r}; expected one of {', '.join(OPS)}")
+    transaction_id = int(transaction_id)
+    with process_data._write_lock:
+        engine = process_data.get_engine()
+        before = _stored_row(engine, transaction_id)
+        after = _corrected(before, changes or {}) if op == 'update' else None
+        event = {'id': transaction_id, 'op': op, 'at': time.time(),
+                 'before': {c: before.get(c) for c in process_data.TRANSACTION_COLUMNS},
+                 'after': {c: after.get(c) for c in process_data.TRANSACTION_COLUMNS} if after else None}
+        _store(engine, event)
+        removed = pd.DataFrame([before])
+        added = pd.DataFrame([after]) if after else removed.iloc[:0]
+        _fold(removed, added)
+        inc('finance_corrections_total', op=op)
+        if engine is None and _pending(_events()) >= COMPACT_EVENTS:
+            fold_csv()
+    return event
+
+
+def update_transaction(transaction_id, **changes):
+    """Change fields of a stored transaction (see EDITABLE); returns the event"""
+    return correct(transaction_id, 'update', changes)
+
+
+def delete_transaction(transaction_id):
+    """Delete a stored transaction; returns the event"""
+    return correct(transaction_id, 'delete')
+
+
+def history(transaction_id=None, limit=50):
+    """Latest correction events, newest first, optionally for one transaction"""
+    engine = process_data.get_engine()
+    if engine is not None:
+        from sqlalchemy import text
+        where = "WHERE transaction_id = :id" if transaction_id is not None else ""
+        with engine.connect() as conn:
+            rows = conn.execute(text(f"SELECT transaction_id, op, recorded_at, old_values, new_values FROM corrections "
+                                     f"{where} ORDER BY seq DESC LIMIT :limit"),
+                                {'id': transaction_id, 'limit': limit}).all()
+        return [{'id': row[0], 'op': row[1], 'at': pd.Timestamp(row[2]).timestamp(), 'before': json.loads(row[3]),
+                 'after': json.loads(row[4]) if row[4] else None} for row in rows]
+    events = [e for e in _events() if transaction_id is None or e['id'] == transaction_id]
+    return events[::-1][:limit]
+
+
+def fold_csv(chunk_rows=CHUNK_ROWS, drop_deleted=False):
+    """Rewrite the CSV store with the log applied and start a new log; the caller holds process_data._write_lock
+
+    Deleted rows are kept as tombstones, with their delete events carried into
+    the new log, so ids do not change. drop_deleted removes them instead: the
+    rows after them get new ids, so only use it when the store is moving to a
+    database. Returns the number of events folded.
+    """
+    global _log
+    events = _events()
+    path = process_data.CSV_FILE
+    deleted = deleted_ids()
+    if not os.path.exists(path) or not (_pending(events) or (drop_deleted and len(deleted))):
+        return 0
+    tmp = path + '.compact.tmp'
+    for i, chunk in enumerate(pd.read_csv(path, chunksize=chunk_rows)):
+        replay(chunk, drop_deleted).to_csv(tmp, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    os.replace(tmp, path)
+    carried = [] if drop_deleted else [dict(e, carried=True) for e in _latest(events) if e['op'] == 'delete']
+    if carried:
+        log_tmp = log_path() + '.tmp'
+        with open(log_tmp, 'w') as f:
+            f.writelines(json.dumps(event) + '\n' for event in carried)
+        os.replace(log_tmp, log_path())
+    else:
+        os.remove(log_path())
+    with _lock:
+        _log = None
+    if drop_deleted and len(deleted):
+        # Rows after a deleted one moved up: ids held in memory are stale
+        search.reset()
+        snapshots.rebase('compaction')
+    process_data.bump_data_version()
+    folded = len(events) if drop_deleted else _pending(events)
+    print(f"Compacted {folded:,} corrections into {path}")
+    return folded
+
+
+def compact(chunk_rows=CHUNK_ROWS, drop_deleted=False):
+    """Fold the CSV store's correction log into the file; returns the number of events folded"""
+    # Holding the write lock keeps inserts and corrections off the file being rewritten
+    with process_data._write_lock:
+        return fold_csv(chunk_rows, drop_deleted)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Correct or delete stored transactions')
+    parser.add_argument('id', nargs='?', type=int, help='transaction id, as shown in the ledger')
+    parser.add_argument('--delete', action='store_true', help='delete the transaction')
+    for column in EDITABLE:
+        parser.add_argument(f'--{column}', help=f'new {column}')
+    parser.add_argument('--history', action='store_true', help='list recent corrections (of id, if given)')
+    parser.add_argument('--compact', action='store_true', help='fold the CSV correction log into the CSV')
+    args = parser.parse_args(argv)
+
+    if args.compact:
+        if not compact():
+            print("No corrections to compact")
+    elif args.history:
+        for event in history(args.id):
+            when = pd.Timestamp(event['at'], unit='s').strftime('%Y-%m-%d %H:%M')
+            print(f"{when}  {event['op']:<6} #{event['id']}  {event['before']} -> {event['after']}")
+    elif args.id is None:
+        parser.error('give a transaction id, --history or --compact')
+    elif args.delete:
+        delete_transaction(args.id)
+        print(f"Deleted transaction {args.id}")
+    else:
+        changes = {c: getattr(args, c) for c in EDITABLE if getattr(args, c) is not None}
+        if not changes:
+            parser.error('nothing to change; pass --delete or a new value such as --category')
+        update_transaction(args.id, **changes)
+        print(f"Updated transaction {args.id}: {changes}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+import os
+import threading
+import time
+
+from modules import memory
+from modules.lazy import lazy_import
+from modules.metrics import inc
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Duplicate detection for bulk ingestion (CSV re-imports, re-run syncs).
+#
+# Exact duplicates: each row hashes (day, amount in cents, normalized description,
+# occurrence). The occurrence number is the row's position among identical rows,
+# so a statement with two identical coffees on one day stores two distinct keys.
+# A re-import then matches both, while a genuinely new third coffee does not.
+#
+# Exact keys can be scoped to a source (a synced account id). File imports and
+# manual entries share the default scope, as does history when the index is
+# rebuilt, since stored rows do not record their source. Rows that come with a
+# source's own transaction ids are keyed by (scope, id) instead of content, so
+# two identical coffees on different pages of a sync are both kept. Those keys
+# do not survive a rebuild of the index, which only sees content.
+#
+# Near duplicates: the same amount and the same description core (letters only,
+# so reference numbers and punctuation drop out) within a few days of a stored
+# row, e.g. a pending and a posted copy of one charge.
+#
+# Both key sets live in sorted uint64 arrays, probed with searchsorted, so a batch
+# of m rows against n stored ones is O(m log n) with no per-row lookups. New keys
+# go to an append-only delta log, which is folded into the sorted main file once
+# it grows past DELTA_LIMIT. The in-memory copy of a store's index is counted
+# against the memory budget (modules/memory.py); evicting it only means reading
+# it from disk again.
+
+NEAR_WINDOW_DAYS = 3
+DELTA_LIMIT = 1_000_000
+
+# Near keys: the top 40 bits hash (cents, description core), the low 24 bits hold the day
+_DAY_BITS = 24
+_DAY_MASK = (1 << _DAY_BITS) - 1
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _hash(frame):
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def _epoch_days(dates):
+    # Dates repeat heavily, so parse each distinct value once
+    codes, uniques = pd.factorize(dates)
+    days = ((pd.to_datetime(uniques, format='mixed') - pd.Timestamp('1970-01-01')) // pd.Timedelta(days=1)).to_numpy()
+    return days[codes].astype('int64')
+
+
+def normalize_descriptions(texts):
+    """Normalized form (lowercase words and numbers) and letters-only core of each text"""
+    normalized = pd.Series(texts, dtype=object).str.lower().str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
+    core = normalized.str.replace(r'[^a-z]+', ' ', regex=True).str.split().str.join(' ')
+    return normalized, core
+
+
+def _description_hashes(descriptions):
+    """Hashes of the normalized description and of its letters-only core, per row"""
+    codes, uniques = pd.factorize(descriptions.fillna('').astype(str))
+    normalized, core = normalize_descriptions(uniques)
+    return _hash(normalized)[codes], _hash(core)[codes]
+
+
+def fingerprint(df, scope=None):
+    """Content hash (without occurrence) and near key for each row of a transactions DataFrame
+
+    scope separates sources whose rows may legitimately coincide, e.g. two bank
+    accounts each paying the same rent on the same day.
+    """
+    days = _epoch_days(df['date'])
+    cents = np.round(pd.to_numeric(df['amount']).to_numpy() * 100).astype('int64')
+    desc, core = _description_hashes(df['description'])
+    content = _hash(pd.DataFrame({'day': days, 'cents': cents, 'desc': desc}))
+    if scope is not None:
+        content ^= _hash(pd.Series([str(scope)]))[0]
+    near = (_hash(pd.DataFrame({'cents': cents, 'core': core})) & ~np.uint64(_DAY_MASK)) | days.astype('uint64')
+    return content, near
+
+
+def source_keys(ids, scope=None):
+    """Content hashes standing in for rows identified by a source's own transaction ids"""
+    return _hash(pd.DataFrame({'scope': str(scope), 'id': pd.Series(ids, dtype=object).astype(str).to_numpy()}))
+
+
+def exact_keys(content, occurrence):
+    """Exact-duplicate keys: content hash combined with the occurrence number"""
+    return _hash(pd.DataFrame({'content': content, 'occurrence': np.asarray(occurrence, dtype='int64')}))
+
+
+def batch_occurrences(content):
+    """Position of each row among identical rows of the same batch"""
+    return pd.Series(content).groupby(content).cumcount().to_numpy()
+
+
+def _probe(sorted_keys, keys, order, side='left'):
+    # Probing in sorted order walks the index front to back, which is several
+    # times faster than random probes once the index outgrows the CPU cache
+    pos = np.empty(len(keys), dtype='int64')
+    pos[order] = np.searchsorted(sorted_keys, keys[order], side=side)
+    return pos
+
+
+def _in_sorted(sorted_keys, keys):
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype=bool)
+    pos = _probe(sorted_keys, keys, np.argsort(keys))
+    return sorted_keys[np.minimum(pos, len(sorted_keys) - 1)] == keys
+
+
+def _merge(sorted_keys, keys):
+    keys = np.sort(keys)
+    return np.insert(sorted_keys, np.searchsorted(sorted_keys, keys), keys)
+
+
+def _remove(sorted_keys, keys):
+    """sorted_keys without one copy of each of keys (keys not present are ignored)"""
+    keys = np.sort(keys)
+    if not len(keys) or not len(sorted_keys):
+        return sorted_keys
+    # The k-th copy of a key to remove sits k places after the first
+    pos = np.searchsorted(sorted_keys, keys) + batch_occurrences(keys)
+    found = pos < len(sorted_keys)
+    found[found] = sorted_keys[pos[found]] == keys[found]
+    return np.delete(sorted_keys, pos[found])
+
+
+def _in_window(sorted_keys, keys, window):
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype=bool)
+    order = np.argsort(keys)
+    lo = _probe(sorted_keys, keys - np.uint64(window), order)
+    hi = _probe(sorted_keys, keys + np.uint64(window), order, side='right')
+    return hi > lo
+
+
+class HashIndex:
+    """Persistent sorted exact and near key sets for one transaction store"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.main_path = prefix + '.dedup.npz'
+        self.delta_path = prefix + '.dedup.log'
+        self.lock = threading.Lock()
+        self.exact = self.near = None
+        self.delta_exact = self.delta_near = None
+
+    @property
+    def loaded(self):
+        return self.exact is not None
+
+    @property
+    def nbytes(self):
+        return sum(keys.nbytes for keys in (self.exact, self.near, self.delta_exact, self.delta_near) if keys is not None)
+
+    def _resized(self, cost=None):
+        # Only the index kept for a store is accounted for, not one-off indexes
+        if _indexes.get(self.prefix) is self:
+            memory.track('dedup', self.prefix, nbytes=self.nbytes, cost=cost, drop=forget)
+
+    def load(self):
+        """Read the index from disk; False if it has not been built yet"""
+        if not os.path.exists(self.main_path):
+            return False
+        with np.load(self.main_path) as data:
+            self.exact, self.near = data['exact'], data['near']
+        delta = np.fromfile(self.delta_path, dtype='<u8').reshape(-1, 2) if os.path.exists(self.delta_path) else np.empty((0, 2), dtype='<u8')
+        self.delta_exact, self.delta_near = np.sort(delta[:, 0]), np.sort(delta[:, 1])
+        return True
+
+    def build(self, history):
+        """Index every row of history from scratch"""
+        content, near = fingerprint(history) if len(history) else (np.empty(0, 'uint64'), np.empty(0, 'uint64'))
+        self.exact = np.sort(exact_keys(content, batch_occurrences(content)))
+        self.near = np.sort(near)
+        self.delta_exact = np.empty(0, dtype='uint64')
+        self.delta_near = np.empty(0, dtype='uint64')
+        self._save_main()
+
+    def _save_main(self):
+        directory = os.path.dirname(self.main_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.main_path + '.tmp.npz'
+        np.savez(tmp, exact=self.exact, near=self.near)
+        os.replace(tmp, self.main_path)
+        if os.path.exists(self.delta_path):
+            os.remove(self.delta_path)
+
+    def contains(self, keys):
+        return _in_sorted(self.exact, keys) | _in_sorted(self.delta_exact, keys)
+
+    def near_matches(self, keys, window=NEAR_WINDOW_DAYS):
+        return _in_window(self.near, keys, window) | _in_window(self.delta_near, keys, window)
+
+    def stored_counts(self, content):
+        """How many rows with each content hash are already stored (probing occurrence 0, 1, ...)"""
+        uniques, inverse = np.unique(content, return_inverse=True)
+        counts = np.zeros(len(uniques), dtype='int64')
+        pending = np.arange(len(uniques))
+        while len(pending):
+            present = self.contains(exact_keys(uniques[pending], counts[pending]))
+            pending = pending[present]
+            counts[pending] += 1
+        return counts[inverse]
+
+    def add(self, exact, near):
+        """Record keys of newly stored rows; folds the delta log into the main file when large"""
+        with open(self.delta_path, 'ab') as f:
+            f.write(np.column_stack([exact, near]).astype('<u8').tobytes())
+        self.delta_exact = _merge(self.delta_exact, exact)
+        self.delta_near = _merge(self.delta_near, near)
+        if len(self.delta_exact) > DELTA_LIMIT:
+            self.compact()
+        self._resized()
+
+    def remove(self, exact, near):
+        """Forget keys of rows no longer stored; rewrites the main file"""
+        self.exact = _remove(np.sort(np.concatenate([self.exact, self.delta_exact])), exact)
+        self.near = _remove(np.sort(np.concatenate([self.near, self.delta_near])), near)
+        self.delta_exact = np.empty(0, dtype='uint64')
+        self.delta_near = np.empty(0, dtype='uint64')
+        self._save_main()
+        self._resized()
+
+    def compact(self):
+        """Merge the delta log into the sorted main file"""
+        self.exact = np.sort(np.concatenate([self.exact, self.delta_exact]))
+        self.near = np.sort(np.concatenate([self.near, self.delta_near]))
+        self.delta_exact = np.empty(0, dtype='uint64')
+        self.delta_near = np.empty(0, dtype='uint64')
+        self._save_main()
+
+    def __len__(self):
+        return len(self.exact) + len(self.delta_exact) if self.loaded else 0
+
+
+def get_index(prefix, load_history):
+    """The index stored at prefix, built from load_history() the first time"""
+    with _indexes_lock:
+        index = _indexes.get(prefix)
+        if index is None:
+            index = _indexes[prefix] = HashIndex(prefix)
+    with index.lock:
+        if not index.loaded:
+            start = time.perf_counter()
+            if not index.load():
+                index.build(load_history())
+            index._resized(cost=time.perf_counter() - start)
+    return index
+
+
+def reset(prefix):
+    """Forget the index stored at prefix, on disk and in memory; it is rebuilt on next use"""
+    with _indexes_lock:
+        index = _indexes.pop(prefix, None) or HashIndex(prefix)
+    with index.lock:
+        for path in (index.main_path, index.delta_path):
+            if os.path.exists(path):
+                os.remove(path)
+    memory.forget('dedup', prefix)
+
+
+def correct(prefix, removed, added):
+    """Swap the keys of corrected rows in the index stored at prefix: removed rows out, added ones in
+
+    An index not built yet is left alone: building it reads the corrected store.
+    Keys are in the default scope, so rows keyed by a sync (by scope or by the
+    source's id) stay known, and syncing a deleted bank transaction again does
+    not bring it back.
+    """
+    with _indexes_lock:
+        index = _indexes.get(prefix)
+        if index is None:
+            index = _indexes[prefix] = HashIndex(prefix)
+    with index.lock:
+        if not index.loaded and not index.load():
+            return
+        if len(removed):
+            content, near = fingerprint(removed)
+            # The last stored copy of each content goes
+            occurrence = index.stored_counts(content) - 1 - batch_occurrences(content)
+            present = occurrence >= 0
+            index.remove(exact_keys(content[present], occurrence[present]), near)
+        if len(added):
+            content, near = fingerprint(added)
+            index.add(exact_keys(content, batch_occurrences(content) + index.stored_counts(content)), near)
+
+
+def forget(prefix):
+    """Drop the in-memory copy of the index stored at prefix; it is read from disk again on next use"""
+    with _indexes_lock:
+        _indexes.pop(prefix, None)
+    memory.forget('dedup', prefix)
+
+
+class Plan:
+    """Which rows of a batch to write, and the index keys to record for them"""
+    def __init__(self, keep, exact, near, duplicates, near_duplicates):
+        self.keep = keep
+        self.exact = exact
+        self.near = near
+        self.duplicates = duplicates
+        self.near_duplicates = near_duplicates
+
+
+def plan(df, index, dedupe=True, skip_near=False, scope=None, window=NEAR_WINDOW_DAYS, ids=None):
+    """Classify a batch against the index
+
+    With dedupe, rows already stored are dropped and near duplicates are counted
+    (dropped too with skip_near). Without it every row is kept and only keyed,
+    so that later imports of the same rows are recognised. Exact matching is
+    per scope, by content or, given the source's ids, by id; near matching spans
+    all scopes.
+    """
+    content, near = fingerprint(df, scope)
+    if ids is not None:
+        content = source_keys(ids, scope)
+    stored = index.stored_counts(content)
+    occurrence = batch_occurrences(content)
+    keep = np.ones(len(df), dtype=bool)
+    duplicate = np.zeros(len(df), dtype=bool)
+    near_duplicate = np.zeros(len(df), dtype=bool)
+    if dedupe:
+        # The k-th identical row of the batch is a duplicate if k rows like it are already stored
+        duplicate = occurrence < stored
+        if ids is not None:
+            # An id seen twice is one transaction, even within a batch
+            duplicate |= occurrence > 0
+        near_duplicate = ~duplicate & index.near_matches(near, window)
+        keep = ~duplicate & ~near_duplicate if skip_near else ~duplicate
+    else:
+        occurrence = occurrence + stored
+    inc('finance_dedup_rows_total', int(duplicate.sum()), result='duplicate')
+    inc('finance_dedup_rows_total', int(near_duplicate.sum()), result='near_duplicate')
+    inc('finance_dedup_rows_total', int(keep.sum()), result='kept')
+    return Plan(keep, exact_keys(content[keep], occurrence[keep]), near[keep], int(duplicate.sum()), int(near_duplicate.sum()))
@@ -0,0 +1,217 @@
+import os
+
+from modules import accounts, categorize, corrections, dedup, fx, migrations, process_data, recurring, rollups, search, snapshots
+from modules.lazy import lazy_import
+from modules.metrics import timed
+
+pd = lazy_import('pandas')
+
+# Embedded database backends: DuckDB or SQLite in one local file, no server.
+# Point FINANCE_DB_URL at one and import the existing CSV once:
+#
+#   FINANCE_DB_URL=duckdb:///data/finance.duckdb python -m modules.embedded data/transactions.csv
+#   FINANCE_DB_URL=sqlite:///data/finance.db python -m modules.embedded data/transactions.csv
+#
+# (DuckDB needs the duckdb and duckdb_engine packages.) The queries pushed down
+# to PostgreSQL, such as the rollup and category GROUP BYs, ledger keyset pages
+# and budget upserts, are written in SQL these run unchanged. Full-text search
+# is the exception: without tsvector, the ledger searches with the in-process
+# index (modules/search.py).
+#
+# DuckDB runs each query vectorized across THREADS cores. Its per-row-group
+# min/max zone maps let date ranges skip data without an index, since
+# transactions arrive in date order. SQLite runs in WAL mode, so readers never
+# wait on the writer, with the (category, date) and (date, id) indexes of
+# finance.sql.
+
+EMBEDDED = ('duckdb', 'sqlite')
+THREADS = int(os.environ.get('FINANCE_DB_THREADS', os.cpu_count() or 1))
+IMPORT_CHUNK_ROWS = 500_000
+
+_BUDGETS = ("CREATE TABLE IF NOT EXISTS budgets (category VARCHAR(50) PRIMARY KEY, amount NUMERIC NOT NULL, "
+            "alert_at NUMERIC NOT NULL DEFAULT 0.8)")
+_ACCOUNTS = ("CREATE TABLE IF NOT EXISTS accounts (name VARCHAR(50) PRIMARY KEY, "
+             "kind VARCHAR(20) NOT NULL DEFAULT 'checking', opening_balance NUMERIC NOT NULL DEFAULT 0, "
+             "currency VARCHAR(3) NOT NULL DEFAULT '{currency}')")
+_CORRECTIONS = ("CREATE TABLE IF NOT EXISTS corrections (seq BIGINT PRIMARY KEY, recorded_at TIMESTAMP NOT NULL, "
+                "op VARCHAR(6) NOT NULL CHECK (op IN ('update', 'delete')), transaction_id BIGINT NOT NULL, "
+                "old_values TEXT NOT NULL, new_values TEXT)")
+# {currency} is filled in with fx.BASE_CURRENCY when the schema is created
+TABLES = {
+    'duckdb': [
+        "CREATE SEQUENCE IF NOT EXISTS transactions_id_seq",
+        "CREATE TABLE IF NOT EXISTS transactions (id BIGINT PRIMARY KEY DEFAULT nextval('transactions_id_seq'), "
+        "date DATE NOT NULL, category VARCHAR NOT NULL, amount DOUBLE NOT NULL, description VARCHAR, "
+        "type VARCHAR(10) NOT NULL DEFAULT 'expense' CHECK (type IN ('income', 'expense', 'transfer')), "
+        "account VARCHAR NOT NULL DEFAULT 'Main', transfer_id VARCHAR(32), "
+        "currency VARCHAR(3) NOT NULL DEFAULT '{currency}')",
+        _BUDGETS,
+        _ACCOUNTS,
+        _CORRECTIONS
+    ],
+    'sqlite': [
+        "CREATE TABLE IF NOT EXISTS transactions (id INTEGER PRIMARY KEY, date DATE NOT NULL, "
+        "category VARCHAR(50) NOT NULL, amount NUMERIC NOT NULL, description TEXT, "
+        "type VARCHAR(10) NOT NULL DEFAULT 'expense' CHECK (type IN ('income', 'expense', 'transfer')), "
+        "account VARCHAR(50) NOT NULL DEFAULT 'Main', transfer_id VARCHAR(32), "
+        "currency VARCHAR(3) NOT NULL DEFAULT '{currency}')",
+        _BUDGETS,
+        _ACCOUNTS,
+        _CORRECTIONS
+    ]
+}
+INDEXES = {
+    'duckdb': {},
+    'sqlite': {
+        'idx_transactions_category_date': "CREATE INDEX IF NOT EXISTS idx_transactions_category_date ON transactions (category, date)",
+        'idx_transactions_date_id': "CREATE INDEX IF NOT EXISTS idx_transactions_date_id ON transactions (date, id)",
+        'idx_transactions_account_date': "CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account, date)"
+    }
+}
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",        # 64 MB page cache
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY"
+]
+
+
+def backend(url):
+    """Backend name of a database URL ('postgresql', 'duckdb', 'sqlite', ...)"""
+    from sqlalchemy.engine import make_url
+    return make_url(url).get_backend_name()
+
+
+def engine_options(url):
+    """Extra create_engine() arguments for a database URL"""
+    name = backend(url)
+    if name not in EMBEDDED:
+        return {}
+    from sqlalchemy.engine import make_url
+    database = make_url(url).database
+    if database and database != ':memory:' and os.path.dirname(database):
+        os.makedirs(os.path.dirname(database), exist_ok=True)
+    if name == 'duckdb':
+        return {'connect_args': {'config': {'threads': THREADS}}}
+    return {}
+
+
+def prepare(engine):
+    """Tune connections and create the schema of an embedded database; no-op for servers"""
+    name = engine.dialect.name
+    if name not in EMBEDDED:
+        return
+    if name == 'sqlite':
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'connect')
+        def _pragmas(dbapi_connection, _):
+            cursor = dbapi_connection.cursor()
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+            cursor.close()
+    create_schema(engine)
+
+
+def create_schema(engine):
+    """Create the tables and indexes that do not exist yet"""
+    from sqlalchemy import text
+    name = engine.dialect.name
+    with engine.begin() as conn:
+        for statement in TABLES[name]:
+            conn.execute(text(statement.format(currency=fx.BASE_CURRENCY)))
+    # Tables created by an older version get their new columns before indexes refer to them
+    migrations.apply(engine)
+    with engine.begin() as conn:
+        for statement in INDEXES[name].values():
+            conn.execute(text(statement))
+
+
+def store_prefix(engine):
+    """Path prefix for files kept alongside an embedded database (None for servers)"""
+    if engine.dialect.name not in EMBEDDED or not engine.url.database or engine.url.database == ':memory:':
+        return None
+    return os.path.splitext(engine.url.database)[0]
+
+
+def _clean(chunk):
+    """A CSV chunk as rows ready to store: lowercase columns, ISO dates, categories filled in"""
+    chunk.columns = process_data.column_names(chunk.columns)
+    chunk = chunk.reindex(columns=process_data.TRANSACTION_COLUMNS)
+    chunk['date'] = pd.to_datetime(chunk['date'], format='mixed').dt.date
+    chunk['amount'] = pd.to_numeric(chunk['amount'])
+    chunk = categorize.fill_missing(chunk)
+    return accounts.prepare(chunk.assign(type=process_data.infer_types(chunk)))
+
+
+def _insert(conn, chunk):
+    from sqlalchemy import text
+    if conn.dialect.name == 'duckdb':
+        # Hand DuckDB the frame itself; it scans the columns directly instead of binding row by row
+        conn.execute(text("register(:name, :df)"), {'name': 'import_chunk', 'df': chunk})
+        columns = ', '.join(process_data.TRANSACTION_COLUMNS)
+        conn.execute(text(f"INSERT INTO transactions ({columns}) SELECT {columns} FROM import_chunk"))
+    else:
+        chunk.to_sql('transactions', conn, if_exists='append', index=False, chunksize=IMPORT_CHUNK_ROWS)
+
+
+@timed('finance_data_seconds')
+def bulk_import(path, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Load a transactions CSV into the configured database; returns the number of rows stored
+
+    An empty store is loaded in bulk, in one transaction, with indexes built
+    afterwards. A store that already holds rows goes through
+    process_data.import_csv, which skips rows already stored.
+    """
+    from sqlalchemy import text
+    engine = process_data.get_engine()
+    if engine is None:
+        raise RuntimeError(f"No database at {process_data.DB_URL}")
+    if os.path.abspath(path) == os.path.abspath(process_data.CSV_FILE):
+        # The CSV store's pending corrections go with it, and its deleted rows stay behind
+        corrections.compact(drop_deleted=True)
+    with engine.connect() as conn:
+        stored = conn.execute(text("SELECT COUNT(*) FROM transactions")).scalar()
+    if stored:
+        return process_data.import_csv(path)
+
+    name = engine.dialect.name
+    total = 0
+    with process_data._write_lock:
+        with engine.begin() as conn:
+            for index in INDEXES.get(name, {}):
+                conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+            for chunk in pd.read_csv(path, chunksize=chunk_rows):
+                chunk = _clean(chunk)
+                _insert(conn, chunk)
+                total += len(chunk)
+                print(f"Imported {total:,} rows")
+        if name in EMBEDDED:
+            create_schema(engine)
+            with engine.begin() as conn:
+                conn.execute(text('ANALYZE' if name == 'sqlite' else 'CHECKPOINT'))
+        # Everything derived from the store, including the duplicate index on disk, starts over
+        dedup.reset(process_data._dedup_prefix())
+        process_data.reset_category_index()
+        rollups.reset()
+        search.reset()
+        recurring.reset()
+        accounts.reset()
+        snapshots.rebase('import')
+        process_data.bump_data_version()
+    return total
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Import a transactions CSV into the database set by FINANCE_DB_URL')
+    parser.add_argument('csv', nargs='?', default=process_data.CSV_FILE, help='CSV to import (default: %(default)s)')
+    parser.add_argument('--chunk-rows', type=int, default=IMPORT_CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    print(f"Stored {bulk_import(args.csv, args.chunk_rows):,} rows in {process_data.DB_URL}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+import threading
+
+from modules import process_data, recurring, rollups
+from modules.lazy import lazy_import
+from modules.metrics import inc, timed
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Cash-flow forecasts per category and net, one to HORIZON months ahead.
+#
+# History is the month x category rollup (modules/rollups.py) as one matrix of
+# complete months, so every model runs over all categories at once:
+#   seasonal naive       the same month a year earlier
+#   exponential smoothing the smoothed level, with each category's smoothing
+#                        factor picked from ALPHAS by one-step-ahead error
+# Each category uses whichever model had the smaller error over the last year of
+# history (seasonal naive needs two years). Active recurring charges
+# (modules/recurring.py) put a floor under the result: a yearly insurance
+# premium is expected in its month even where smoothing averages it away. The
+# band is the chosen model's error spread, widening with the horizon.
+#
+# Forecasts are computed on a background thread and cached per data version;
+# readers get the latest finished forecast and never wait for a rebuild.
+
+HORIZON = 12
+SEASON = 12
+ALPHAS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+INTERVAL_Z = 1.28           # 80% band
+NET = 'Net cash flow'
+
+_result = None              # (data version, forecast frame)
+_job = {'running': False, 'version': None, 'error': None}
+_job_lock = threading.Lock()
+_done = threading.Event()
+
+
+def _history(rollup, last_date):
+    """Month x category amounts of every complete month up to last_date, oldest first"""
+    last = pd.Timestamp(last_date)
+    end = last.to_period('M') if last.day == last.days_in_month else last.to_period('M') - 1
+    table = rollup.assign(month=pd.PeriodIndex(rollup['month'], freq='M')).pivot_table(
+        index='month', columns='category', values='amount', aggfunc='sum', fill_value=0)
+    if table.empty or table.index.min() > end:
+        return table.iloc[:0]
+    return table.reindex(pd.period_range(table.index.min(), end, freq='M'), fill_value=0).astype(float)
+
+
+def _smoothing(values, first):
+    """One-step-ahead errors (months x alphas x categories) and final levels of simple exponential smoothing
+
+    Categories start at their first non-zero month; errors before it are zero.
+    """
+    alphas = np.array(ALPHAS)[:, None]
+    level = np.repeat(values[:1], len(ALPHAS), axis=0)
+    errors = np.zeros((len(values), len(ALPHAS), values.shape[1]))
+    for t in range(1, len(values)):
+        started = t > first
+        error = values[t] - level
+        errors[t] = np.where(started, error, 0)
+        level = np.where(started, level + alphas * error, values[t])
+    return errors, level
+
+
+@timed('finance_data_seconds')
+def build_forecast(rollup, last_date, horizon=HORIZON, projected=None):
+    """Forecast frame (month, category, forecast, lower, upper, method) from month x category totals
+
+    last_date is the latest stored transaction: a partly recorded month is
+    forecast as a whole, and its recorded amounts count towards its floor.
+    projected holds recurring occurrences expected after last_date (date,
+    category, amount), as from recurring.upcoming().
+    """
+    columns = ['month', 'category', 'forecast', 'lower', 'upper', 'method']
+    history = _history(rollup, last_date)
+    if history.empty:
+        return pd.DataFrame(columns=columns)
+    values = history.to_numpy()
+    categories = history.columns.astype(str)
+    months, count = values.shape
+    active = values != 0
+    first = np.where(active.any(axis=0), active.argmax(axis=0), months)
+
+    # Exponential smoothing, with the best smoothing factor per category
+    errors, levels = _smoothing(values, first)
+    best = (errors ** 2).sum(axis=0).argmin(axis=0)
+    columns_idx = np.arange(count)
+    smooth_errors = errors[:, best, columns_idx]
+    smooth_level = levels[best, columns_idx]
+
+    # Seasonal naive, compared with smoothing over the last SEASON months
+    seasonal = np.zeros(count, dtype=bool)
+    seasonal_errors = np.zeros_like(values)
+    if months > SEASON:
+        seasonal_errors[SEASON:] = values[SEASON:] - values[:-SEASON]
+        seasonal_errors[np.arange(months)[:, None] < first + SEASON] = 0
+        recent = slice(months - SEASON, months)
+        seasonal = ((months - first >= 2 * SEASON)
+                    & (np.abs(seasonal_errors[recent]).sum(axis=0) < np.abs(smooth_errors[recent]).sum(axis=0)))
+
+    steps = np.arange(1, horizon + 1)[:, None]
+    if months >= SEASON:
+        same_month = values[months - SEASON + (steps[:, 0] - 1) % SEASON]
+    else:
+        same_month = np.zeros((horizon, count))
+    forecast = np.where(seasonal, same_month, smooth_level)
+    fitted = np.maximum(months - first - np.where(seasonal, SEASON, 1), 1)
+    sigma = np.sqrt((np.where(seasonal, seasonal_errors, smooth_errors) ** 2).sum(axis=0) / fitted)
+    spread = sigma * np.sqrt(np.where(seasonal, (steps - 1) // SEASON + 1, steps))
+
+    # Floor: recurring charges expected in each month, plus what is already
+    # recorded for a partly recorded first month
+    target = pd.period_range(history.index[-1] + 1, periods=horizon, freq='M')
+    floor = pd.DataFrame(0.0, index=target, columns=categories)
+    known = [rollup[rollup['month'] == target[0].strftime('%Y-%m')][['category', 'amount']].assign(month=target[0])]
+    if projected is not None and len(projected):
+        known.append(pd.DataFrame({
+            'month': pd.to_datetime(projected['date']).dt.to_period('M'),
+            'category': projected['category'],
+            'amount': projected['amount'].astype(float)
+        }))
+    known = pd.concat(known)
+    known = known[known['category'].astype(str).isin(categories) & known['month'].isin(target)]
+    if len(known):
+        floor = floor.add(known.assign(category=known['category'].astype(str))
+                          .pivot_table(index='month', columns='category', values='amount', aggfunc='sum'),
+                          fill_value=0).reindex(index=target, columns=categories).fillna(0)
+    floor = floor.to_numpy()
+    forecast = np.maximum(forecast, floor)
+    lower = np.maximum(np.maximum(forecast - INTERVAL_Z * spread, floor), np.minimum(0, values.min(axis=0)))
+    upper = forecast + INTERVAL_Z * spread
+
+    # Net: income less expenses, with independent errors combined. A category
+    # counts with the sign of its history's net; transfers count for nothing.
+    signs = np.sign(rollup.groupby(rollup['category'].astype(str))['net'].sum().reindex(categories).fillna(0).to_numpy())
+    net = forecast @ signs
+    net_spread = INTERVAL_Z * np.sqrt((spread ** 2) @ np.abs(signs))
+
+    frame = pd.DataFrame({
+        'month': np.repeat(target.to_timestamp(), count + 1),
+        'category': np.tile(np.append(categories.to_numpy(dtype=object), NET), horizon),
+        'forecast': np.column_stack([forecast, net]).ravel(),
+        'lower': np.column_stack([lower, net - net_spread]).ravel(),
+        'upper': np.column_stack([upper, net + net_spread]).ravel(),
+        'method': np.tile(np.append(np.where(seasonal, 'seasonal', 'smoothing').astype(object), 'combined'), horizon)
+    })
+    return frame[columns]
+
+
+def compute():
+    """Forecast of the stored transactions, HORIZON months ahead"""
+    rollup = rollups.get_rollup()
+    last_date = process_data.get_date_range()[1]
+    if last_date is None:
+        return build_forecast(rollup.iloc[:0], pd.Timestamp.now())
+    last_date = pd.Timestamp(last_date)
+    end = (last_date.to_period('M') + HORIZON).end_time.normalize()
+    projected = recurring.upcoming(last_date, days=(end - last_date).days)
+    return build_forecast(rollup, last_date, projected=projected)
+
+
+def _run(version):
+    global _result
+    try:
+        frame = compute()
+        with _job_lock:
+            _result = (version, frame)
+        inc('finance_forecast_runs_total')
+    except Exception as e:
+        print(f"Forecast failed: {e}")
+        with _job_lock:
+            _job['error'] = str(e)
+    finally:
+        with _job_lock:
+            _job['running'] = False
+        _done.set()
+
+
+def start_forecast():
+    """Compute the forecast for the current data on a background thread, unless it is cached or running"""
+    version = process_data.data_version()
+    with _job_lock:
+        if _job['running'] or (_result is not None and _result[0] == version):
+            return False
+        _job.update(running=True, version=version, error=None)
+        _done.clear()
+    threading.Thread(target=_run, args=(version,), daemon=True, name='forecast').start()
+    return True
+
+
+def get_forecast(months=HORIZON, wait=0):
+    """Latest forecast frame, up to months ahead, or None before the first one finishes
+
+    Starts a recomputation when the data changed since the cached forecast, and
+    waits up to wait seconds for it; otherwise the previous forecast is returned.
+    """
+    start_forecast()
+    if wait:
+        _done.wait(wait)
+    with _job_lock:
+        if _result is None:
+            return None
+        frame = _result[1]
+    return frame[frame['month'] < frame['month'].min() + pd.DateOffset(months=months)] if len(frame) else frame
+
+
+def job_status():
+    """State of the latest forecast run"""
+    with _job_lock:
+        return dict(_job, cached=None if _result is None else _result[0])
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Forecast monthly cash flow per category')
+    parser.add_argument('--months', type=int, default=3, help=f'months ahead, 1 to {HORIZON}')
+    args = parser.parse_args(argv)
+    if not 1 <= args.months <= HORIZON:
+        parser.error(f'--months must be between 1 and {HORIZON}')
+
+    frame = compute()
+    frame = frame[frame['month'] < frame['month'].min() + pd.DateOffset(months=args.months)]
+    print(frame.assign(month=frame['month'].dt.strftime('%Y-%m')).to_string(
+        index=False, float_format=lambda v: f'{v:,.2f}'))
+
+
+if __name__ == '__main__':
+    main()
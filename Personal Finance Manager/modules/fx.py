@@ -0,0 +1,182 @@
+import os
+import threading
+
+from modules import process_data
+from modules.lazy import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Currencies and conversion to a reporting currency.
+#
+# Every transaction carries the ISO code of the currency it was made in (its
+# account's currency unless given). Daily rates come from RATES_FILE, one row
+# per (Date, Currency) with Rate = the value of one unit of Currency in
+# BASE_CURRENCY:
+#
+#   Date,Currency,Rate
+#   2025-05-01,EUR,1.1312
+#
+# A conversion on a given day uses the latest rate on or before that day (the
+# earliest rate for days before it), so weekends and holidays need no rows.
+# Converting between two non-base currencies goes through the base: A -> B is
+# rate(A) / rate(B). Rows are converted at their own day's rate, one
+# searchsorted per currency over the whole column.
+#
+# Monthly totals (modules/rollups.py) are kept per currency and converted at
+# each month's average rate. That is a handful of (month, currency) pairs
+# rather than every row, so switching the display currency never rescans
+# transactions.
+
+BASE_CURRENCY = os.environ.get('FINANCE_CURRENCY', 'USD').upper()
+RATES_FILE = os.environ.get('FINANCE_FX_RATES', 'data/fx_rates.csv')
+SYMBOLS = {'USD': '$', 'EUR': '€', 'GBP': '£', 'JPY': '¥', 'INR': '₹', 'CNY': 'CN¥', 'KRW': '₩',
+           'CAD': 'CA$', 'AUD': 'A$', 'NZD': 'NZ$', 'HKD': 'HK$', 'MXN': 'MX$', 'BRL': 'R$'}
+
+_table = None               # (file mtime, RateTable)
+_lock = threading.Lock()
+_warned = set()
+
+
+class RateTable:
+    """Daily rates per currency, in BASE_CURRENCY per unit, sorted by day for as-of lookups"""
+
+    def __init__(self, frame):
+        self.days = {}              # currency -> sorted epoch days
+        self.rates = {}             # currency -> rate on each of those days
+        if len(frame):
+            frame = frame.assign(day=process_data.to_epoch_days(frame['date']),
+                                 currency=frame['currency'].astype(str).str.strip().str.upper())
+            frame = frame.sort_values(['currency', 'day']).drop_duplicates(['currency', 'day'], keep='last')
+            for currency, rows in frame.groupby('currency'):
+                self.days[currency] = rows['day'].to_numpy(dtype='int64')
+                self.rates[currency] = rows['rate'].to_numpy(dtype=float)
+
+    def currencies(self):
+        """Every currency that can be converted"""
+        return sorted(set(self.rates) | {BASE_CURRENCY})
+
+    def to_base(self, currencies, days):
+        """Rate to BASE_CURRENCY of each (currency, epoch day); NaN where a currency has no rates"""
+        days = np.asarray(days, dtype='int64')
+        codes, uniques = pd.factorize(pd.Series(currencies, dtype=object).fillna(BASE_CURRENCY))
+        result = np.full(len(days), np.nan)
+        for code, currency in enumerate(uniques):
+            rows = codes == code
+            currency = str(currency).upper()
+            if currency == BASE_CURRENCY:
+                result[rows] = 1.0
+            elif currency in self.rates:
+                known = self.days[currency]
+                at = np.searchsorted(known, days[rows], side='right') - 1
+                result[rows] = self.rates[currency][np.maximum(at, 0)]
+            elif currency not in _warned:
+                _warned.add(currency)
+                print(f"No FX rates for {currency} in {RATES_FILE}; its amounts are left out of conversions")
+        return result
+
+    def monthly_to_base(self, currencies, months):
+        """Average daily rate to BASE_CURRENCY over each (currency, 'YYYY-MM') month"""
+        pairs = pd.DataFrame({'currency': pd.Series(currencies, dtype=object).to_numpy(),
+                              'month': pd.Series(months, dtype=object).to_numpy()})
+        unique = pairs.drop_duplicates(ignore_index=True)
+        periods = pd.PeriodIndex(unique['month'], freq='M')
+        first = process_data.to_epoch_days(periods.start_time)
+        lengths = periods.days_in_month.to_numpy()
+        # Every calendar day of every pair, then one as-of lookup over all of them
+        owner = np.repeat(np.arange(len(unique)), lengths)
+        days = np.repeat(first, lengths) + (np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths))
+        daily = self.to_base(unique['currency'].to_numpy()[owner], days)
+        average = np.bincount(owner, weights=daily, minlength=len(unique)) / lengths
+        index = pd.MultiIndex.from_frame(unique)
+        return pd.Series(average, index=index).reindex(pd.MultiIndex.from_frame(pairs)).to_numpy()
+
+
+def load_rates():
+    """The rates in RATES_FILE as a frame (date, currency, rate); empty when there is none"""
+    if not os.path.exists(RATES_FILE):
+        return pd.DataFrame({'date': [], 'currency': [], 'rate': []})
+    frame = pd.read_csv(RATES_FILE)
+    frame.columns = [c.strip().lower() for c in frame.columns]
+    return frame[['date', 'currency', 'rate']]
+
+
+def get_rates():
+    """The RateTable, reloaded when RATES_FILE changes"""
+    global _table
+    mtime = os.path.getmtime(RATES_FILE) if os.path.exists(RATES_FILE) else None
+    with _lock:
+        if _table is None or _table[0] != mtime:
+            _table = (mtime, RateTable(load_rates()))
+        return _table[1]
+
+
+def currencies():
+    """Currencies amounts can be shown in"""
+    return get_rates().currencies()
+
+
+def convert(df, to=None):
+    """Amounts of df (date, amount, currency) in currency to (default BASE_CURRENCY), at each row's day rate"""
+    to = (to or BASE_CURRENCY).upper()
+    amounts = pd.to_numeric(df['amount']).to_numpy(dtype=float)
+    if 'currency' not in df:
+        source = np.full(len(df), BASE_CURRENCY, dtype=object)
+    else:
+        source = df['currency'].fillna(BASE_CURRENCY).to_numpy(dtype=object)
+    if len(df) == 0 or (source == to).all():
+        return amounts
+    rates = get_rates()
+    days = process_data.to_epoch_days(df['date'])
+    factor = rates.to_base(source, days)
+    if to != BASE_CURRENCY:
+        factor = factor / rates.to_base(np.full(len(df), to, dtype=object), days)
+    return np.where(source == to, amounts, amounts * factor)
+
+
+def convert_frame(df, to=None):
+    """df with amounts in currency to, dropping rows that have no rate"""
+    to = (to or BASE_CURRENCY).upper()
+    amounts = convert(df, to)
+    df = df.assign(amount=amounts, currency=to)
+    return df[~np.isnan(amounts)] if np.isnan(amounts).any() else df
+
+
+def rate(to, as_of=None, source=None):
+    """How many units of to one unit of source (default BASE_CURRENCY) is worth on as_of (default today)"""
+    to, source = (to or BASE_CURRENCY).upper(), (source or BASE_CURRENCY).upper()
+    if to == source:
+        return 1.0
+    day = process_data.to_epoch_days(pd.Series([pd.Timestamp(as_of or pd.Timestamp.now()).strftime('%Y-%m-%d')]))
+    rates = get_rates()
+    return float(rates.to_base([source], day)[0] / rates.to_base([to], day)[0])
+
+
+def symbol(currency=None):
+    """Prefix for amounts in a currency: '$', '€', or the code and a space"""
+    currency = (currency or BASE_CURRENCY).upper()
+    return SYMBOLS.get(currency, currency + ' ')
+
+
+def format_money(value, currency=None, decimals=2):
+    """An amount with its currency symbol, e.g. '€1,234.50'"""
+    return f"{symbol(currency)}{value:,.{decimals}f}"
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert an amount with the rates in ' + RATES_FILE)
+    parser.add_argument('amount', type=float)
+    parser.add_argument('source', help='currency of the amount, e.g. EUR')
+    parser.add_argument('to', nargs='?', default=BASE_CURRENCY, help='currency to convert to (default: %(default)s)')
+    parser.add_argument('--date', default=None, help='YYYY-MM-DD (default: today)')
+    args = parser.parse_args(argv)
+
+    converted = args.amount * rate(args.to, args.date, args.source)
+    if np.isnan(converted):
+        parser.error(f'no rates for {args.source} or {args.to} in {RATES_FILE}')
+    print(f"{format_money(args.amount, args.source)} = {format_money(converted, args.to)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from modules import budgets, forecast, fx, memory, process_data, shared_cache
+from modules.metrics import inc
+
+# HTTP caching and compression for Dash callback responses.
+#
+# A callback request (POST /_dash-update-component) whose outputs are all
+# read-only panels (CACHEABLE) gets an ETag: a hash of its outputs, inputs and
+# state plus the server state the panels are computed from (data version,
+# budgets, finished forecast, FX rates file, today's date). The per-tab fields
+# the settled filters carry for coalescing (client, seq) are left out, so
+# choosing the same filters again gives the same ETag. A request sending that ETag in
+# If-None-Match gets an empty 304. Browsers never revalidate POSTs, so the
+# response is also kept in a byte-bounded LRU and replayed without running the
+# callback. Callbacks with side effects (adding, correcting or deleting
+# transactions, saving budgets) are never cached.
+#
+# Responses of at least COMPRESS_MIN_BYTES are compressed: brotli when the
+# brotli package is installed and the client accepts it, otherwise gzip. A
+# cached response keeps each encoding it has been sent in, so replaying it
+# compresses nothing.
+#
+# With several worker processes (modules/shared_cache.py), ETags are computed
+# from the shared store version, and responses are also kept in the shared
+# tier, so a panel rendered by one worker is replayed by the others.
+
+CACHE_ENABLED = os.environ.get('FINANCE_HTTP_CACHE', '1') != '0'
+CACHE_BYTES = int(os.environ.get('FINANCE_HTTP_CACHE_MB', 64)) * 1024 * 1024
+COMPRESS_MIN_BYTES = int(os.environ.get('FINANCE_COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Components whose callbacks only read: panels, charts, the ledger and dropdown options
+CACHEABLE = {
+    'total-income', 'total-expenses', 'net-balance', 'daily-average', 'main-chart', 'monthly-stats',
+    'trend-analysis', 'budget-panel', 'accounts-panel', 'recurring-panel', 'ledger', 'ledger-state',
+    'ledger-summary', 'txn-snapshot', 'as-of'
+}
+# Keys of input values that identify a request rather than what it asks for
+VOLATILE_KEYS = ('client', 'seq')
+
+_cache = OrderedDict()      # etag -> {'etag', 'mimetype', 'body', 'encoded': {encoding: bytes}}
+_cache_bytes = 0
+_lock = threading.Lock()
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def output_ids(output):
+    """Component ids named in a callback request's output string ('..a.children...b.figure..')"""
+    return [part.rsplit('.', 1)[0] for part in output.strip('.').split('...') if part]
+
+
+def server_state():
+    """What cached panels depend on besides the request: data, budgets, forecast, FX rates and the day"""
+    rates = os.path.getmtime(fx.RATES_FILE) if os.path.exists(fx.RATES_FILE) else None
+    cached_forecast = forecast.job_status()['cached']
+    if shared_cache.ENABLED:
+        # Local data versions differ between workers; the shared version and whether
+        # this worker's forecast is current mean the same thing in each. Budget
+        # changes bump the shared version; the file's mtime catches the CLI's.
+        return [shared_cache.version(), budgets.file_mtime(), cached_forecast == process_data.data_version(),
+                rates, time.strftime('%Y-%m-%d')]
+    return [process_data.data_version(), budgets.version(), cached_forecast, rates, time.strftime('%Y-%m-%d')]
+
+
+def request_etag(payload):
+    """ETag of a callback request, or None when its outputs are not cacheable"""
+    output = payload.get('output') or ''
+    if not output or not set(output_ids(output)) <= CACHEABLE:
+        return None
+
+    def values(items):
+        return [{**item, 'value': {k: v for k, v in item['value'].items() if k not in VOLATILE_KEYS}}
+                if isinstance(item.get('value'), dict) else item for item in items or []]
+
+    key = [output, values(payload.get('inputs')), values(payload.get('state')),
+           sorted(payload.get('changedPropIds') or []), server_state()]
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _evict():
+    global _cache_bytes
+    while _cache_bytes > CACHE_BYTES and _cache:
+        etag, entry = _cache.popitem(last=False)
+        _cache_bytes -= _entry_size(entry)
+        memory.forget('http', etag)
+
+
+def _drop(etag):
+    """Evict one response (for the memory budget of modules/memory.py)"""
+    global _cache_bytes
+    with _lock:
+        entry = _cache.pop(etag, None)
+        if entry is not None:
+            _cache_bytes -= _entry_size(entry)
+
+
+def _entry_size(entry):
+    return len(entry['body']) + sum(len(data) for data in entry['encoded'].values())
+
+
+def get(etag):
+    """Cached response entry for an ETag, or None"""
+    with _lock:
+        entry = _cache.get(etag)
+        if entry is not None:
+            _cache.move_to_end(etag)
+            memory.touch('http', etag)
+            return entry
+    entry = shared_cache.get(_shared_key(etag))
+    if entry is not None:
+        _store(entry)
+    return entry
+
+
+def _shared_key(etag):
+    return f'finance:http:{etag}'
+
+
+def _store(entry, cost=None):
+    global _cache_bytes
+    with _lock:
+        previous = _cache.pop(entry['etag'], None)
+        if previous is not None:
+            _cache_bytes -= _entry_size(previous)
+        _cache[entry['etag']] = entry
+        _cache_bytes += _entry_size(entry)
+        memory.track('http', entry['etag'], nbytes=_entry_size(entry), cost=cost, drop=_drop)
+        _evict()
+
+
+def put(etag, body, mimetype, cost=None):
+    """Cache an uncompressed response body that took cost seconds to compute; returns the entry"""
+    entry = {'etag': etag, 'mimetype': mimetype, 'body': body, 'encoded': {}}
+    _store(entry, cost)
+    return entry
+
+
+def share(entry):
+    """Hand a cached entry, with the encodings it has so far, to the other workers"""
+    if shared_cache.ENABLED:
+        with _lock:
+            entry = dict(entry, encoded=dict(entry['encoded']))
+        shared_cache.put(_shared_key(entry['etag']), entry)
+
+
+def _add_encoding(entry, encoding, data):
+    global _cache_bytes
+    with _lock:
+        if encoding in entry['encoded']:
+            return
+        entry['encoded'][encoding] = data
+        # An entry evicted meanwhile no longer counts towards the budget
+        if _cache.get(entry['etag']) is entry:
+            _cache_bytes += len(data)
+            memory.track('http', entry['etag'], nbytes=_entry_size(entry))
+            _evict()
+
+
+def clear():
+    """Forget every cached response"""
+    global _cache_bytes
+    with _lock:
+        _cache.clear()
+        _cache_bytes = 0
+        memory.forget('http')
+
+
+def accepted_encoding(accept):
+    """Best encoding the client accepts ('br', 'gzip') or None"""
+    accept = (accept or '').lower()
+    if brotli is not None and 'br' in accept:
+        return 'br'
+    return 'gzip' if 'gzip' in accept else None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def _encoded(entry, encoding):
+    """An entry's body in an encoding, compressing it the first time"""
+    data = entry['encoded'].get(encoding)
+    if data is None:
+        data = compress(entry['body'], encoding)
+        _add_encoding(entry, encoding, data)
+    return data
+
+
+def register_caching(server):
+    """Add ETags, the response cache and compression to the Flask server"""
+    from flask import Response, g, request
+
+    @server.before_request
+    def replay_cached():
+        if not CACHE_ENABLED or request.method != 'POST' or not request.path.endswith('_dash-update-component'):
+            return None
+        payload = request.get_json(silent=True)
+        etag = request_etag(payload) if isinstance(payload, dict) else None
+        if etag is None:
+            return None
+        g.finance_etag = etag
+        g.finance_started = time.perf_counter()
+        if request.if_none_match.contains_weak(etag):
+            inc('finance_cache_requests_total', cache='http', result='not_modified')
+            response = Response(status=304)
+        else:
+            entry = get(etag)
+            if entry is None:
+                inc('finance_cache_requests_total', cache='http', result='miss')
+                return None
+            inc('finance_cache_requests_total', cache='http', result='hit')
+            encoding = accepted_encoding(request.headers.get('Accept-Encoding'))
+            if encoding and len(entry['body']) >= COMPRESS_MIN_BYTES:
+                response = Response(_encoded(entry, encoding), mimetype=entry['mimetype'])
+                response.headers['Content-Encoding'] = encoding
+            else:
+                response = Response(entry['body'], mimetype=entry['mimetype'])
+            response.headers['X-Cache'] = 'hit'
+        g.finance_cached = True
+        response.set_etag(etag, weak=True)
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    @server.after_request
+    def compress_response(response):
+        if g.get('finance_cached') or response.direct_passthrough or response.is_streamed \
+                or response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return response
+        body = response.get_data()
+        etag = g.get('finance_etag')
+        entry = None
+        if etag is not None:
+            entry = put(etag, body, response.mimetype, time.perf_counter() - g.finance_started)
+            response.set_etag(etag, weak=True)
+            response.headers['X-Cache'] = 'miss'
+        encoding = accepted_encoding(request.headers.get('Accept-Encoding'))
+        if encoding and len(body) >= COMPRESS_MIN_BYTES:
+            data = _encoded(entry, encoding) if entry is not None else compress(body, encoding)
+            response.set_data(data)
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Vary'] = 'Accept-Encoding'
+        if entry is not None:
+            share(entry)
+        return response
@@ -0,0 +1,331 @@
+import re
+import threading
+from collections import OrderedDict
+
+from modules import memory, process_data, search
+from modules.lazy import lazy_import
+from modules.metrics import timed
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Transaction ledger: one sorted, filtered page of rows at a time.
+#
+# Filters combine the search box (see modules/search.py), the dashboard's date
+# range, categories and accounts, and a DataTable filter_query such as
+#   {amount} > 50 && {category} contains food && {date} datestartswith 2024-03
+#
+# Pages are fetched by keyset rather than offset: each page carries the
+# (sort value, id) of its first and last row, and the next page is the rows
+# strictly after the last one. On the database that is
+#   WHERE (date, id) < (:date, :id) ORDER BY date DESC, id DESC LIMIT n
+# an index range scan on (date, id) (see finance.sql), however deep the page.
+# In process, the rows' (value, id) sort keys are kept sorted per column, so a
+# page is a binary search plus a short scan that skips rows the filters reject.
+# Jumping straight to a far page falls back to an offset. The total is counted
+# once per filter change, not per page.
+
+PAGE_SIZE = 100
+MASK_CACHE_SIZE = 4
+
+_FILTER = re.compile(
+    r'\{(\w+)\}\s+[is]?(contains|datestartswith|eq|ne|le|lt|ge|gt|<=|>=|!=|=|<|>)\s+'
+    r'(?:"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'|`([^`]*)`|(\S+))'
+)
+_OPERATORS = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}
+
+_masks = OrderedDict()      # filter key -> (index, version, mask, total)
+_masks_lock = threading.Lock()
+
+
+def parse_filter_query(filter_query):
+    """Conditions of a DataTable filter_query as (column, operator, value) tuples
+
+    Operators are normalized to contains, datestartswith, =, !=, <, <=, > and >=.
+    Conditions on unknown columns are ignored.
+    """
+    conditions = []
+    for match in _FILTER.finditer(filter_query or ''):
+        column, operator = match.group(1), match.group(2)
+        value = re.sub(r'\\(.)', r'\1', next(v for v in match.groups()[2:] if v is not None))
+        if column not in search.SORTABLE:
+            continue
+        conditions.append((column, _OPERATORS.get(operator, operator), value))
+    return conditions
+
+
+def _compare(values, operator, value):
+    if operator == '=':
+        return values == value
+    if operator == '!=':
+        return values != value
+    if operator == '<':
+        return values < value
+    if operator == '<=':
+        return values <= value
+    if operator == '>':
+        return values > value
+    return values >= value
+
+
+def _text_matches(names, operator, value):
+    """Which of a list of distinct strings satisfy a condition (case-insensitive)"""
+    names = pd.Series(names, dtype=object).str.lower()
+    value = value.lower()
+    if operator == 'contains':
+        return names.str.contains(value, regex=False).to_numpy(dtype=bool)
+    if operator == 'datestartswith':
+        return names.str.startswith(value).to_numpy(dtype=bool)
+    return _compare(names, operator, value).to_numpy(dtype=bool)
+
+
+# ----- In-process index -----
+
+def _to_day(date):
+    try:
+        return int(process_data.to_epoch_days(pd.Series([str(date)[:10]]))[0])
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Not a date: {date}") from e
+
+
+def _build_mask(index, clauses, start_date, end_date, categories, accounts, conditions):
+    """Boolean mask over the index's rows, or None when nothing is filtered"""
+    days, cat_ids, amounts, desc_ids, account_ids, _ = index.columns()
+    mask = None
+
+    def narrow(rows):
+        nonlocal mask
+        mask = rows if mask is None else mask & rows
+
+    if index.deleted is not None:
+        narrow(~index.deleted)
+
+    if clauses:
+        lookup = np.zeros(len(index.descriptions), dtype=bool)
+        lookup[list(index.matching_descriptions(clauses))] = True
+        narrow(lookup[desc_ids])
+    if start_date and end_date:
+        narrow((days >= _to_day(start_date)) & (days <= _to_day(end_date)))
+    if categories:
+        wanted = np.zeros(len(index.categories), dtype=bool)
+        wanted[[index.category_ids[c] for c in categories if c in index.category_ids]] = True
+        narrow(wanted[cat_ids])
+    if accounts:
+        wanted = np.zeros(len(index.accounts), dtype=bool)
+        wanted[[index.account_ids[a] for a in accounts if a in index.account_ids]] = True
+        narrow(wanted[account_ids])
+    for column, operator, value in conditions:
+        if column == 'date':
+            if operator in ('contains', 'datestartswith'):
+                # Match the ISO text of each day in the span, so partial input like '2024-0' works
+                first, last = (int(days.min()), int(days.max())) if len(days) else (0, -1)
+                span = np.datetime64('1970-01-01') + np.arange(first, last + 1).astype('timedelta64[D]')
+                narrow(_text_matches(span.astype(str), operator, value)[days - first])
+            else:
+                narrow(_compare(days, operator, _to_day(value)))
+        elif column == 'amount':
+            try:
+                number = float(value)
+            except ValueError as e:
+                raise ValueError(f"Not an amount: {value}") from e
+            narrow(np.isclose(amounts, number) if operator in ('=', 'contains') else _compare(amounts, operator, number))
+        elif column == 'category':
+            narrow(_text_matches(index.categories, operator, value)[cat_ids])
+        elif column == 'account':
+            narrow(_text_matches(index.accounts, operator, value)[account_ids])
+        else:
+            narrow(_text_matches(index.descriptions, operator, value)[desc_ids])
+    return mask
+
+
+def _get_mask(index, key, *filters):
+    """Cached (mask, total) for a filter combination, until the index changes"""
+    with _masks_lock:
+        cached = _masks.get(key)
+        if cached is not None and cached[0] is index and cached[1] == index.version:
+            _masks.move_to_end(key)
+            return cached[2], cached[3]
+    mask = _build_mask(index, *filters)
+    total = index.rows if mask is None else int(np.count_nonzero(mask))
+    with _masks_lock:
+        _masks[key] = (index, index.version, mask, total)
+        while len(_masks) > MASK_CACHE_SIZE:
+            _masks.popitem(last=False)
+    return mask, total
+
+
+def _scan(keys, mask, pos, limit, forward):
+    """Up to limit sort keys passing mask, walking from pos up (forward) or down, in walk order"""
+    found, got, step = [], 0, max(4 * limit, 1024)
+    while got < limit and (pos < len(keys) if forward else pos > 0):
+        if forward:
+            chunk = keys[pos:pos + step]
+            pos += step
+        else:
+            chunk = keys[max(0, pos - step):pos][::-1]
+            pos -= step
+        if mask is not None:
+            chunk = chunk[mask[chunk & search.ROW_MASK]]
+        found.append(chunk[:limit - got])
+        got += len(found[-1])
+        # Sparse filters need longer scans; grow the window rather than take many small steps
+        step *= 2
+    return np.concatenate(found) if found else np.empty(0, dtype='int64')
+
+
+def _page_keys(keys, mask, descending, cursor, limit):
+    """Sort keys of one page, in display order"""
+    if cursor and 'offset' in cursor:
+        offset = int(cursor['offset'])
+        view = keys[::-1] if descending else keys
+        if mask is not None:
+            return view[np.flatnonzero(mask[view & search.ROW_MASK])[offset:offset + limit]]
+        return view[offset:offset + limit]
+    if cursor and ('after' in cursor or 'before' in cursor):
+        after = 'after' in cursor
+        value, row = cursor['after' if after else 'before']
+        key = (int(value) << search.ROW_BITS) | int(row)
+        # Walking away from the cursor in display order: down the ascending keys when descending
+        forward = after != descending
+        pos = np.searchsorted(keys, key, side='right' if forward else 'left')
+        page = _scan(keys, mask, pos, limit, forward)
+        return page if after else page[::-1]
+    return _scan(keys, mask, len(keys) if descending else 0, limit, not descending)
+
+
+def _page_memory(clauses, start_date, end_date, categories, accounts, conditions, filter_key, sort_by, descending,
+                 cursor, limit):
+    index = search.get_index()
+    with search.index_lock:
+        mask, total = _get_mask(index, filter_key, clauses, start_date, end_date, categories, accounts, conditions)
+        page = _page_keys(index.sorted_keys(sort_by), mask, descending, cursor, limit)
+        rows = page & search.ROW_MASK
+        days, cat_ids, amounts, desc_ids, account_ids, store_ids = index.columns()
+        dates = (np.datetime64('1970-01-01') + days[rows].astype('timedelta64[D]')).astype(str)
+        results = [
+            {'id': int(store_ids[row]), 'date': str(date), 'category': index.categories[cat_ids[row]],
+             'amount': float(amounts[row]), 'description': index.descriptions[desc_ids[row]],
+             'account': index.accounts[account_ids[row]]}
+            for row, date in zip(rows, dates)
+        ]
+    cursor_of = lambda key: [int(key >> search.ROW_BITS), int(key & search.ROW_MASK)]
+    return {
+        'rows': results,
+        'total': total,
+        'first': cursor_of(page[0]) if len(page) else None,
+        'last': cursor_of(page[-1]) if len(page) else None
+    }
+
+
+# ----- Database -----
+
+# Sort expressions; description is coalesced so that (value, id) comparisons never meet NULL
+_DB_SORT = {'date': 'date', 'amount': 'amount', 'category': 'category', 'description': "COALESCE(description, '')",
+            'account': 'account'}
+
+
+def _db_filters(clauses, start_date, end_date, categories, accounts, conditions):
+    """WHERE conditions and parameters; the categories and accounts lists are expanding parameters"""
+    where, params = [], {}
+    if clauses:
+        where.append(f"{search.TSVECTOR_SQL} @@ to_tsquery('simple', :query)")
+        params['query'] = search.to_tsquery(clauses)
+    if start_date and end_date:
+        where.append("date BETWEEN :start_date AND :end_date")
+        params.update(start_date=str(start_date)[:10], end_date=str(end_date)[:10])
+    if categories:
+        where.append("category IN :categories")
+        params['categories'] = list(categories)
+    if accounts:
+        where.append("account IN :accounts")
+        params['accounts'] = list(accounts)
+    for i, (column, operator, value) in enumerate(conditions):
+        name = f'f{i}'
+        if column == 'date' and operator not in ('contains', 'datestartswith'):
+            _to_day(value)
+            where.append(f"date {operator} :{name}")
+            params[name] = str(value)[:10]
+        elif column == 'amount':
+            where.append(f"amount {'=' if operator == 'contains' else operator} :{name}")
+            params[name] = float(value)
+        elif operator in ('contains', 'datestartswith'):
+            expression = 'CAST(date AS TEXT)' if column == 'date' else f'LOWER({_DB_SORT[column]})'
+            pattern = value.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            where.append(f"{expression} LIKE :{name} ESCAPE '\\'")
+            params[name] = (pattern if operator == 'datestartswith' else '%' + pattern) + '%'
+        else:
+            where.append(f"LOWER({_DB_SORT[column]}) {operator} :{name}")
+            params[name] = value.lower()
+    return where, params
+
+
+def _page_db(engine, clauses, start_date, end_date, categories, accounts, conditions, sort_by, descending, cursor,
+             limit, count):
+    from sqlalchemy import bindparam, text
+    where, params = _db_filters(clauses, start_date, end_date, categories, accounts, conditions)
+    expanding = [bindparam(name, expanding=True) for name in ('categories', 'accounts') if name in params]
+    column = _DB_SORT[sort_by]
+    backward = bool(cursor) and 'before' in cursor
+    ascending = descending == backward
+    page_where = list(where)
+    if cursor and ('after' in cursor or 'before' in cursor):
+        params['cursor_value'], params['cursor_id'] = cursor['after' if 'after' in cursor else 'before']
+        page_where.append(f"({column}, id) {'>' if ascending else '<'} (:cursor_value, :cursor_id)")
+    direction = 'ASC' if ascending else 'DESC'
+    offset = f" OFFSET {int(cursor['offset'])}" if cursor and 'offset' in cursor else ''
+
+    def clause(conditions):
+        return ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+
+    with engine.connect() as conn:
+        total = None
+        if count:
+            total = int(conn.execute(text(f"SELECT COUNT(*) FROM transactions {clause(where)}").bindparams(*expanding), params).scalar())
+        page = pd.read_sql(
+            text(f"SELECT id, date, category, amount, description, account, {column} AS sort_value FROM transactions "
+                 f"{clause(page_where)} ORDER BY {column} {direction}, id {direction} LIMIT :limit{offset}").bindparams(*expanding),
+            conn, params={**params, 'limit': limit})
+    if backward:
+        page = page.iloc[::-1].reset_index(drop=True)
+    page['date'] = page['date'].astype(str)
+    page['amount'] = page['amount'].astype(float)
+    values = page.pop('sort_value')
+    values = values.astype(float) if sort_by == 'amount' else values.fillna('').astype(str)
+    cursor_at = lambda i: [values.iloc[i], int(page['id'].iloc[i])]
+    return {
+        'rows': page.to_dict('records'),
+        'total': total,
+        'first': cursor_at(0) if len(page) else None,
+        'last': cursor_at(-1) if len(page) else None
+    }
+
+
+@timed('finance_data_seconds')
+def fetch_page(query=None, start_date=None, end_date=None, categories=None, accounts=None, filter_query='',
+               sort_by='date', descending=True, cursor=None, limit=PAGE_SIZE, count=True):
+    """One page of transactions matching the search query and filters, in the requested order
+
+    cursor is None for the first page, {'after': c} or {'before': c} with the
+    'last' or 'first' cursor of a neighbouring page, or {'offset': n}. Returns
+    {'rows', 'total', 'first', 'last'}; total is None unless count is set.
+    """
+    if sort_by not in search.SORTABLE:
+        raise ValueError(f"Cannot sort by {sort_by}")
+    clauses = search.parse_query(query)
+    conditions = parse_filter_query(filter_query)
+    engine = process_data.get_engine()
+    # Search queries need PostgreSQL's tsvector; embedded backends search in process
+    if engine is not None and (not clauses or engine.dialect.name == 'postgresql'):
+        try:
+            return _page_db(engine, clauses, start_date, end_date, categories, accounts, conditions,
+                            sort_by, descending, cursor, limit, count)
+        except Exception as e:
+            print(f"Error paging ledger in DB: {e}, falling back to the in-process index")
+            # Database cursors hold column values, not in-process sort keys
+            if cursor and 'offset' not in cursor:
+                cursor = None
+    if memory.rollup_only():
+        raise ValueError("The stored rows do not fit the memory budget, so only monthly totals are shown")
+    filter_key = repr((query, start_date, end_date, sorted(categories or []), sorted(accounts or []), conditions))
+    return _page_memory(clauses, start_date, end_date, categories, accounts, conditions, filter_key,
+                        sort_by, descending, cursor, limit)
@@ -0,0 +1,269 @@
+import os
+import sys
+import threading
+
+from modules import process_data
+from modules.lazy import lazy_import
+from modules.metrics import add_collector, inc, set_gauge
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Memory accounting for data kept in process, and a budget enforced by eviction.
+#
+# Caches report each entry they keep with track(): its size in bytes
+# (DataFrame.memory_usage(deep=True), array nbytes, the length of serialized
+# responses) and the seconds it took to compute. Once the total passes
+# FINANCE_MEMORY_MB, entries are evicted GreedyDual-Size style: each has a
+# priority of the clock plus its cost per byte, renewed on every use, the lowest
+# goes first and the clock advances to it. Large, cheap or long-unused entries
+# leave before small, costly or hot ones. Evicting calls the cache's own drop
+# function, so the entry is rebuilt on next use. Eviction runs after each
+# request, when no store lock is held. Pinned entries are counted but kept.
+#
+# Rows loaded to answer a request are not cached, but they need room too. When
+# every stored row, as a DataFrame, would take more than RAW_SHARE of the budget,
+# the app serves from rollups only (rollup_only()): the dashboard is computed
+# from the month x category rollup, which is built from the store in chunks, and
+# views that need single rows (ledger, recurring series, as-of versions) are off.
+# FINANCE_ROLLUP_ONLY=1 or 0 forces the mode either way.
+#
+# Sizes, the budget and the mode are exported as gauges on /metrics.
+
+BUDGET_BYTES = int(float(os.environ.get('FINANCE_MEMORY_MB', 0)) * 1024 * 1024)     # 0: no budget
+FORCE_ROLLUP_ONLY = os.environ.get('FINANCE_ROLLUP_ONLY')
+RAW_SHARE = 0.5
+SAMPLE_ROWS = 10_000
+
+_entries = {}               # (cache, key) -> _Entry
+_total = 0
+_clock = 0.0
+_lock = threading.Lock()
+_mode = None                # (data version, stored rows, estimated bytes, rollup only)
+_row_bytes = None           # average bytes per stored row, from a sample
+_mode_lock = threading.Lock()
+
+
+class _Entry:
+    __slots__ = ('nbytes', 'cost', 'priority', 'drop', 'pinned')
+
+    def __init__(self, nbytes, cost, drop, pinned):
+        self.nbytes = nbytes
+        self.cost = cost
+        self.drop = drop
+        self.pinned = pinned
+        self.priority = 0.0
+
+    def renew(self):
+        self.priority = _clock + self.cost / max(self.nbytes, 1)
+
+
+def size_of(value):
+    """Bytes held by a value: DataFrames deeply, arrays, strings and bytes, and containers and objects summed"""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, str, int, float, bool)):
+        return sys.getsizeof(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(size_of(k) + size_of(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(size_of(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + size_of(vars(value))
+    return sys.getsizeof(value)
+
+
+def track(cache, key, value=None, cost=None, drop=None, nbytes=None, pinned=False):
+    """Account for an entry a cache keeps (again, when it changed size)
+
+    cost is the seconds it took to compute (None keeps the cost recorded
+    before); drop(key) evicts it. Pass nbytes when the size is known already.
+    """
+    global _total
+    size = size_of(value) if nbytes is None else int(nbytes)
+    with _lock:
+        entry = _entries.get((cache, key))
+        if entry is None:
+            entry = _entries[(cache, key)] = _Entry(size, cost or 0.0, drop, pinned)
+        else:
+            _total -= entry.nbytes
+            entry.nbytes = size
+            if cost is not None:
+                entry.cost = cost
+        _total += size
+        entry.renew()
+
+
+def touch(cache, key):
+    """Note a use of an entry, renewing its priority"""
+    with _lock:
+        entry = _entries.get((cache, key))
+        if entry is not None:
+            entry.renew()
+
+
+def forget(cache, key=None):
+    """Stop accounting for an entry a cache dropped itself, or for all of a cache's entries"""
+    global _total
+    with _lock:
+        keys = [(cache, key)] if key is not None else [k for k in _entries if k[0] == cache]
+        for k in keys:
+            entry = _entries.pop(k, None)
+            if entry is not None:
+                _total -= entry.nbytes
+
+
+def enforce():
+    """Evict entries until the tracked total fits the budget; returns how many were evicted
+
+    Call with no lock held: drop functions take their caches' locks.
+    """
+    global _total, _clock
+    if not BUDGET_BYTES:
+        return 0
+    victims = []
+    with _lock:
+        if _total <= BUDGET_BYTES:
+            return 0
+        for k, entry in sorted(_entries.items(), key=lambda item: item[1].priority):
+            if _total <= BUDGET_BYTES:
+                break
+            if entry.pinned:
+                continue
+            del _entries[k]
+            _total -= entry.nbytes
+            _clock = entry.priority
+            victims.append((k, entry))
+    for (cache, key), entry in victims:
+        inc('finance_memory_evictions_total', cache=cache)
+        if entry.drop is not None:
+            entry.drop(key)
+    return len(victims)
+
+
+def usage():
+    """Tracked bytes and entries per cache"""
+    caches = {}
+    with _lock:
+        for (cache, _), entry in _entries.items():
+            stats = caches.setdefault(cache, {'bytes': 0, 'entries': 0})
+            stats['bytes'] += entry.nbytes
+            stats['entries'] += 1
+    return caches
+
+
+def _stored_rows():
+    engine = process_data.get_engine()
+    if engine is not None:
+        from sqlalchemy import text
+        try:
+            with engine.connect() as conn:
+                return conn.execute(text("SELECT COUNT(*) FROM transactions")).scalar()
+        except Exception as e:
+            print(f"Error counting rows in DB: {e}, falling back to CSV")
+    return process_data._csv_row_count() if os.path.exists(process_data.CSV_FILE) else 0
+
+
+def _sample_row_bytes():
+    """Average in-memory bytes of a stored row, measured on the first SAMPLE_ROWS"""
+    engine = process_data.get_engine()
+    sample = None
+    if engine is not None:
+        try:
+            sample = pd.read_sql(f"SELECT * FROM transactions LIMIT {SAMPLE_ROWS}", engine)
+        except Exception as e:
+            print(f"Error sampling rows from DB: {e}, falling back to CSV")
+    if sample is None:
+        if not os.path.exists(process_data.CSV_FILE) or os.path.getsize(process_data.CSV_FILE) == 0:
+            return None
+        sample = pd.read_csv(process_data.CSV_FILE, nrows=SAMPLE_ROWS)
+        sample.columns = process_data.column_names(sample.columns)
+    if sample.empty:
+        return None
+    return size_of(process_data.fill_columns(sample)) / len(sample)
+
+
+def raw_estimate():
+    """(stored rows, estimated bytes of all of them as a DataFrame)"""
+    global _row_bytes
+    rows = _stored_rows()
+    with _mode_lock:
+        if _row_bytes is None and rows:
+            _row_bytes = _sample_row_bytes()
+        return rows, int(rows * (_row_bytes or 0))
+
+
+def rollup_only():
+    """Whether to serve the dashboard from rollups alone, because raw rows do not fit the budget"""
+    global _mode
+    if FORCE_ROLLUP_ONLY in ('0', '1'):
+        return FORCE_ROLLUP_ONLY == '1'
+    if not BUDGET_BYTES:
+        return False
+    version = process_data.data_version()
+    with _mode_lock:
+        if _mode is not None and _mode[0] == version:
+            return _mode[3]
+        was = _mode is not None and _mode[3]
+    rows, estimate = raw_estimate()
+    only = estimate > RAW_SHARE * BUDGET_BYTES
+    with _mode_lock:
+        _mode = (version, rows, estimate, only)
+    if only != was:
+        if only:
+            print(f"{rows:,} stored rows need about {estimate / 2**20:,.0f} MB, over {RAW_SHARE:.0%} of the "
+                  f"{BUDGET_BYTES / 2**20:,.0f} MB memory budget: serving rollups only")
+        else:
+            print("Stored rows fit the memory budget again: serving rows")
+    return only
+
+
+def collect():
+    """Set the memory gauges (called when /metrics is rendered)"""
+    for cache, stats in usage().items():
+        set_gauge('finance_memory_bytes', stats['bytes'], cache=cache)
+        set_gauge('finance_memory_entries', stats['entries'], cache=cache)
+    set_gauge('finance_memory_budget_bytes', BUDGET_BYTES)
+    with _mode_lock:
+        mode = _mode
+    if mode is not None:
+        set_gauge('finance_memory_raw_estimate_bytes', mode[2])
+    set_gauge('finance_rollup_only', int(rollup_only()))
+
+
+add_collector(collect)
+
+
+def register_budget(server):
+    """Enforce the memory budget after each request to the Flask server"""
+    if not BUDGET_BYTES:
+        return
+
+    @server.after_request
+    def enforce_budget(response):
+        enforce()
+        return response
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Estimate the memory the stored transactions need')
+    parser.parse_args(argv)
+
+    rows, estimate = raw_estimate()
+    print(f"{rows:,} stored rows, about {estimate / 2**20:,.1f} MB as a DataFrame")
+    if BUDGET_BYTES:
+        print(f"Memory budget {BUDGET_BYTES / 2**20:,.0f} MB: "
+              f"{'rollups only' if rollup_only() else 'rows fit'} (limit {RAW_SHARE:.0%} of the budget for rows)")
+    else:
+        print("No memory budget set (FINANCE_MEMORY_MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+import bisect
+import functools
+import os
+import threading
+import time
+
+# In-process metrics registry (histograms, counters, gauges) for the dashboard hot paths.
+#
+# Enabled with FINANCE_METRICS=1. When disabled, timed() returns the function
+# unchanged and observe/inc/set_gauge return immediately, so the cost is one
+# module-level flag check at most.
+
+METRICS_ENABLED = os.environ.get('FINANCE_METRICS') == '1'
+
+# Seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Row counts and byte sizes
+SIZE_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+_collectors = []
+
+
+class _Histogram:
+    """Cumulative bucket counts plus sum, count and the last observed value"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.last = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.last = value
+
+    def quantile(self, q):
+        """Upper bucket bound containing the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Record one observation in a histogram"""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        hist = series.get(_key(labels))
+        if hist is None:
+            hist = series[_key(labels)] = _Histogram(buckets)
+        hist.observe(value)
+
+
+def inc(name, amount=1, **labels):
+    """Increment a counter"""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[_key(labels)] = series.get(_key(labels), 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to its current value"""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _gauges.setdefault(name, {})[_key(labels)] = value
+
+
+def add_collector(func):
+    """Call func before each render, to set gauges that are sampled rather than kept current"""
+    _collectors.append(func)
+    return func
+
+
+def _row_count(result, args):
+    for candidate in (result, args[0] if args else None):
+        if hasattr(candidate, 'shape') and hasattr(candidate, 'columns'):
+            return len(candidate)
+    return None
+
+
+def timed(metric, label='op', count_rows=False, request_scoped=False):
+    """Decorator recording call latency under metric{label=<function name>}
+
+    With count_rows, the rows of the DataFrame returned (or, failing that, passed
+    in first) are recorded in finance_rows{label=<function name>}. With
+    request_scoped, the time is also credited to the current Flask request.
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        labels = {label: func.__name__}
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                observe(metric, elapsed, **labels)
+                if request_scoped:
+                    _note_callback_time(elapsed)
+            if count_rows:
+                rows = _row_count(result, args)
+                if rows is not None:
+                    observe('finance_rows', rows, buckets=SIZE_BUCKETS, **labels)
+            return result
+        return wrapper
+    return decorator
+
+
+def timed_callback(func):
+    """timed() for Dash callbacks, labelled by callback name"""
+    return timed('finance_callback_seconds', label='callback', request_scoped=True)(func)
+
+
+# ----- Flask integration -----
+
+def _note_callback_time(elapsed):
+    # Remember the callback's own time so the request hook can attribute the rest
+    # of the request (figure serialization and Dash overhead) separately
+    from flask import g, has_request_context
+    if has_request_context():
+        g.finance_callback_seconds = getattr(g, 'finance_callback_seconds', 0.0) + elapsed
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format"""
+    if METRICS_ENABLED:
+        for collect in _collectors:
+            collect()
+    lines = []
+    with _lock:
+        for name, series in sorted(_counters.items()):
+            lines.append(f'# TYPE {name} counter')
+            for key, value in sorted(series.items()):
+                lines.append(f'{name}{_format_labels(key)} {value}')
+        for name, series in sorted(_gauges.items()):
+            lines.append(f'# TYPE {name} gauge')
+            for key, value in sorted(series.items()):
+                lines.append(f'{name}{_format_labels(key)} {value}')
+        for name, series in sorted(_histograms.items()):
+            lines.append(f'# TYPE {name} histogram')
+            for key, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, n in zip(hist.buckets, hist.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_bucket{_format_labels(key, [("le", "+Inf")])} {hist.count}')
+                lines.append(f'{name}_sum{_format_labels(key)} {hist.sum}')
+                lines.append(f'{name}_count{_format_labels(key)} {hist.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def callback_latencies():
+    """Per-callback (last, p50, p95, count) in seconds, for the debug overlay"""
+    with _lock:
+        series = _histograms.get('finance_callback_seconds', {})
+        return {
+            dict(key).get('callback'): (hist.last, hist.quantile(0.5), hist.quantile(0.95), hist.count)
+            for key, hist in series.items()
+        }
+
+
+def register_endpoint(server):
+    """Expose /metrics on the Flask server and time Dash callback requests"""
+    from flask import Response, g, request
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    if not METRICS_ENABLED:
+        return
+
+    @server.before_request
+    def start_timer():
+        g.finance_request_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        if request.path.endswith('_dash-update-component') and hasattr(g, 'finance_request_start'):
+            elapsed = time.perf_counter() - g.finance_request_start
+            observe('finance_request_seconds', elapsed, path='_dash-update-component')
+            if hasattr(g, 'finance_callback_seconds'):
+                observe('finance_serialize_seconds', max(0.0, elapsed - g.finance_callback_seconds))
+            if response.content_length is not None:
+                observe('finance_response_bytes', response.content_length, buckets=SIZE_BUCKETS)
+        return response
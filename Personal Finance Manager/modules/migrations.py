@@ -0,0 +1,157 @@
+import os
+
+from modules import accounts, fx, process_data
+from modules.lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+# Schema migrations for stores created before a column existed.
+#
+# Database tables are migrated on first connection (process_data.get_engine
+# calls apply()). Each step checks the live schema first, so running them again
+# is a no-op. A CSV store is rewritten on request, since that rewrites the whole
+# file:
+#
+#   python -m modules.migrations
+#
+# or else by the first insert after an upgrade. Until then, missing CSV columns
+# are derived whenever the file is loaded.
+
+CHUNK_ROWS = 100_000
+
+
+def _columns(engine, table):
+    """Column names of a table, or None when it does not exist"""
+    from sqlalchemy import inspect
+    inspector = inspect(engine)
+    if not inspector.has_table(table):
+        return None
+    return {column['name'].lower() for column in inspector.get_columns(table)}
+
+
+def add_transaction_type(engine):
+    """Add transactions.type and classify stored rows by category; False if already done"""
+    columns = _columns(engine, 'transactions')
+    if columns is None or 'type' in columns:
+        return False
+    from sqlalchemy import bindparam, text
+    classify = text("UPDATE transactions SET type = :type WHERE category IN :categories").bindparams(
+        bindparam('categories', expanding=True))
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE transactions ADD COLUMN type VARCHAR(10) DEFAULT 'expense'"))
+        conn.execute(classify, {'type': 'income', 'categories': list(process_data.INCOME_CATEGORIES)})
+        conn.execute(classify, {'type': 'transfer', 'categories': list(process_data.TRANSFER_CATEGORIES)})
+    print("Migrated transactions: added the type column")
+    return True
+
+
+def add_transaction_account(engine):
+    """Add transactions.account and transfer_id, and the accounts table; False if already done"""
+    columns = _columns(engine, 'transactions')
+    if columns is None or 'account' in columns:
+        return False
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE transactions ADD COLUMN account VARCHAR(50) DEFAULT '{accounts.DEFAULT_ACCOUNT}'"))
+        conn.execute(text("ALTER TABLE transactions ADD COLUMN transfer_id VARCHAR(32)"))
+        conn.execute(text("CREATE TABLE IF NOT EXISTS accounts (name VARCHAR(50) PRIMARY KEY, "
+                          "kind VARCHAR(20) NOT NULL DEFAULT 'checking', opening_balance NUMERIC NOT NULL DEFAULT 0)"))
+        if engine.dialect.name == 'postgresql':
+            # Embedded stores get their indexes from modules/embedded.py
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions (account, date)"))
+    print("Migrated transactions: added the account and transfer_id columns")
+    return True
+
+
+def add_currency(engine):
+    """Add transactions.currency and accounts.currency, in fx.BASE_CURRENCY for stored rows; False if already done"""
+    columns = _columns(engine, 'transactions')
+    if columns is None or 'currency' in columns:
+        return False
+    from sqlalchemy import text
+    default = f"VARCHAR(3) DEFAULT '{fx.BASE_CURRENCY}'"
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE transactions ADD COLUMN currency {default}"))
+        if 'currency' not in (_columns(engine, 'accounts') or {'currency'}):
+            conn.execute(text(f"ALTER TABLE accounts ADD COLUMN currency {default}"))
+    print("Migrated transactions: added the currency column")
+    return True
+
+
+def add_corrections(engine):
+    """Create the corrections table of modules/corrections.py; False if it already exists"""
+    if _columns(engine, 'corrections') is not None or _columns(engine, 'transactions') is None:
+        return False
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS corrections (seq BIGINT PRIMARY KEY, recorded_at TIMESTAMP NOT NULL, "
+                          "op VARCHAR(6) NOT NULL CHECK (op IN ('update', 'delete')), transaction_id BIGINT NOT NULL, "
+                          "old_values TEXT NOT NULL, new_values TEXT)"))
+    print("Migrated: added the corrections table")
+    return True
+
+
+DB_MIGRATIONS = [add_transaction_type, add_transaction_account, add_currency, add_corrections]
+
+
+def apply(engine):
+    """Run pending database migrations"""
+    for migration in DB_MIGRATIONS:
+        migration(engine)
+
+
+def rewrite_csv(chunk_rows=CHUNK_ROWS):
+    """Add the missing columns to the CSV store; the caller holds process_data._write_lock
+
+    Types are classified by category, accounts default to
+    accounts.DEFAULT_ACCOUNT, currencies to fx.BASE_CURRENCY and transfer ids
+    start out empty. Returns the rows rewritten.
+    """
+    path = process_data.CSV_FILE
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+    present = set(process_data.column_names(pd.read_csv(path, nrows=0).columns))
+    missing = [c for c in process_data.TRANSACTION_COLUMNS if c not in present]
+    if not missing:
+        return 0
+    tmp = path + '.migrate.tmp'
+    rows = 0
+    for i, raw in enumerate(pd.read_csv(path, chunksize=chunk_rows)):
+        chunk = raw.set_axis(process_data.column_names(raw.columns), axis=1)
+        for column in missing:
+            if column == 'type':
+                raw[process_data.CSV_HEADER[column]] = process_data.infer_types(chunk)
+            elif column == 'account':
+                raw[process_data.CSV_HEADER[column]] = accounts.DEFAULT_ACCOUNT
+            elif column == 'currency':
+                raw[process_data.CSV_HEADER[column]] = fx.BASE_CURRENCY
+            else:
+                raw[process_data.CSV_HEADER[column]] = None
+        raw.to_csv(tmp, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        rows += len(raw)
+    os.replace(tmp, path)
+    names = ', '.join(process_data.CSV_HEADER[c] for c in missing)
+    print(f"Migrated {path}: added the {names} columns to {rows:,} rows")
+    return rows
+
+
+def migrate_csv(chunk_rows=CHUNK_ROWS):
+    """Bring the CSV store up to the current columns; returns the rows rewritten"""
+    # Holding the write lock keeps inserts from appending to the file being rewritten
+    with process_data._write_lock:
+        return rewrite_csv(chunk_rows)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Bring the transaction store up to the current schema')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    # Connecting migrates the database; the CSV is migrated too, as it backs the app whenever the database is down
+    process_data.get_engine()
+    migrate_csv(args.chunk_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import cProfile
+import functools
+import html
+import io
+import json
+import os
+import pstats
+import re
+import time
+from datetime import datetime
+
+# Debug-only slow-callback sampler.
+#
+# With FINANCE_PROFILE=1 every decorated callback runs under cProfile; calls that
+# take longer than FINANCE_PROFILE_THRESHOLD seconds are saved, together with
+# their inputs, to a rotating directory browsable at /admin/profiles.
+
+PROFILING_ENABLED = os.environ.get('FINANCE_PROFILE') == '1'
+SLOW_CALLBACK_SECONDS = float(os.environ.get('FINANCE_PROFILE_THRESHOLD', '1.0'))
+PROFILE_DIR = os.environ.get('FINANCE_PROFILE_DIR', 'profiles')
+MAX_PROFILES = 50
+
+_SAFE_NAME = re.compile(r'^[\w.-]+\.(prof|json)$')
+
+
+def _rotate():
+    """Keep only the newest MAX_PROFILES captures"""
+    captures = sorted(
+        (f for f in os.listdir(PROFILE_DIR) if f.endswith('.prof')),
+        key=lambda f: os.path.getmtime(os.path.join(PROFILE_DIR, f)),
+        reverse=True
+    )
+    for name in captures[MAX_PROFILES:]:
+        for path in (name, name[:-len('.prof')] + '.json'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, path))
+            except FileNotFoundError:
+                pass
+
+
+def _save(profiler, callback, elapsed, args, kwargs, error):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = f"{datetime.now():%Y%m%d-%H%M%S-%f}_{callback}"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, stem + '.prof'))
+    with open(os.path.join(PROFILE_DIR, stem + '.json'), 'w') as f:
+        json.dump({
+            'callback': callback,
+            'elapsed': elapsed,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'inputs': {'args': args, 'kwargs': kwargs},
+            'error': error
+        }, f, indent=2, default=str)
+    _rotate()
+
+
+def profile_slow(func):
+    """Capture a cProfile snapshot and the inputs of calls slower than the threshold"""
+    if not PROFILING_ENABLED:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        error = None
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed >= SLOW_CALLBACK_SECONDS:
+                try:
+                    _save(profiler, func.__name__, elapsed, args, kwargs, error)
+                except OSError as e:
+                    print(f"Could not save profile for {func.__name__}: {e}")
+    return wrapper
+
+
+def list_profiles():
+    """Saved captures, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    captures = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith('.json'):
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                captures.append({'stem': name[:-len('.json')], **json.load(f)})
+    return captures
+
+
+def profile_summary(stem, limit=30):
+    """Top functions by cumulative time for one capture"""
+    out = io.StringIO()
+    stats = pstats.Stats(os.path.join(PROFILE_DIR, stem + '.prof'), stream=out)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def register_admin(server):
+    """Add the /admin/profiles pages to the Flask server (profiling mode only)"""
+    if not PROFILING_ENABLED:
+        return
+    from flask import Response, abort, send_from_directory
+
+    @server.route('/admin/profiles')
+    def profiles_index():
+        rows = ''.join(
+            f"<tr><td>{html.escape(p['timestamp'])}</td><td>{html.escape(p['callback'])}</td>"
+            f"<td>{p['elapsed']:.3f}s</td><td><code>{html.escape(json.dumps(p['inputs'], default=str))}</code></td>"
+            f"<td><a href='/admin/profiles/{p['stem']}/stats'>stats</a> · "
+            f"<a href='/admin/profiles/{p['stem']}.prof'>.prof</a> · "
+            f"<a href='/admin/profiles/{p['stem']}.json'>inputs</a></td></tr>"
+            for p in list_profiles()
+        )
+        return (
+            "<html><head><title>Slow callback profiles</title></head><body style='font-family: sans-serif'>"
+            f"<h2>Slow callback profiles (&ge; {SLOW_CALLBACK_SECONDS}s)</h2>"
+            "<table border='1' cellpadding='6' style='border-collapse: collapse'>"
+            "<tr><th>Time</th><th>Callback</th><th>Elapsed</th><th>Inputs</th><th></th></tr>"
+            f"{rows}</table></body></html>"
+        )
+
+    @server.route('/admin/profiles/<name>')
+    def profiles_download(name):
+        if not _SAFE_NAME.match(name):
+            abort(404)
+        return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
+
+    @server.route('/admin/profiles/<stem>/stats')
+    def profiles_stats(stem):
+        if not _SAFE_NAME.match(stem + '.prof') or not os.path.exists(os.path.join(PROFILE_DIR, stem + '.prof')):
+            abort(404)
+        return Response(profile_summary(stem), mimetype='text/plain')
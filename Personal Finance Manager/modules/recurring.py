@@ -0,0 +1,277 @@
+import threading
+import time
+
+from modules import dedup, fx, memory, process_data
+from modules.lazy import lazy_import
+from modules.metrics import timed
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Recurring transactions: rent, salaries, subscriptions.
+#
+# Rows are grouped into series by description core (letters only, as in
+# modules/dedup.py, so "NETFLIX.COM 8841" and "Netflix.com 9120" match) and,
+# within a core, by amount: sorted amounts split wherever neighbours are further
+# apart than the tolerance. Each series keeps running statistics: occurrences,
+# first and last day, amount range, and how many of the gaps between consecutive
+# occurrences fall within each period's window below. A series is recurring
+# when enough of its gaps fit one period.
+#
+# The full history is summarized in one vectorized pass (sorts and bincounts).
+# Inserts summarize just the new rows the same way and merge them into the
+# matching series, so results are kept up to date without rereading history.
+# Rows older than their series' latest occurrence, or very large batches, make
+# the detector rebuild on next use instead.
+
+# Gap windows in days, inclusive; months and years flex with calendar and weekend shifts
+PERIODS = {
+    'weekly': (6, 8),
+    'biweekly': (13, 15),
+    'monthly': (26, 35),
+    'quarterly': (85, 97),
+    'yearly': (355, 375),
+}
+# Step to the next occurrence: ('D', days) or ('M', months)
+STEPS = {'weekly': ('D', 7), 'biweekly': ('D', 14), 'monthly': ('M', 1), 'quarterly': ('M', 3), 'yearly': ('M', 12)}
+MIN_OCCURRENCES = {'weekly': 4, 'biweekly': 3, 'monthly': 3, 'quarterly': 3, 'yearly': 3}
+MIN_REGULARITY = 0.7        # share of a series' gaps that must fit its period
+AMOUNT_TOLERANCE = 0.05     # relative, with an absolute floor of AMOUNT_FLOOR
+AMOUNT_FLOOR = 1.0
+INCREMENTAL_LIMIT = 100_000
+
+# Columns of detect()
+COLUMNS = ['description', 'category', 'period', 'amount', 'count', 'first', 'last', 'next', 'regularity', 'active']
+
+_detector = None
+_lock = threading.Lock()
+_cache = {}                 # (data version, as-of day) -> detect() result
+
+
+def _tolerance(amounts):
+    return np.maximum(AMOUNT_FLOOR, AMOUNT_TOLERANCE * np.abs(amounts))
+
+
+@timed('finance_data_seconds', count_rows=True)
+def summarize(df):
+    """Series statistics for a batch of transactions, one row per (core, amount cluster)"""
+    columns = ['core', 'description', 'category', 'lo', 'hi', 'total', 'count', 'first', 'last', 'intervals', *PERIODS]
+    # Amounts in one currency, so that a series' amounts compare across accounts
+    df = fx.convert_frame(df)
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    days = process_data.to_epoch_days(df['date']).astype('int64')
+    amounts = pd.to_numeric(df['amount']).to_numpy(dtype=float)
+    # Factorize first, so string conversions only touch distinct values. Missing
+    # values get code -1, which picks the '' appended at the end.
+    desc_codes, descriptions = pd.factorize(df['description'])
+    descriptions = pd.Index(list(descriptions) + [''], dtype=object).astype(str)
+    cat_codes, categories = pd.factorize(df['category'])
+    categories = pd.Index(list(categories) + [''], dtype=object).astype(str)
+    core_of_desc, cores = pd.factorize(dedup.normalize_descriptions(descriptions)[1])
+    core_codes = core_of_desc[desc_codes]
+
+    # Amount clusters within each core: sort on one packed (core, cents) key
+    cents = np.round(amounts * 100).astype('int64')
+    order = np.argsort((core_codes.astype('int64') << 40) | (cents + (1 << 39)))
+    sorted_amounts = amounts[order]
+    starts = np.r_[True, (np.diff(core_codes[order]) != 0) | (np.diff(sorted_amounts) > _tolerance(sorted_amounts[:-1]))]
+    cluster = np.empty(len(df), dtype='int64')
+    cluster[order] = np.cumsum(starts) - 1
+
+    # Each series' rows in day order, then per-series reductions over the runs
+    order = np.argsort((cluster << 24) | (days - days.min()))
+    series, day, amount = cluster[order], days[order], amounts[order]
+    same = series[1:] == series[:-1]
+    gaps = np.diff(day)
+    first = np.flatnonzero(np.r_[True, ~same])
+    last = np.r_[first[1:] - 1, len(series) - 1]
+    stats = pd.DataFrame({
+        'core': cores[core_codes[order[first]]],
+        'description': descriptions[desc_codes[order[last]]],
+        'category': categories[cat_codes[order[last]]],
+        'lo': np.minimum.reduceat(amount, first),
+        'hi': np.maximum.reduceat(amount, first),
+        'total': np.add.reduceat(amount, first),
+        'count': np.diff(np.r_[first, len(series)]),
+        'first': day[first],
+        'last': day[last],
+        'intervals': np.bincount(series[1:][same], minlength=len(first))
+    })
+    for period, (low, high) in PERIODS.items():
+        fits = same & (gaps >= low) & (gaps <= high)
+        stats[period] = np.bincount(series[1:][fits], minlength=len(first))
+    return stats[columns]
+
+
+class Detector:
+    """Running statistics of every series in the store"""
+
+    def __init__(self, series):
+        self.series = series
+        self._by_core = series.groupby('core').indices if len(series) else {}
+
+    def add(self, df):
+        """Merge newly stored rows; False if they cannot be merged in place and a rebuild is needed"""
+        if len(df) > INCREMENTAL_LIMIT:
+            return False
+        batch = summarize(df)
+        if batch.empty:
+            return True
+        candidates = np.concatenate([np.empty(0, dtype='int64')]
+                                    + [self._by_core[core] for core in batch['core'].unique() if core in self._by_core])
+        pairs = batch.reset_index(names='new').merge(
+            self.series.iloc[candidates][['core', 'lo', 'hi', 'last']].reset_index(names='old'),
+            on='core', suffixes=('', '_old'))
+        pairs = pairs[(pairs['lo'] <= pairs['hi_old'] + _tolerance(pairs['hi_old']))
+                      & (pairs['hi'] >= pairs['lo_old'] - _tolerance(pairs['lo_old']))]
+        pairs = pairs.drop_duplicates('new').drop_duplicates('old')
+        if (pairs['first'] < pairs['last_old']).any():
+            return False
+
+        old, new = pairs['old'].to_numpy(), batch.loc[pairs['new']]
+        series = self.series
+        gap = new['first'].to_numpy() - series['last'].to_numpy()[old]
+        updated = series.iloc[old].copy()
+        updated['lo'] = np.minimum(updated['lo'].to_numpy(), new['lo'].to_numpy())
+        updated['hi'] = np.maximum(updated['hi'].to_numpy(), new['hi'].to_numpy())
+        for column in ('total', 'count'):
+            updated[column] = updated[column].to_numpy() + new[column].to_numpy()
+        updated['intervals'] = updated['intervals'].to_numpy() + new['intervals'].to_numpy() + 1
+        for period, (low, high) in PERIODS.items():
+            updated[period] = updated[period].to_numpy() + new[period].to_numpy() + ((gap >= low) & (gap <= high))
+        for column in ('description', 'category', 'last'):
+            updated[column] = new[column].to_numpy()
+        series.iloc[old] = updated
+
+        added = batch.drop(index=pairs['new'])
+        if len(added):
+            start = len(series)
+            self.series = pd.concat([series, added], ignore_index=True)
+            for offset, core in enumerate(added['core']):
+                self._by_core[core] = np.append(self._by_core.get(core, np.empty(0, 'int64')), start + offset)
+        return True
+
+
+def _built():
+    """The detector, built if needed; the caller holds process_data._write_lock"""
+    global _detector
+    with _lock:
+        if _detector is None:
+            start = time.perf_counter()
+            _detector = Detector(summarize(process_data.load_transactions()))
+            memory.track('recurring', 'detector', _detector, cost=time.perf_counter() - start, drop=lambda _: reset())
+        return _detector
+
+
+def _get_detector():
+    return process_data.derived(_lock, lambda: _detector, _built)
+
+
+def apply(df, sign=1):
+    """Fold newly stored rows into the detector (falling back to a rebuild on next use)
+
+    Running statistics cannot give rows back, so removed rows (sign=-1) always
+    mean a rebuild.
+    """
+    global _detector
+    with _lock:
+        if _detector is None:
+            return
+        if sign < 0 or not _detector.add(df):
+            _detector = None
+            memory.forget('recurring')
+        else:
+            memory.track('recurring', 'detector', _detector)
+
+
+def reset():
+    """Forget the detector; it is rebuilt on next use"""
+    global _detector
+    with _lock:
+        _detector = None
+    memory.forget('recurring')
+
+
+def _next_dates(last_days, period, occurrence=1):
+    unit, step = STEPS[period]
+    last = pd.to_datetime(last_days, unit='D')
+    if unit == 'D':
+        return last + pd.to_timedelta(step * occurrence, unit='D')
+    return last + pd.DateOffset(months=step * occurrence)
+
+
+def detect(as_of=None):
+    """Recurring series as a DataFrame, most recent first
+
+    Columns: description, category, period, amount (average), count, first,
+    last, next (expected date), regularity (share of gaps that fit the period)
+    and active (seen within two periods of as_of, default the latest row).
+    Results are cached until the stored data changes. None are found in
+    rollup-only mode (modules/memory.py), where rows are not loaded.
+    """
+    if memory.rollup_only():
+        return pd.DataFrame(columns=COLUMNS)
+    detector = _get_detector()
+    key = (process_data.data_version(), id(detector), None if as_of is None else pd.Timestamp(as_of).normalize())
+    with _lock:
+        if key in _cache:
+            return _cache[key]
+        series = detector.series.copy()
+
+    names = list(PERIODS)
+    hits = series[names].to_numpy(dtype='int64')
+    best = hits.argmax(axis=1) if len(series) else np.empty(0, dtype='int64')
+    intervals = series['intervals'].to_numpy()
+    regularity = hits[np.arange(len(series)), best] / np.maximum(intervals, 1)
+    period = np.array(names, dtype=object)[best]
+    needed = np.array([MIN_OCCURRENCES[name] for name in names])[best]
+    average = (series['total'] / series['count']).to_numpy(dtype=float)
+    # Clusters can chain drifting amounts; a recurring charge stays within one tolerance overall
+    steady = (series['hi'] - series['lo']).to_numpy(dtype=float) <= _tolerance(average)
+    keep = (intervals > 0) & (regularity >= MIN_REGULARITY) & (series['count'].to_numpy() >= needed) & steady
+
+    result = series[keep].assign(period=period[keep], regularity=regularity[keep], amount=average[keep])
+    next_dates = pd.Series(pd.NaT, index=result.index, dtype='datetime64[ns]')
+    for name in PERIODS:
+        rows = (result['period'] == name).to_numpy()
+        if rows.any():
+            next_dates[rows] = _next_dates(result['last'].to_numpy()[rows], name)
+    result['next'] = next_dates
+    if as_of is not None:
+        as_of_day = int(process_data.to_epoch_days(pd.Series([key[2]]))[0])
+    else:
+        as_of_day = int(series['last'].max()) if len(series) else 0
+    allowed = result['period'].map({name: 2 * high for name, (low, high) in PERIODS.items()})
+    result['active'] = (as_of_day - result['last']) <= allowed
+    for column in ('first', 'last'):
+        result[column] = pd.to_datetime(result[column], unit='D')
+    result = result.sort_values('last', ascending=False, ignore_index=True)[COLUMNS]
+    with _lock:
+        _cache.clear()
+        _cache[key] = result
+    return result
+
+
+def upcoming(as_of, days=30):
+    """Projected occurrences of active recurring series in the days after as_of"""
+    as_of = pd.Timestamp(as_of).normalize()
+    horizon = as_of + pd.Timedelta(days=days)
+    active = detect(as_of)
+    active = active[active['active']]
+    projections = []
+    for name, (low, high) in PERIODS.items():
+        rows = active[active['period'] == name]
+        if rows.empty:
+            continue
+        last = (rows['last'] - pd.Timestamp('1970-01-01')).dt.days.to_numpy()
+        # Enough steps to pass the horizon from the oldest last occurrence
+        steps = int(((horizon - rows['last'].min()).days) // low) + 1
+        for k in range(1, steps + 1):
+            dates = _next_dates(last, name, k)
+            due = (dates > as_of) & (dates <= horizon)
+            if due.any():
+                projections.append(rows[due][['description', 'category', 'amount', 'period']].assign(date=dates[due]))
+    if not projections:
+        return pd.DataFrame(columns=['date', 'description', 'category', 'amount', 'period'])
+    return pd.concat(projections).sort_values('date', ignore_index=True)[['date', 'description', 'category', 'amount', 'period']]
@@ -0,0 +1,217 @@
+import threading
+import time
+
+from modules import fx, memory, process_data, shared_cache
+from modules.lazy import lazy_import
+from modules.metrics import timed
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Month x category totals (amount, net and row count), the pre-aggregate that monthly
+# views, budgets and forecasts read instead of rescanning every transaction.
+#
+# Built once, with the grouping pushed down to the database when there is one,
+# then kept current with deltas: inserts add their rows, and recategorization
+# moves rows from their old category to the new one.
+#
+# Totals are kept per currency, in that currency. Readers get them converted
+# to one currency at each month's average rate (modules/fx.py), cached per
+# (currency, data version), so switching the display currency converts a few
+# thousand rollup rows rather than rescanning transactions.
+#
+# In rollup-only mode (modules/memory.py) the dashboard reads as_rows(): the
+# rollup shaped like transactions, one row per month and category.
+
+# Portable across PostgreSQL, SQLite and DuckDB: 'YYYY-MM' from an ISO date
+MONTH_SQL = "SUBSTR(CAST(date AS TEXT), 1, 7)"
+# Signed amount: what a row adds to net cash flow (see process_data.TYPE_SIGNS)
+NET_SQL = "CASE type WHEN 'income' THEN amount WHEN 'expense' THEN -amount ELSE 0 END"
+
+_rollup = None
+_lock = threading.Lock()
+_converted = {}             # (currency, data version, rate table) -> converted rollup
+
+
+def to_months(dates):
+    """'YYYY-MM' for each date, parsing each distinct date once"""
+    codes, uniques = pd.factorize(pd.Series(dates))
+    months = pd.to_datetime(uniques, format='mixed').strftime('%Y-%m').to_numpy()
+    return months[codes]
+
+
+def _aggregate(df, sign=1):
+    amounts = pd.to_numeric(df['amount']).to_numpy() * sign
+    currencies = df['currency'].fillna(fx.BASE_CURRENCY) if 'currency' in df else fx.BASE_CURRENCY
+    totals = pd.DataFrame({
+        'month': to_months(df['date']),
+        'category': df['category'].to_numpy(),
+        'currency': currencies,
+        'amount': amounts,
+        'net': process_data.type_signs(df) * amounts
+    }, index=df.index).groupby(['month', 'category', 'currency']).agg(
+        amount=('amount', 'sum'), net=('net', 'sum'), count=('amount', 'size'))
+    totals['count'] *= sign
+    return totals
+
+
+@timed('finance_data_seconds')
+def _build():
+    engine = process_data.get_engine()
+    if engine is not None:
+        try:
+            totals = pd.read_sql(
+                f"SELECT {MONTH_SQL} AS month, category, currency, SUM(amount) AS amount, SUM({NET_SQL}) AS net, "
+                f"COUNT(*) AS count FROM transactions GROUP BY {MONTH_SQL}, category, currency", engine)
+            totals[['amount', 'net']] = totals[['amount', 'net']].astype(float)
+            return totals.set_index(['month', 'category', 'currency']).sort_index()
+        except Exception as e:
+            print(f"Error building rollup in DB: {e}, falling back to CSV")
+    # A chunk at a time, so that building never holds every row in memory
+    totals = None
+    for chunk in process_data.iter_transactions():
+        part = _aggregate(chunk)
+        totals = part if totals is None else totals.add(part, fill_value=0)
+    if totals is None:
+        return _aggregate(pd.DataFrame(columns=process_data.TRANSACTION_COLUMNS))
+    totals['count'] = totals['count'].astype('int64')
+    return totals.sort_index()
+
+
+def _built():
+    """The rollup frame, built if needed; the caller holds process_data._write_lock"""
+    global _rollup
+    with _lock:
+        if _rollup is None:
+            start = time.perf_counter()
+            # Worker processes share one build per store version (modules/shared_cache.py)
+            _rollup = shared_cache.cached(('rollup',), _build)
+            # Kept whatever the memory budget: rollup-only mode serves from it
+            memory.track('rollup', 'totals', _rollup, cost=time.perf_counter() - start, pinned=True)
+        return _rollup
+
+
+def _current():
+    return process_data.derived(_lock, lambda: _rollup, _built)
+
+
+def _convert(totals, currency):
+    """Per-currency totals summed over currencies, in currency at each month's average rate"""
+    months = totals.index.get_level_values('month')
+    sources = totals.index.get_level_values('currency')
+    factor = np.ones(len(totals))
+    foreign = np.asarray(sources != currency)
+    if foreign.any():
+        rates = fx.get_rates()
+        factor[foreign] = rates.monthly_to_base(sources[foreign], months[foreign])
+        if currency != fx.BASE_CURRENCY:
+            factor[foreign] /= rates.monthly_to_base([currency] * int(foreign.sum()), months[foreign])
+    # Amounts without a rate are left out, like rows in fx.convert_frame
+    converted = totals.assign(amount=totals['amount'] * factor, net=totals['net'] * factor)[~np.isnan(factor)]
+    return converted.groupby(level=['month', 'category']).sum()
+
+
+def _in_currency(currency):
+    currency = (currency or fx.BASE_CURRENCY).upper()
+    rollup = _current()
+    key = (currency, process_data.data_version(), fx.get_rates())
+    with _lock:
+        cached = _converted.get(key)
+        if cached is not None and cached[0] is rollup:
+            memory.touch('converted_rollup', key)
+            return cached[1]
+    start = time.perf_counter()
+    converted = _convert(rollup, currency)
+    with _lock:
+        # Entries for older data versions are never asked for again
+        old = [k for k in _converted if k[1] != key[1] or k[2] is not key[2]]
+        for k in old:
+            del _converted[k]
+        _converted[key] = (rollup, converted)
+    for k in old:
+        memory.forget('converted_rollup', k)
+    memory.track('converted_rollup', key, converted, cost=time.perf_counter() - start, drop=_drop_converted)
+    return converted
+
+
+def _drop_converted(key):
+    with _lock:
+        _converted.pop(key, None)
+
+
+def get_rollup(currency=None):
+    """Month x category totals as a DataFrame (month, category, amount, net, count), in currency
+
+    currency defaults to fx.BASE_CURRENCY.
+    """
+    return _in_currency(currency).reset_index()
+
+
+def as_rows(currency=None):
+    """The rollup shaped like transactions, in currency: one row per month and category, dated the 1st
+
+    A row's type follows the sign of its net cash flow, and its amount is the
+    size of that net, or the total for categories that net to nothing, such as
+    transfers.
+    """
+    currency = (currency or fx.BASE_CURRENCY).upper()
+    totals = _in_currency(currency).reset_index()
+    net = totals['net'].to_numpy(dtype=float)
+    return pd.DataFrame({
+        'id': -1 - np.arange(len(totals)),
+        'date': totals['month'] + '-01',
+        'category': totals['category'],
+        'amount': np.where(net != 0, np.abs(net), totals['amount'].to_numpy(dtype=float)),
+        'description': totals['count'].map('{:,} transactions'.format),
+        'type': np.select([net > 0, net < 0], ['income', 'expense'], 'transfer'),
+        'account': None,
+        'transfer_id': None,
+        'currency': currency
+    })
+
+
+def month_totals(month, currency=None):
+    """Category totals (amount, net, count) for one 'YYYY-MM' month, indexed by category"""
+    rollup = _in_currency(currency)
+    if month not in rollup.index.get_level_values('month'):
+        return pd.DataFrame({'amount': pd.Series(dtype=float), 'net': pd.Series(dtype=float),
+                             'count': pd.Series(dtype='int64')},
+                            index=pd.Index([], name='category'))
+    return rollup.xs(month, level='month')
+
+
+def touched(df):
+    """Current totals and this batch's share of them, for the (month, category) pairs df touched
+
+    In fx.BASE_CURRENCY. For callers inside an insert, after apply(df); they
+    hold process_data._write_lock.
+    """
+    delta = _aggregate(df)
+    pairs = delta.index.droplevel('currency').unique()
+    current = _built()
+    current = current[current.index.droplevel('currency').isin(pairs)]
+    after = _convert(current, fx.BASE_CURRENCY)['amount'] if len(current) else pd.Series(dtype=float)
+    delta = _convert(delta, fx.BASE_CURRENCY)['amount']
+    return after.reindex(delta.index, fill_value=0), delta
+
+
+def apply(df, sign=1):
+    """Fold rows into the rollup: sign=1 for added rows, -1 for removed ones"""
+    global _rollup
+    if df.empty:
+        return
+    with _lock:
+        if _rollup is None:
+            return
+        merged = _rollup.add(_aggregate(df, sign), fill_value=0)
+        merged['count'] = merged['count'].astype('int64')
+        _rollup = merged[merged['count'] != 0]
+        memory.track('rollup', 'totals', _rollup)
+
+
+def reset():
+    """Forget the rollup; it is rebuilt on next use"""
+    global _rollup
+    with _lock:
+        _rollup = None
+    memory.forget('rollup')
@@ -0,0 +1,305 @@
+import bisect
+import re
+import threading
+import time
+
+from modules import memory, process_data
+from modules.lazy import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Full-text search over transaction descriptions.
+#
+# Queries are whitespace-separated clauses that must all match:
+#   coffee        the word "coffee"
+#   uber*         any word starting with "uber"
+#   "whole foods" the words "whole foods" next to each other
+#
+# On PostgreSQL the query becomes a tsquery over a GIN-indexed tsvector (see
+# finance.sql). Otherwise an in-process index is used. Transactions are held
+# column by column with descriptions dictionary-encoded, and the inverted index
+# maps each word to the distinct descriptions containing it. A query resolves to
+# a set of descriptions, and one vectorized pass over the rows then applies it
+# together with the other filters (modules/ledger.py). Both are extended on insert.
+# Corrections (modules/corrections.py) overwrite a row's columns in place, or
+# mark it deleted so that every query skips it.
+
+_TOKEN = re.compile(r'[a-z0-9]+')
+_CLAUSE = re.compile(r'"([^"]*)"|(\S+)')
+
+# Must match the expression indexed in finance.sql for the GIN index to be used
+TSVECTOR_SQL = "to_tsvector('simple', coalesce(description, ''))"
+
+_index = None
+_lock = threading.RLock()
+# Held while reading the index, so an insert never lands mid-query
+index_lock = _lock
+
+
+def tokenize(text):
+    """Lowercase alphanumeric words of a description or query"""
+    return _TOKEN.findall(str(text).lower())
+
+
+def parse_query(query):
+    """Clauses of a query: ('word', w), ('prefix', p) or ('phrase', [w1, w2, ...])"""
+    clauses = []
+    for phrase, term in _CLAUSE.findall(query or ''):
+        words = tokenize(phrase if phrase else term)
+        if not words:
+            continue
+        if term.endswith('*') and len(words) == 1:
+            clauses.append(('prefix', words[0]))
+        elif len(words) == 1:
+            clauses.append(('word', words[0]))
+        else:
+            clauses.append(('phrase', words))
+    return clauses
+
+
+def to_tsquery(clauses):
+    """PostgreSQL tsquery text for parsed clauses"""
+    parts = []
+    for kind, value in clauses:
+        if kind == 'word':
+            parts.append(value)
+        elif kind == 'prefix':
+            parts.append(f'{value}:*')
+        else:
+            parts.append('(' + ' <-> '.join(value) + ')')
+    return ' & '.join(parts)
+
+
+# Sort keys pack (value, row id) into one int64: value in the high 32 bits, row id in the low
+ROW_BITS = 32
+ROW_MASK = (1 << ROW_BITS) - 1
+SORTABLE = ('date', 'amount', 'category', 'description', 'account')
+
+
+class TransactionIndex:
+    """Columnar copy of the transactions plus an inverted index over distinct descriptions"""
+
+    def __init__(self):
+        self.descriptions = []      # distinct description text, by id
+        self.desc_ids = {}          # description text -> id
+        self.desc_words = []        # ' word word ' per description id, for phrase checks
+        self.postings = {}          # word -> set of description ids
+        self.vocabulary = []        # sorted words, for prefix queries
+        self.categories = []
+        self.category_ids = {}
+        self.accounts = []
+        self.account_ids = {}
+        self._chunks = []           # (days, category ids, amounts, description ids, account ids, store ids) per append
+        self._columns = None
+        self._by_id = None          # (row positions in store id order, sorted store ids), for corrections
+        self.deleted = None         # boolean mask of rows deleted since the index was built
+        self.rows = 0
+        self.version = 0            # bumped on every append, for caches keyed on the contents
+        self._sorted = {}           # column -> sorted sort keys
+
+    def _description_id(self, text):
+        desc_id = self.desc_ids.get(text)
+        if desc_id is None:
+            desc_id = self.desc_ids[text] = len(self.descriptions)
+            self.descriptions.append(text)
+            words = tokenize(text)
+            self.desc_words.append(' ' + ' '.join(words) + ' ')
+            for word in set(words):
+                ids = self.postings.get(word)
+                if ids is None:
+                    ids = self.postings[word] = set()
+                    bisect.insort(self.vocabulary, word)
+                ids.add(desc_id)
+        return desc_id
+
+    def _category_id(self, name):
+        cat_id = self.category_ids.get(name)
+        if cat_id is None:
+            cat_id = self.category_ids[name] = len(self.categories)
+            self.categories.append(name)
+        return cat_id
+
+    def _account_id(self, name):
+        account_id = self.account_ids.get(name)
+        if account_id is None:
+            account_id = self.account_ids[name] = len(self.accounts)
+            self.accounts.append(name)
+        return account_id
+
+    def append(self, df):
+        """Add rows in store order; their store ids are df['id'], or the next row numbers without one"""
+        if df.empty:
+            return
+        desc_codes, desc_uniques = pd.factorize(df['description'].fillna('').astype(str))
+        cat_codes, cat_uniques = pd.factorize(df['category'].astype(str))
+        desc_map = np.array([self._description_id(d) for d in desc_uniques], dtype='int32')
+        cat_map = np.array([self._category_id(c) for c in cat_uniques], dtype='int32')
+        account_codes, account_uniques = pd.factorize(df['account'].astype(str))
+        account_map = np.array([self._account_id(a) for a in account_uniques], dtype='int32')
+        chunk = (
+            process_data.to_epoch_days(df['date']).astype('int32'),
+            cat_map[cat_codes],
+            pd.to_numeric(df['amount']).to_numpy(dtype=float),
+            desc_map[desc_codes],
+            account_map[account_codes],
+            df['id'].to_numpy(dtype='int64') if 'id' in df else np.arange(self.rows, self.rows + len(df), dtype='int64')
+        )
+        self._chunks.append(chunk)
+        self._columns = None
+        self._by_id = None
+        if self.deleted is not None:
+            self.deleted = np.append(self.deleted, np.zeros(len(df), dtype=bool))
+
+        # Date and amount keys don't depend on other rows, so their sorted keys
+        # absorb the new rows; category, description and account ranks may
+        # shift, so those are rebuilt on next use
+        ids = np.arange(self.rows, self.rows + len(df), dtype='int64')
+        for column in list(self._sorted):
+            if column in ('date', 'amount'):
+                new = np.sort(self._keys(column, chunk, ids))
+                self._sorted[column] = np.insert(self._sorted[column], np.searchsorted(self._sorted[column], new), new)
+            else:
+                del self._sorted[column]
+        self.rows += len(df)
+        self.version += 1
+
+    def columns(self):
+        """(days, category ids, amounts, description ids, account ids, store ids) for every row"""
+        if self._columns is None:
+            if not self._chunks:
+                return tuple(np.empty(0, dtype=t) for t in ('int32', 'int32', 'float64', 'int32', 'int32', 'int64'))
+            self._columns = tuple(np.concatenate(parts) for parts in zip(*self._chunks))
+            self._chunks = [self._columns]
+        return self._columns
+
+    def _keys(self, column, columns, ids):
+        days, cat_ids, amounts, desc_ids, account_ids = columns[:5]
+        if column == 'date':
+            values = days.astype('int64')
+        elif column == 'amount':
+            values = np.round(amounts * 100).astype('int64')
+        elif column == 'category':
+            ranks = np.argsort(np.argsort(np.array(self.categories, dtype=object)))
+            values = ranks[cat_ids].astype('int64')
+        elif column == 'account':
+            ranks = np.argsort(np.argsort(np.array(self.accounts, dtype=object)))
+            values = ranks[account_ids].astype('int64')
+        else:
+            ranks = np.argsort(np.argsort(np.array([d.lower() for d in self.descriptions], dtype=object)))
+            values = ranks[desc_ids].astype('int64')
+        return (values << ROW_BITS) | ids
+
+    def sorted_keys(self, column):
+        """Ascending (value, row id) sort keys of every row for one column"""
+        keys = self._sorted.get(column)
+        if keys is None:
+            columns = self.columns()
+            keys = self._sorted[column] = np.sort(self._keys(column, columns, np.arange(self.rows, dtype='int64')))
+        return keys
+
+    def positions(self, ids):
+        """Row of each store id; -1 for ids not in the index"""
+        ids = np.asarray(ids, dtype='int64')
+        if not self.rows:
+            return np.full(len(ids), -1)
+        if self._by_id is None:
+            store_ids = self.columns()[5]
+            order = np.argsort(store_ids, kind='stable')
+            self._by_id = (order, store_ids[order])
+        order, sorted_ids = self._by_id
+        rows = order[np.minimum(np.searchsorted(sorted_ids, ids), self.rows - 1)]
+        return np.where(self.columns()[5][rows] == ids, rows, -1)
+
+    def correct(self, ids, df):
+        """Apply corrections: rows of ids found in df (by its id column) take its values, the rest are deleted"""
+        rows = self.positions(ids)
+        ids, rows = np.asarray(ids, dtype='int64')[rows >= 0], rows[rows >= 0]
+        if not len(rows):
+            return
+        updated = df.set_index('id').reindex(ids)
+        kept = updated['date'].notna().to_numpy()
+        if (~kept).any():
+            if self.deleted is None:
+                self.deleted = np.zeros(self.rows, dtype=bool)
+            self.deleted[rows[~kept]] = True
+        if kept.any():
+            rows, updated = rows[kept], updated[kept]
+            columns = self.columns()
+            before = tuple(c[rows] for c in columns)
+            old = {column: self._keys(column, before, rows) for column in ('date', 'amount') if column in self._sorted}
+            columns[0][rows] = process_data.to_epoch_days(updated['date'])
+            columns[1][rows] = [self._category_id(c) for c in updated['category'].astype(str)]
+            columns[2][rows] = pd.to_numeric(updated['amount']).to_numpy(dtype=float)
+            columns[3][rows] = [self._description_id(d) for d in updated['description'].fillna('').astype(str)]
+            columns[4][rows] = [self._account_id(a) for a in updated['account'].astype(str)]
+            # Date and amount keys swap the old key for the new; ranked columns are rebuilt on next use
+            for column in list(self._sorted):
+                if column in old:
+                    keys = np.delete(self._sorted[column], np.searchsorted(self._sorted[column], old[column]))
+                    new = np.sort(self._keys(column, tuple(c[rows] for c in columns), rows))
+                    self._sorted[column] = np.insert(keys, np.searchsorted(keys, new), new)
+                else:
+                    del self._sorted[column]
+        self.version += 1
+
+    def matching_descriptions(self, clauses):
+        """Ids of distinct descriptions satisfying every clause"""
+        result = None
+        for kind, value in clauses:
+            if kind == 'word':
+                ids = self.postings.get(value, set())
+            elif kind == 'prefix':
+                start = bisect.bisect_left(self.vocabulary, value)
+                end = bisect.bisect_left(self.vocabulary, value + '\uffff')
+                ids = set().union(*(self.postings[w] for w in self.vocabulary[start:end]))
+            else:
+                candidates = set.intersection(*(self.postings.get(w, set()) for w in value))
+                needle = ' ' + ' '.join(value) + ' '
+                ids = {i for i in candidates if needle in self.desc_words[i]}
+            result = ids if result is None else result & ids
+            if not result:
+                break
+        return result
+
+
+def _built():
+    """The in-process index, built if needed; the caller holds process_data._write_lock"""
+    global _index
+    with _lock:
+        if _index is None:
+            start = time.perf_counter()
+            index = TransactionIndex()
+            index.append(process_data.load_transactions())
+            _index = index
+            memory.track('search', 'index', index, cost=time.perf_counter() - start, drop=lambda _: reset())
+        return _index
+
+
+def get_index():
+    """The in-process index, built from the store on first use (use under index_lock)"""
+    return process_data.derived(_lock, lambda: _index, _built)
+
+
+def apply(df):
+    """Extend the in-process index with newly stored rows"""
+    with _lock:
+        if _index is not None:
+            _index.append(df)
+            memory.track('search', 'index', _index)
+
+
+def correct(ids, df):
+    """Apply corrections of stored rows to the in-process index (see TransactionIndex.correct)"""
+    with _lock:
+        if _index is not None:
+            _index.correct(ids, df)
+            memory.track('search', 'index', _index)
+
+
+def reset():
+    """Forget the in-process index; it is rebuilt on next use"""
+    global _index
+    with _lock:
+        _index = None
+    memory.forget('search')
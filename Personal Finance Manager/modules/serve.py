@@ -0,0 +1,125 @@
+import os
+import signal
+import socket
+import sys
+
+# Production entry point: the app in several worker processes.
+#
+#   python -m modules.serve --workers 4 --port 8050
+#
+# Runs under gunicorn when it is installed. Otherwise the parent binds the
+# port and forks the workers, which accept connections on the shared socket
+# with Werkzeug's threaded server; a worker that exits is replaced.
+#
+# FINANCE_WORKERS is set before the app is imported, so the workers share the
+# cache tier of modules/shared_cache.py and see each other's writes. The app is
+# imported in each worker after the fork, so no worker inherits another's
+# database connections or background threads.
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_THREADS = 8
+
+
+def _application():
+    from app import app
+    return app.server
+
+
+def run_gunicorn(host, port, workers, threads):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+
+        def load(self):
+            return _application()
+
+    Application().run()
+
+
+def _serve(listener, host, port):
+    """Worker process: serve the app on the inherited socket until told to stop"""
+    from werkzeug.serving import make_server
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server = make_server(host, port, _application(), threaded=True, fd=listener.fileno())
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server.serve_forever()
+
+
+def run_prefork(host, port, workers):
+    listener = socket.create_server((host, port), backlog=128)
+    listener.set_inheritable(True)
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _serve(listener, host, port)
+            except SystemExit as e:
+                code = e.code or 0
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            os._exit(code)
+        children.add(pid)
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    print(f"Serving on http://{host}:{port} with {workers} workers")
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, starting another")
+            spawn()
+    listener.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve the app with several worker processes')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help='threads per worker (gunicorn only)')
+    parser.add_argument('--no-gunicorn', action='store_true', help='use the built-in pre-forking server')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+
+    os.environ['FINANCE_WORKERS'] = str(args.workers)
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+    if gunicorn is not None and not args.no_gunicorn:
+        run_gunicorn(args.host, args.port, args.workers, args.threads)
+    else:
+        run_prefork(args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,433 @@
+import base64
+import fcntl
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from modules.lazy import lazy_import
+from modules.metrics import inc
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Shared cache tier for running the app in several worker processes (modules/serve.py).
+#
+# Each worker keeps its own state derived from the store (rollup, search index,
+# category dictionary, balances, ...) and updates it on its own writes. Writes
+# by other workers are seen through a version counter in the shared backend:
+# every write increments it, and each request, and each writer once it holds
+# the store lock, first compares it with the version this worker last saw. A
+# worker that missed a write drops its derived state (on_change), which is
+# rebuilt on next use.
+#
+# Values that are costly to compute and the same in every worker (rendered
+# callback responses, filtered transactions, the rollup) are kept in the backend
+# under keys that include the version, so no worker reads an entry made before
+# a write, and old entries age out.
+#
+# Backends: files in CACHE_DIR (the default; the page cache keeps them in
+# memory), or a Redis-compatible server (FINANCE_CACHE_URL=redis://host:6379/0)
+# spoken to directly over its wire protocol. The store lock is a file lock, so
+# the workers share one host either way.
+#
+# Values are stored as JSON (bytes base64-encoded, DataFrames as typed columns),
+# never pickled, so reading the backend cannot run code. Anyone who can write to
+# it can still change what the dashboard shows: keep the server private.
+#
+# The tier is off in a single process unless FINANCE_CACHE_URL is set.
+
+WORKERS = int(os.environ.get('FINANCE_WORKERS', 1))
+CACHE_URL = os.environ.get('FINANCE_CACHE_URL', '')
+CACHE_DIR = os.environ.get('FINANCE_CACHE_DIR', 'data/cache')
+CACHE_BYTES = int(os.environ.get('FINANCE_SHARED_CACHE_MB', 256)) * 1024 * 1024
+ENABLED = WORKERS > 1 or bool(CACHE_URL)
+TTL_SECONDS = 3600
+TIMEOUT_SECONDS = 2.0
+VERSION_KEY = 'finance:version'
+
+_backend = None
+_backend_lock = threading.Lock()
+_seen = None               # shared version this worker's derived state matches
+_seen_lock = threading.Lock()
+_resetters = []
+_warned = False
+
+
+class DiskBackend:
+    """Values as files in a directory; counters as files updated under a file lock"""
+
+    def __init__(self, root, max_bytes=CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._written = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, hashlib.sha1(key.encode()).hexdigest() + '.bin')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > TTL_SECONDS:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(value)
+        os.replace(tmp, path)
+        self._written += len(value)
+        if self._written > self.max_bytes // 8:
+            self._written = 0
+            self.sweep()
+
+    def sweep(self):
+        """Remove expired entries, then the oldest ones until the directory fits in 3/4 of max_bytes"""
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.root):
+            if not entry.name.endswith('.bin'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > TTL_SECONDS:
+                _remove(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * 3 // 4:
+                break
+            _remove(path)
+            total -= size
+
+    def _counter(self, key):
+        return os.path.join(self.root, key.replace(':', '-') + '.counter')
+
+    def incr(self, key):
+        with open(self._counter(key), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            value = int(f.read() or 0) + 1
+            f.seek(0)
+            f.truncate()
+            f.write(str(value))
+            f.flush()
+            return value
+
+    def read(self, key):
+        try:
+            with open(self._counter(key)) as f:
+                return int(f.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-compatible server"""
+
+
+def _encode(args):
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError("Connection closed by the cache server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest
+    if kind == b'-':
+        raise RedisError(rest.decode(errors='replace'))
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        length = int(rest)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b'*':
+        length = int(rest)
+        return None if length < 0 else [_read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Unexpected reply {line!r}")
+
+
+class RedisBackend:
+    """A Redis-compatible server, over one connection per thread"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.strip('/') or 0)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=TIMEOUT_SECONDS)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+            if self.password:
+                self.call('AUTH', self.password)
+            if self.db:
+                self.call('SELECT', self.db)
+        return conn
+
+    def call(self, *args):
+        """Send one command and return its reply"""
+        sock, reader = self._connection()
+        try:
+            sock.sendall(_encode(args))
+            return _read_reply(reader)
+        except OSError:
+            # Reconnect on the next call rather than reading a half-finished reply
+            self._local.conn = None
+            sock.close()
+            raise
+
+    def get(self, key):
+        return self.call('GET', key)
+
+    def set(self, key, value):
+        self.call('SET', key, value, 'PX', TTL_SECONDS * 1000)
+
+    def incr(self, key):
+        return int(self.call('INCR', key))
+
+    def read(self, key):
+        return int(self.call('GET', key) or 0)
+
+
+def get_backend():
+    """The configured backend, created on first use"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = RedisBackend(CACHE_URL) if CACHE_URL else DiskBackend(CACHE_DIR)
+        return _backend
+
+
+def _guarded(default, func, *args):
+    """func(*args), or default when the backend cannot be reached (reported once)"""
+    global _warned
+    try:
+        return func(*args)
+    except (OSError, RedisError) as e:
+        if not _warned:
+            _warned = True
+            print(f"Shared cache unavailable: {e}, continuing without it")
+        inc('finance_cache_requests_total', cache='shared', result='error')
+        return default
+
+
+def key(*parts):
+    """Backend key for a value computed at the current shared version"""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'finance:{version()}:{digest}'
+
+
+def _to_json(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode()}
+    if isinstance(value, pd.DataFrame):
+        names = list(value.index.names)
+        flat = value.reset_index()
+        columns = {}
+        for column, dtype in flat.dtypes.items():
+            values = flat[column]
+            if dtype.kind == 'M':
+                values = values.astype('int64')
+            columns[str(column)] = (str(dtype), values.tolist())
+        return {'__frame__': {'index': names, 'columns': list(value.columns), 'data': columns}}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot share a {type(value).__name__}")
+
+
+def _from_json(obj):
+    if '__bytes__' in obj:
+        return base64.b64decode(obj['__bytes__'])
+    if '__frame__' in obj:
+        frame = obj['__frame__']
+        flat = pd.DataFrame({column: pd.Series(values, dtype='int64' if dtype.startswith('datetime') else dtype)
+                                     .astype(dtype) for column, (dtype, values) in frame['data'].items()})
+        levels = list(flat.columns[:len(frame['index'])])
+        df = flat.set_index(levels) if levels else flat
+        df.index.names = frame['index']
+        return df[frame['columns']]
+    return obj
+
+
+def encode(value):
+    """Bytes for a value made of JSON types, bytes, numpy scalars and DataFrames; TypeError for anything else"""
+    return json.dumps(value, default=_to_json).encode()
+
+
+def decode(data):
+    """The value encode() was given"""
+    return json.loads(data, object_hook=_from_json)
+
+
+def get(name):
+    """Value stored under a key, or None"""
+    if not ENABLED:
+        return None
+    data = _guarded(None, lambda: get_backend().get(name))
+    value = None
+    if data is not None:
+        try:
+            value = decode(data)
+        except (ValueError, TypeError, KeyError):
+            # Written by another version of the app, or not by the app at all
+            value = None
+    inc('finance_cache_requests_total', cache='shared', result='miss' if value is None else 'hit')
+    return value
+
+
+def put(name, value):
+    """Store a value under a key for TTL_SECONDS (values encode() cannot take are not shared)"""
+    if ENABLED:
+        try:
+            data = encode(value)
+        except TypeError:
+            return
+        _guarded(None, lambda: get_backend().set(name, data))
+
+
+def cached(parts, func, *args):
+    """func(*args), shared between workers for the current version of the store
+
+    parts identify the value apart from the version. Without the shared tier
+    this just calls func.
+    """
+    if not ENABLED:
+        return func(*args)
+    name = key(*parts)
+    value = get(name)
+    if value is None:
+        value = func(*args)
+        put(name, value)
+    return value
+
+
+def version():
+    """The shared store version: how many writes any worker has made"""
+    if not ENABLED:
+        return 0
+    return _guarded(0, lambda: get_backend().read(VERSION_KEY))
+
+
+def on_change(func):
+    """Call func when another worker has changed the store (func drops derived state)"""
+    _resetters.append(func)
+    return func
+
+
+def bump():
+    """Record a write by this worker; writers call it after committing"""
+    global _seen
+    if not ENABLED:
+        return
+    current = _guarded(None, lambda: get_backend().incr(VERSION_KEY))
+    with _seen_lock:
+        # Only this worker's write since the last sync: its derived state is still current
+        if current is not None and _seen is not None and current == _seen + 1:
+            _seen = current
+
+
+def sync():
+    """Drop derived state if another worker wrote since this one last looked; True if it did"""
+    global _seen
+    if not ENABLED:
+        return False
+    current = version()
+    with _seen_lock:
+        if current == _seen:
+            return False
+        first = _seen is None
+        _seen = current
+    if first:
+        # Nothing derived yet predates the first look
+        return False
+    inc('finance_cache_invalidations_total')
+    for reset in _resetters:
+        reset()
+    return True
+
+
+class StoreLock:
+    """The store's write lock: a thread lock, plus a file lock shared by the workers when the tier is on
+
+    path is called for the lock file's path on each acquire, so the lock follows
+    the store. Acquiring it syncs with writes made by other workers.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._thread = threading.Lock()
+        self._file = None
+
+    def acquire(self):
+        self._thread.acquire()
+        if ENABLED:
+            try:
+                path = self._path()
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                f = open(path, 'a')
+                fcntl.flock(f, fcntl.LOCK_EX)
+                self._file = f
+                sync()
+            except BaseException:
+                self.release()
+                raise
+        return True
+
+    def release(self):
+        f, self._file = self._file, None
+        if f is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+        self._thread.release()
+
+    def locked(self):
+        return self._thread.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def register_sync(server):
+    """Sync with other workers' writes before each request to the Flask server"""
+    if not ENABLED:
+        return
+    @server.before_request
+    def sync_store():
+        sync()
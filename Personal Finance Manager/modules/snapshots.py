@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from modules import fx, memory, process_data
+from modules.lazy import lazy_import
+from modules.metrics import inc, timed
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Versioned snapshots of the transaction store, for "as of" queries.
+#
+# Every write (insert, correction, import) commits a version. The data
+# lives in immutable columnar segments, numbered .npz files in a directory
+# beside the store, and a manifest lists each version: when it was committed
+# and the run of segments that make it up. A base segment holds every row at
+# one point; a delta segment holds the rows one write added or changed, keyed
+# by store id, plus tombstones for ids it deleted. A version is a base and the
+# deltas after it, so committing adds one small file and one manifest line,
+# and past versions share their segments instead of copying them.
+#
+# Reading a version reads only its own segments: the latest row per id wins
+# and tombstoned ids drop out. Once a chain reaches MAX_DELTAS deltas, or its
+# deltas hold more rows than its base, the next commit folds them into a fresh
+# base, so no version ever needs more than MAX_DELTAS + 1 segments.
+#
+# Retention (gc): every version of the last KEEP_DAYS days is kept; older ones
+# keep only the last version of each month, for KEEP_MONTHS months. Segments no
+# kept version refers to are deleted. gc runs whenever a new base is written.
+
+ENABLED = os.environ.get('FINANCE_SNAPSHOTS', '1') != '0'
+KEEP_DAYS = int(os.environ.get('FINANCE_SNAPSHOT_DAYS', 30))
+KEEP_MONTHS = int(os.environ.get('FINANCE_SNAPSHOT_MONTHS', 24))
+MAX_DELTAS = 64
+VERSION_CACHE = 2
+# Columns stored dictionary-encoded: codes per row plus the distinct values
+STRING_COLUMNS = ('category', 'description', 'type', 'account', 'transfer_id', 'currency')
+
+_manifest = None            # (path, mtime, size, entries) of the last manifest read
+_versions = OrderedDict()   # (directory, version) -> materialized rows, most recent last
+_lock = threading.Lock()
+
+
+def directory():
+    """Where the current store's segments and manifest live"""
+    return process_data._dedup_prefix() + '.versions'
+
+
+def _manifest_path():
+    return os.path.join(directory(), 'manifest.jsonl')
+
+
+def _segment_path(number):
+    return os.path.join(directory(), f'{number:08d}.npz')
+
+
+def versions():
+    """Every retained version, oldest first: {'version', 'at', 'base', 'last', 'base_rows', 'delta_rows', 'note'}"""
+    global _manifest
+    path = _manifest_path()
+    if not os.path.exists(path):
+        return []
+    stat = os.stat(path)
+    with _lock:
+        if _manifest is None or _manifest[:3] != (path, stat.st_mtime, stat.st_size):
+            with open(path) as f:
+                _manifest = (path, stat.st_mtime, stat.st_size, [json.loads(line) for line in f if line.strip()])
+        return _manifest[3]
+
+
+def _to_epoch(when):
+    """Epoch seconds of a time; a bare date means the end of that day"""
+    stamp = pd.Timestamp(when)
+    if isinstance(when, str) and len(when.strip()) <= 10:
+        stamp += pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    return stamp.timestamp()
+
+
+def version_at(when):
+    """The last version committed at or before when (a date means its end); None if there is none"""
+    entries = versions()
+    cutoff = _to_epoch(when)
+    at = np.searchsorted(np.array([e['at'] for e in entries]), cutoff, side='right') - 1
+    return entries[at] if entries and at >= 0 else None
+
+
+def _entry(version):
+    entries = versions()
+    numbers = [e['version'] for e in entries]
+    at = np.searchsorted(numbers, int(version))
+    if at == len(entries) or numbers[at] != int(version):
+        raise ValueError(f"No version {version}; it may have been garbage-collected")
+    return entries[at]
+
+
+def _write_segment(number, rows, deleted=()):
+    """Store rows (with their id column) and tombstones for deleted ids as one segment"""
+    deleted = np.asarray(deleted, dtype='int64')
+    arrays = {
+        'id': np.concatenate([rows['id'].to_numpy(dtype='int64'), deleted]),
+        'day': np.concatenate([process_data.to_epoch_days(rows['date']).astype('int32'),
+                               np.zeros(len(deleted), dtype='int32')]),
+        'amount': np.concatenate([pd.to_numeric(rows['amount']).to_numpy(dtype=float), np.full(len(deleted), np.nan)]),
+        'deleted': np.concatenate([np.zeros(len(rows), dtype=bool), np.ones(len(deleted), dtype=bool)])
+    }
+    for column in STRING_COLUMNS:
+        values = rows[column] if column in rows else pd.Series([None] * len(rows), dtype=object)
+        codes, uniques = pd.factorize(values.astype(object).where(values.notna(), None))
+        arrays[column + '_codes'] = np.concatenate([codes.astype('int32'), np.full(len(deleted), -1, dtype='int32')])
+        arrays[column + '_values'] = np.array([str(v) for v in uniques], dtype=str)
+    os.makedirs(directory(), exist_ok=True)
+    path = _segment_path(number)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def _read_segment(number):
+    with np.load(_segment_path(number)) as data:
+        frame = pd.DataFrame({'id': data['id'], 'day': data['day'], 'amount': data['amount'], 'deleted': data['deleted']})
+        for column in STRING_COLUMNS:
+            values = data[column + '_values'].astype(object)
+            frame[column] = pd.Categorical.from_codes(data[column + '_codes'], categories=values).astype(object)
+    return frame
+
+
+def _resolve(frames):
+    """Rows of a version from its segments, oldest first: the latest row per id, tombstones removed"""
+    frame = pd.concat(frames, ignore_index=True).drop_duplicates('id', keep='last')
+    return frame[~frame['deleted'].to_numpy()].sort_values('id', kind='stable').reset_index(drop=True)
+
+
+def _as_rows(frame):
+    """Segment rows in the shape load_transactions returns"""
+    dates = (np.datetime64('1970-01-01') + frame['day'].to_numpy().astype('int64').astype('timedelta64[D]')).astype(str)
+    rows = frame.drop(columns=['day', 'deleted']).assign(date=dates)
+    return rows[['id'] + process_data.TRANSACTION_COLUMNS]
+
+
+def _segment_rows(rows):
+    """Rows as written to a segment, read back as a frame like _read_segment returns"""
+    frame = pd.DataFrame({'id': rows['id'].to_numpy(dtype='int64'),
+                          'day': process_data.to_epoch_days(rows['date']).astype('int32'),
+                          'amount': pd.to_numeric(rows['amount']).to_numpy(dtype=float),
+                          'deleted': False})
+    for column in STRING_COLUMNS:
+        frame[column] = rows[column].to_numpy(dtype=object) if column in rows else None
+    return frame
+
+
+def _append(entry):
+    os.makedirs(directory(), exist_ok=True)
+    with open(_manifest_path(), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+    inc('finance_snapshot_versions_total')
+    return entry
+
+
+def _new_entry(base, last, base_rows, delta_rows, note):
+    entries = versions()
+    return {'version': entries[-1]['version'] + 1 if entries else 1, 'at': time.time(), 'base': base, 'last': last,
+            'base_rows': int(base_rows), 'delta_rows': int(delta_rows), 'note': note}
+
+
+def rebase(note='rebase', rows=None):
+    """Commit the store as it is now (or rows, with their ids) as a version with a fresh base
+
+    The caller holds process_data._write_lock. Used when versioning starts and
+    after writes that renumber or rewrite many rows, such as an import.
+    """
+    if not ENABLED:
+        return None
+    if rows is None:
+        rows = process_data.load_transactions()
+    entries = versions()
+    number = entries[-1]['last'] + 1 if entries else 1
+    _write_segment(number, rows)
+    entry = _append(_new_entry(number, number, len(rows), 0, note))
+    gc()
+    return entry
+
+
+def commit(rows, deleted=(), note=''):
+    """Commit a write as a new version: rows (with ids) added or changed, ids deleted
+
+    The caller holds process_data._write_lock, and the store already holds the
+    write.
+    """
+    if not ENABLED:
+        return None
+    entries = versions()
+    if not entries:
+        # The store as it is now already includes this write
+        return rebase(note)
+    head = entries[-1]
+    delta_rows = head['delta_rows'] + len(rows) + len(deleted)
+    if head['last'] - head['base'] >= MAX_DELTAS or delta_rows > head['base_rows']:
+        # Fold the chain into a new base; earlier versions keep reading their own segments
+        frames = [_read_segment(n) for n in range(head['base'], head['last'] + 1)]
+        frames.append(_segment_rows(rows))
+        frames.append(pd.DataFrame({'id': np.asarray(deleted, dtype='int64'), 'deleted': True}))
+        return rebase(note, _as_rows(_resolve(frames)))
+    number = head['last'] + 1
+    _write_segment(number, rows, deleted)
+    return _append(_new_entry(head['base'], number, head['base_rows'], delta_rows, note))
+
+
+@timed('finance_data_seconds', count_rows=True)
+def load_version(version):
+    """Rows of a past version, shaped like process_data.load_transactions(); ValueError if it is not retained"""
+    entry = _entry(version)
+    key = (directory(), entry['version'])
+    with _lock:
+        rows = _versions.get(key)
+        if rows is not None:
+            _versions.move_to_end(key)
+            memory.touch('snapshot', key)
+            return rows
+    start = time.perf_counter()
+    rows = _as_rows(_resolve([_read_segment(n) for n in range(entry['base'], entry['last'] + 1)]))
+    with _lock:
+        _versions[key] = rows
+        evicted = []
+        while len(_versions) > VERSION_CACHE:
+            evicted.append(_versions.popitem(last=False)[0])
+    for old in evicted:
+        memory.forget('snapshot', old)
+    memory.track('snapshot', key, rows, cost=time.perf_counter() - start, drop=_drop_version)
+    return rows
+
+
+def _drop_version(key):
+    with _lock:
+        _versions.pop(key, None)
+
+
+def load_as_of(when):
+    """Rows as they stood at when (a date means its end); ValueError if no version is that old"""
+    entry = version_at(when)
+    if entry is None:
+        raise ValueError(f"No version as of {when}")
+    return load_version(entry['version'])
+
+
+def _retained(entries, now):
+    """Versions kept by the retention policy; the latest always is"""
+    recent = now - KEEP_DAYS * 86400
+    oldest_month = pd.Timestamp(now, unit='s').to_period('M') - KEEP_MONTHS
+    month_ends = {}
+    for entry in entries:
+        if entry['at'] < recent:
+            month = pd.Timestamp(entry['at'], unit='s').to_period('M')
+            if month > oldest_month:
+                month_ends[month] = entry['version']
+    kept = set(month_ends.values())
+    return [e for e in entries if e['at'] >= recent or e['version'] in kept or e is entries[-1]]
+
+
+def gc(now=None):
+    """Drop versions outside the retention policy and the segments only they used; returns (versions, segments) removed"""
+    global _manifest
+    entries = versions()
+    if not entries:
+        return 0, 0
+    kept = _retained(entries, time.time() if now is None else now)
+    used = set()
+    for entry in kept:
+        used.update(range(entry['base'], entry['last'] + 1))
+    stale = [n for n in range(entries[0]['base'], entries[-1]['last'] + 1)
+             if n not in used and os.path.exists(_segment_path(n))]
+    if len(kept) < len(entries):
+        path = _manifest_path()
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.writelines(json.dumps(entry) + '\n' for entry in kept)
+        os.replace(tmp, path)
+        with _lock:
+            _manifest = None
+    # Segments go after the manifest stops naming them, so a crash leaves no version without its data
+    for number in stale:
+        os.remove(_segment_path(number))
+    return len(entries) - len(kept), len(stale)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='List, query and garbage-collect versions of the transaction store')
+    parser.add_argument('--as-of', help='summarize the store as it stood then, e.g. 2025-09-30')
+    parser.add_argument('--gc', action='store_true', help='drop versions outside the retention policy')
+    args = parser.parse_args(argv)
+
+    if args.gc:
+        dropped, removed = gc()
+        print(f"Dropped {dropped:,} versions and {removed:,} segments")
+    elif args.as_of:
+        entry = version_at(args.as_of)
+        if entry is None:
+            parser.error(f'no version as of {args.as_of}')
+        rows = load_version(entry['version'])
+        flows = process_data.cash_flow(fx.convert_frame(rows))
+        when = pd.Timestamp(entry['at'], unit='s').strftime('%Y-%m-%d %H:%M')
+        print(f"Version {entry['version']} ({when}, {entry['note']}): {len(rows):,} transactions, "
+              f"income {flows['income']:,.2f}, expenses {flows['expenses']:,.2f}, net {flows['net']:,.2f}")
+    else:
+        for entry in versions():
+            when = pd.Timestamp(entry['at'], unit='s').strftime('%Y-%m-%d %H:%M')
+            print(f"{entry['version']:>6}  {when}  segments {entry['base']}-{entry['last']}  {entry['note']}")
+
+
+if __name__ == '__main__':
+    main()
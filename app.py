@@ -1,6 +1,7 @@
-import pandas as pd
-from dash import Dash, dcc, html, Input, Output, State
+import os
+from dash import Dash, dcc, html, Input, Output, State, ClientsideFunction
 import dash
+from dash.exceptions import PreventUpdate
 
 from modules.charts import (
     create_area_chart,
@@ -9,12 +10,16 @@ from modules.charts import (
     create_pie_chart,
     create_funnel_chart
 )
-from modules.process_data import load_transactions, filter_by_category, insert_transaction
+from modules.process_data import load_transactions, filter_by_category, insert_transaction, get_categories, build_snapshot, snapshot_row
+from modules.metrics import METRICS_ENABLED, timed_callback, callback_latencies, register_endpoint
 
-app = Dash(__name__)
+# Clientside filtering: ship the data to the browser once and filter there
+# (assets/clientside.js). Meant for single-user deployments whose data fits in memory.
+CLIENTSIDE_FILTERING = os.environ.get('FINANCE_CLIENTSIDE') == '1'
+METRICS_OVERLAY = METRICS_ENABLED and os.environ.get('FINANCE_METRICS_OVERLAY') == '1'
 
-# Initial data
-df = load_transactions()
+app = Dash(__name__)
+register_endpoint(app.server)
 
 # ----- Shared styles -----
 APP_STYLE = {
@@ -29,7 +34,7 @@ CARD = {
     'boxShadow': '0 4px 12px rgba(0,0,0,0.08)'
 }
 
-def to_plot_columns(dframe: pd.DataFrame) -> pd.DataFrame:
+def to_plot_columns(dframe):
     """Rename to the TitleCase columns expected by chart functions."""
     return dframe.rename(columns={'date': 'Date', 'amount': 'Amount', 'category': 'Category'})
 
@@ -47,8 +52,7 @@ app.layout = html.Div([
                 html.Label("Categories (Chart 1)", style={'fontWeight': 600}),
                 dcc.Dropdown(
                     id='category-left',
-                    options=[{'label': c, 'value': c} for c in df['category'].unique()],
-                    value=list(df['category'].unique()),
+                    options=[],
                     multi=True,
                     style={'marginBottom': '12px'}
                 ),
@@ -76,8 +80,7 @@ app.layout = html.Div([
                 html.Label("Categories (Chart 2)", style={'fontWeight': 600}),
                 dcc.Dropdown(
                     id='category-right',
-                    options=[{'label': c, 'value': c} for c in df['category'].unique()],
-                    value=list(df['category'].unique()),
+                    options=[],
                     multi=True,
                     style={'marginBottom': '12px'}
                 ),
@@ -110,40 +113,88 @@ app.layout = html.Div([
             html.Button('Add Transaction', id='add-btn', n_clicks=0, style={'width': '100%', 'marginBottom': '8px'}),
             html.Div(id='form-output', style={'color': 'green'})
         ], style={**CARD, 'maxWidth': 480, 'width': '100%'})
-    ], style={'display': 'flex', 'justifyContent': 'center', 'marginTop': '24px'})
+    ], style={'display': 'flex', 'justifyContent': 'center', 'marginTop': '24px'}),
+
+    # Columnar snapshot and rows inserted since it was sent (clientside filtering mode)
+    dcc.Store(id='txn-snapshot'),
+    dcc.Store(id='txn-appended', data=[])
 ], style=APP_STYLE)
 
 
 # ----- Callbacks -----
 
-# Add transaction: update both category dropdowns (options + selected values) after insert
+def filter_callback(*args, **kwargs):
+    """Register a filter-driven callback on the server unless the browser handles it"""
+    if CLIENTSIDE_FILTERING:
+        return lambda func: func
+    return app.callback(*args, **kwargs)
+
+# Add transaction: update both category dropdowns (options + selected values) after insert.
+# Also runs on first render to fill the dropdowns.
 @app.callback(
     Output('form-output', 'children'),
     Output('category-left', 'options'),
     Output('category-left', 'value'),
     Output('category-right', 'options'),
     Output('category-right', 'value'),
+    Output('txn-appended', 'data'),
     Input('add-btn', 'n_clicks'),
     State('input-date', 'value'),
     State('input-category', 'value'),
     State('input-amount', 'value'),
-    State('input-desc', 'value')
+    State('input-desc', 'value'),
+    State('txn-appended', 'data')
 )
-def add_transaction_callback(n_clicks, date, category, amount, desc):
+@timed_callback
+def add_transaction_callback(n_clicks, date, category, amount, desc, appended):
+    if not n_clicks:
+        # First render: fill the dropdowns from a cheap distinct-categories query
+        cats = get_categories()
+        opts = [{'label': c, 'value': c} for c in cats]
+        return "", opts, cats, opts, cats, dash.no_update
     if n_clicks and n_clicks > 0 and date and category and amount is not None:
         try:
             insert_transaction(date, category, amount, desc)
-            df_new = load_transactions()
-            cats = list(df_new['category'].unique())
+            cats = get_categories()
             opts = [{'label': c, 'value': c} for c in cats]
-            return "Transaction added successfully!", opts, cats, opts, cats
+            # Clientside mode only needs the new row, not a fresh snapshot
+            new_rows = (appended or []) + [snapshot_row(date, category, amount)] if CLIENTSIDE_FILTERING else dash.no_update
+            return "Transaction added successfully!", opts, cats, opts, cats, new_rows
         except Exception as e:
-            return f"Error: {e}", dash.no_update, dash.no_update, dash.no_update, dash.no_update
-    return "", dash.no_update, dash.no_update, dash.no_update, dash.no_update
+            return f"Error: {e}", dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+    return "", dash.no_update, dash.no_update, dash.no_update, dash.no_update, dash.no_update
+
+
+# Clientside filtering: send the snapshot once, then let the browser do the rest
+if CLIENTSIDE_FILTERING:
+    @app.callback(
+        Output('txn-snapshot', 'data'),
+        Input('txn-snapshot', 'id')
+    )
+    @timed_callback
+    def load_snapshot(_):
+        return build_snapshot(load_transactions())
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='finance', function_name='update_left_chart'),
+        Output('chart-left', 'figure'),
+        Input('category-left', 'value'),
+        Input('chart-type-left', 'value'),
+        Input('txn-snapshot', 'data'),
+        Input('txn-appended', 'data')
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='finance', function_name='update_right_chart'),
+        Output('chart-right', 'figure'),
+        Input('category-right', 'value'),
+        Input('chart-type-right', 'value'),
+        Input('txn-snapshot', 'data'),
+        Input('txn-appended', 'data')
+    )
 
 
 # Update both charts independently
-@app.callback(
+@filter_callback(
     Output('chart-left', 'figure'),
     Output('chart-right', 'figure'),
     Input('category-left', 'value'),
@@ -151,7 +202,12 @@ def add_transaction_callback(n_clicks, date, category, amount, desc):
     Input('category-right', 'value'),
     Input('chart-type-right', 'value')
 )
+@timed_callback
 def update_charts(cat_left, type_left, cat_right, type_right):
+    # Wait until the first-render callback has filled the category dropdowns
+    if cat_left is None or cat_right is None:
+        raise PreventUpdate
+
     # Always load fresh data (so new inserts show up immediately)
     data = load_transactions()
 
@@ -176,5 +232,24 @@ def update_charts(cat_left, type_left, cat_right, type_right):
     return fig_left, fig_right
 
 
+# Debug overlay: per-panel callback latency (FINANCE_METRICS=1 FINANCE_METRICS_OVERLAY=1)
+if METRICS_OVERLAY:
+    app.layout.children.append(html.Div([
+        html.Pre(id='latency-overlay', style={'margin': 0, 'fontSize': '11px'}),
+        dcc.Interval(id='latency-interval', interval=2000)
+    ], style={'position': 'fixed', 'bottom': '12px', 'right': '12px', 'zIndex': 1000, 'padding': '8px 12px',
+              'backgroundColor': 'rgba(15, 23, 42, 0.85)', 'color': '#e2e8f0', 'borderRadius': '8px'}))
+
+    @app.callback(
+        Output('latency-overlay', 'children'),
+        Input('latency-interval', 'n_intervals')
+    )
+    def update_latency_overlay(_):
+        lines = []
+        for name, (last, p50, p95, count) in sorted(callback_latencies().items()):
+            lines.append(f"{name:<28} last {last * 1000:7.1f} ms  p50 ≤{p50 * 1000:.0f} ms  p95 ≤{p95 * 1000:.0f} ms  n={count}")
+        return '\n'.join(lines) or 'No callbacks timed yet'
+
+
 if __name__ == '__main__':
     app.run(debug=True)
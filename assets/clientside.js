@@ -0,0 +1,173 @@
+// Clientside filtering mode (FINANCE_CLIENTSIDE=1).
+// The server ships one columnar snapshot into the 'txn-snapshot' store;
+// everything below filters and aggregates it in the browser.
+
+(function () {
+    const COLOR_SEQ = ['#1f77b4', '#1ca3ec', '#3fa7d6', '#4aa3f0', '#6bb9ff', '#89c5ff'];
+    const FONT = {family: 'Inter, sans-serif', size: 14, color: '#0a1f44'};
+    const AXIS = {showgrid: true, gridcolor: 'lightblue'};
+    const MS_PER_DAY = 86400000;
+
+    // ----- Snapshot decoding -----
+
+    function decode(b64, ArrayType) {
+        const bin = atob(b64);
+        const bytes = new Uint8Array(bin.length);
+        for (let i = 0; i < bin.length; i++) {
+            bytes[i] = bin.charCodeAt(i);
+        }
+        return new ArrayType(bytes.buffer);
+    }
+
+    // Decoded arrays are cached against the store objects, so typed arrays
+    // are built once per snapshot/insert rather than once per interaction.
+    let cache = {snapshot: null, appended: null, data: null};
+
+    function getData(snapshot, appended) {
+        if (cache.snapshot === snapshot && cache.appended === appended) {
+            return cache.data;
+        }
+        const extra = appended || [];
+        const categories = snapshot.categories.slice();
+        const codeOf = {};
+        categories.forEach((c, i) => { codeOf[c] = i; });
+        const n = snapshot.count + extra.length;
+        const days = new Int32Array(n);
+        const codes = new Uint16Array(n);
+        const amounts = new Float64Array(n);
+        days.set(decode(snapshot.days, Int32Array));
+        codes.set(decode(snapshot.codes, Uint16Array));
+        amounts.set(decode(snapshot.amounts, Float64Array));
+        extra.forEach((row, j) => {
+            if (!(row.category in codeOf)) {
+                codeOf[row.category] = categories.length;
+                categories.push(row.category);
+            }
+            const i = snapshot.count + j;
+            days[i] = row.day;
+            codes[i] = codeOf[row.category];
+            amounts[i] = row.amount;
+        });
+        const data = {n, days, codes, amounts, categories, codeOf};
+        cache = {snapshot, appended, data};
+        return data;
+    }
+
+    function dayToISO(day) {
+        return new Date(day * MS_PER_DAY).toISOString().slice(0, 10);
+    }
+
+    // Row indices matching the category selection
+    function filterRows(data, selected) {
+        let allowed = null;
+        if (selected && selected.length) {
+            allowed = new Uint8Array(data.categories.length);
+            selected.forEach((c) => {
+                if (c in data.codeOf) {
+                    allowed[data.codeOf[c]] = 1;
+                }
+            });
+        }
+        const out = new Int32Array(data.n);
+        let k = 0;
+        for (let i = 0; i < data.n; i++) {
+            if (!allowed || allowed[data.codes[i]]) {
+                out[k++] = i;
+            }
+        }
+        return out.subarray(0, k);
+    }
+
+    function layout(title) {
+        return {
+            title: {text: title},
+            font: FONT,
+            plot_bgcolor: '#f8f9fa',
+            paper_bgcolor: '#f8f9fa',
+            xaxis: AXIS,
+            yaxis: AXIS,
+            legend: {title: {text: ''}, orientation: 'h', y: -0.2},
+            margin: {l: 20, r: 20, t: 50, b: 20}
+        };
+    }
+
+    // One trace per category, points in date order
+    function xyTraces(data, rows, trace) {
+        const series = {};
+        rows.forEach((i) => {
+            const code = data.codes[i];
+            (series[code] = series[code] || []).push([data.days[i], data.amounts[i]]);
+        });
+        return Object.keys(series).map((code, i) => {
+            const points = series[code].sort((a, b) => a[0] - b[0]);
+            return Object.assign({
+                name: data.categories[code],
+                x: points.map((p) => dayToISO(p[0])),
+                y: points.map((p) => p[1]),
+                marker: {color: COLOR_SEQ[i % COLOR_SEQ.length]},
+                line: {color: COLOR_SEQ[i % COLOR_SEQ.length]}
+            }, trace);
+        });
+    }
+
+    function categoryTotals(data, rows) {
+        const totals = new Float64Array(data.categories.length);
+        rows.forEach((i) => { totals[data.codes[i]] += data.amounts[i]; });
+        const labels = [];
+        const values = [];
+        totals.forEach((total, code) => {
+            if (total) {
+                labels.push(data.categories[code]);
+                values.push(total);
+            }
+        });
+        return {labels, values};
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        finance: {
+            update_left_chart: function (selected, chartType, snapshot, appended) {
+                if (!snapshot) {
+                    return window.dash_clientside.no_update;
+                }
+                const data = getData(snapshot, appended);
+                const rows = filterRows(data, selected);
+                if (chartType === 'area') {
+                    return {data: xyTraces(data, rows, {type: 'scatter', mode: 'lines', stackgroup: '1'}),
+                        layout: layout('Expenses Over Time')};
+                }
+                if (chartType === 'bar') {
+                    const fig = layout('Expenses Over Time');
+                    fig.barmode = 'relative';
+                    fig.xaxis = Object.assign({title: {text: 'Date'}}, AXIS);
+                    fig.yaxis = Object.assign({title: {text: 'Amount ($)'}}, AXIS);
+                    return {data: xyTraces(data, rows, {type: 'bar'}), layout: fig};
+                }
+                return {data: xyTraces(data, rows, {type: 'scatter', mode: 'lines'}),
+                    layout: layout('Expenses Over Time')};
+            },
+
+            update_right_chart: function (selected, chartType, snapshot, appended) {
+                if (!snapshot) {
+                    return window.dash_clientside.no_update;
+                }
+                const data = getData(snapshot, appended);
+                const {labels, values} = categoryTotals(data, filterRows(data, selected));
+                if (chartType === 'pie') {
+                    const fig = layout('Expense Distribution');
+                    delete fig.xaxis;
+                    delete fig.yaxis;
+                    delete fig.legend;
+                    return {
+                        data: [{type: 'pie', labels, values, textposition: 'inside', textinfo: 'percent+label',
+                            marker: {colors: COLOR_SEQ, line: {color: '#f8f9fa', width: 2}}}],
+                        layout: fig
+                    };
+                }
+                const fig = layout('Expense Funnel');
+                delete fig.legend;
+                return {data: [{type: 'funnel', x: values, y: labels, marker: {color: COLOR_SEQ[0]}}], layout: fig};
+            }
+        }
+    });
+})();
@@ -7,3 +7,6 @@ CREATE TABLE transactions (
     amount NUMERIC NOT NULL,
     description TEXT
 );
+
+-- Serves the category dictionary (GROUP BY category with MIN/MAX(date)) from the index alone
+CREATE INDEX idx_transactions_category_date ON transactions (category, date);
@@ -23,11 +23,15 @@
 #     fig = px.funnel(df, x = 'Category', y = 'Amount', title='Expense Distribution')
 #     return fig
 
-import plotly.express as px
+from modules.lazy import lazy_import
+from modules.metrics import timed
+
+px = lazy_import('plotly.express')
 
 # Modern blue palette
 COLOR_SEQ = ['#1f77b4', '#1ca3ec', '#3fa7d6', '#4aa3f0', '#6bb9ff', '#89c5ff']
 
+@timed('finance_chart_seconds', label='chart')
 def create_area_chart(df):
     fig = px.area(
         df, 
@@ -49,6 +53,7 @@ def create_area_chart(df):
     )
     return fig
 
+@timed('finance_chart_seconds', label='chart')
 def create_bar_chart(df):
     fig = px.bar(
         df,
@@ -76,6 +81,7 @@ def create_bar_chart(df):
 
 
 
+@timed('finance_chart_seconds', label='chart')
 def create_line_chart(df):
     fig = px.line(
         df,
@@ -97,6 +103,7 @@ def create_line_chart(df):
     )
     return fig
 
+@timed('finance_chart_seconds', label='chart')
 def create_pie_chart(df):
     fig = px.pie(
         df,
@@ -115,6 +122,7 @@ def create_pie_chart(df):
     )
     return fig
 
+@timed('finance_chart_seconds', label='chart')
 def create_funnel_chart(df):
     fig = px.funnel(
         df,
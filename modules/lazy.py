@@ -0,0 +1,35 @@
+import importlib
+import threading
+import types
+
+# Deferred imports for heavy dependencies (pandas, plotly, SQLAlchemy), so that
+# importing the app stays fast and the cost is paid on first use instead.
+
+_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in that imports the real module on first attribute access"""
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            with _lock:
+                module = self.__dict__['_module']
+                if module is None:
+                    module = self.__dict__['_module'] = importlib.import_module(self.__name__)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    """Return a module proxy for name; the import happens on first use"""
+    return LazyModule(name)